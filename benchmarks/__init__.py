@@ -0,0 +1,36 @@
+"""
+Benchmarks for the capture-to-color pipeline.
+
+Run them from the repository root, e.g. ``python -m benchmarks.bench_mongo_pool``,
+after installing their dependencies with ``pip install -r benchmarks/requirements.txt``.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_service(name):
+    """This function makes a service directory ("web-app", ...) importable."""
+    path = os.path.join(ROOT, name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return path
+
+
+def summarize(samples):
+    """This function summarizes latency samples (seconds) in milliseconds."""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
@@ -0,0 +1,184 @@
+"""
+Throughput of the blocking ML client consumer against the asyncio consumer.
+
+Both run their real message handlers (ml_client.callback and
+AsyncConsumer.handle_message) on in-memory stand-ins for MongoDB and RabbitMQ
+that wait --io-ms per round trip, so no servers are needed. The blocking
+consumer waits for every fetch and write in turn; the asyncio consumer keeps
+--prefetch messages in flight and runs the analysis in an executor.
+
+    python -m benchmarks.bench_async_client --messages 200 --io-ms 2
+"""
+
+# pylint: disable=no-member
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+from unittest.mock import patch
+import cv2
+from bson import ObjectId
+from benchmarks import use_service
+from benchmarks.bench_palette import RESOLUTIONS, synthetic_image
+
+use_service("machine-learning-client")
+import async_client  # pylint: disable=wrong-import-position
+import color_names  # pylint: disable=wrong-import-position
+import ml_client  # pylint: disable=wrong-import-position
+
+
+class Result:  # pylint: disable=too-few-public-methods
+    """This class mimics a pymongo InsertOneResult."""
+
+    def __init__(self):
+        self.inserted_id = ObjectId()
+
+
+class BlockingCollection:
+    """This class is a MongoDB collection that waits io_seconds per call."""
+
+    def __init__(self, document, io_seconds):
+        self.document = document
+        self.io_seconds = io_seconds
+
+    def find_one(self, query):  # pylint: disable=unused-argument
+        """This function returns the stored document after one round trip."""
+        time.sleep(self.io_seconds)
+        return self.document
+
+    def insert_one(self, document):  # pylint: disable=unused-argument
+        """This function acknowledges a write after one round trip."""
+        time.sleep(self.io_seconds)
+        return Result()
+
+
+class AsyncCollection:
+    """This class is the awaitable variant of BlockingCollection."""
+
+    def __init__(self, document, io_seconds):
+        self.document = document
+        self.io_seconds = io_seconds
+
+    async def find_one(self, query):  # pylint: disable=unused-argument
+        """This function returns the stored document after one round trip."""
+        await asyncio.sleep(self.io_seconds)
+        return self.document
+
+    async def insert_one(self, document):  # pylint: disable=unused-argument
+        """This function acknowledges a write after one round trip."""
+        await asyncio.sleep(self.io_seconds)
+        return Result()
+
+
+class Channel:
+    """This class stands in for a pika channel and an aio-pika channel alike."""
+
+    def __init__(self, io_seconds):
+        self.io_seconds = io_seconds
+        self.default_exchange = self
+
+    def basic_publish(self, **kwargs):
+        """This function is a publish that does not wait for the broker."""
+
+    def basic_ack(self, **kwargs):
+        """This function is an ack that does not wait for the broker."""
+
+    def basic_nack(self, **kwargs):
+        """This function is a nack that does not wait for the broker."""
+
+    async def publish(self, message, routing_key):
+        """This function is an aio-pika publish that does not wait for the broker."""
+
+
+class Method:  # pylint: disable=too-few-public-methods
+    """This class mimics a delivery: pika method frame and aio-pika message in one."""
+
+    def __init__(self, body):
+        self.body = body
+        self.delivery_tag = 1
+        self.redelivered = False
+        self.reply_to = "reply"
+        self.correlation_id = body.decode()
+
+    async def ack(self):
+        """This function is an ack that does not wait for the broker."""
+
+    async def nack(self, requeue):
+        """This function is a nack that does not wait for the broker."""
+
+
+def run_blocking(image_document, messages, io_seconds):
+    """This function runs ml_client.callback once per message; returns messages/s."""
+    collection = BlockingCollection(image_document, io_seconds)
+    channel = Channel(io_seconds)
+    database = {"Image": collection, "Color": collection}
+    with patch(
+        "ml_client.mongo_pool.get_db", return_value=database
+    ), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(messages):
+            method = Method(str(ObjectId()).encode())
+            ml_client.callback(channel, method, method, method.body)
+    return messages / (time.perf_counter() - start)
+
+
+async def run_async(image_document, messages, io_seconds, prefetch, executor):
+    """This function runs AsyncConsumer.handle_message with prefetch messages in flight."""
+    collection = AsyncCollection(image_document, io_seconds)
+    database = {"Image": collection, "Color": collection}
+    with patch("async_client.AsyncIOMotorGridFSBucket"):
+        consumer = async_client.AsyncConsumer(Channel(io_seconds), database, executor)
+    in_flight = asyncio.Semaphore(prefetch)
+
+    async def deliver():
+        async with in_flight:
+            await consumer.handle_message(Method(str(ObjectId()).encode()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(deliver() for _ in range(messages)))
+    return messages / (time.perf_counter() - start)
+
+
+def main():
+    """This function runs both consumers on the same JPEG and prints a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--io-ms", type=float, default=2.0)
+    parser.add_argument("--prefetch", type=int, default=16)
+    parser.add_argument("--resolution", default="720p", help="vga, 720p or 12mp")
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    height, width = RESOLUTIONS[args.resolution]
+    jpeg = cv2.imencode(".jpg", synthetic_image(height, width))[1].tobytes()
+    image_document = {"image_data": jpeg}
+    io_seconds = args.io_ms / 1000
+    color_names.get_index()  # built once, outside the timings
+
+    report = {
+        "messages": args.messages,
+        "io_ms": args.io_ms,
+        "resolution": args.resolution,
+        "blocking_messages_per_s": run_blocking(
+            image_document, args.messages, io_seconds
+        ),
+    }
+    for kind in ("thread", "process"):
+        with async_client.create_executor(kind) as executor:
+            report[f"async_{kind}_messages_per_s"] = asyncio.run(
+                run_async(
+                    image_document, args.messages, io_seconds, args.prefetch, executor
+                )
+            )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+JPEG decode time and memory at full resolution versus the reduced-scale decode.
+
+Both paths end with the same stride sampling and mean color, so the report also
+shows how far the reduced decode moves the result.
+
+    python -m benchmarks.bench_decode --repeat 5
+"""
+
+# pylint: disable=no-member
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from benchmarks import use_service, summarize
+from benchmarks.bench_palette import RESOLUTIONS, synthetic_image
+
+use_service("machine-learning-client")
+import decoding  # pylint: disable=wrong-import-position
+import palette  # pylint: disable=wrong-import-position
+import sampling  # pylint: disable=wrong-import-position
+
+
+def decode_full(data, pixel_budget):
+    """This function is the previous decode: every pixel, then sampling."""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    return image, sampling.sample_pixels(image, "stride", pixel_budget)
+
+
+def decode_reduced(data, pixel_budget):
+    """This function decodes at reduced scale, then samples."""
+    image = decoding.decode_image(data, pixel_budget)
+    return image, sampling.sample_pixels(image, "stride", pixel_budget)
+
+
+def run_case(decode, data, pixel_budget, repeat):
+    """This function times one decode path and records its output."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image, sample = decode(data, pixel_budget)
+        samples.append(time.perf_counter() - start)
+    report = summarize(samples)
+    report["decoded_shape"] = list(image.shape)
+    report["decoded_mb"] = image.nbytes / 2**20
+    report["mean_color"] = [
+        round(float(value), 2) for value in palette.mean_color(sample)
+    ]
+    return report
+
+
+def main():
+    """This function prints the decode report for every resolution."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=sampling.DEFAULT_PIXEL_BUDGET)
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    report = {"pixel_budget": args.budget}
+    for name, (height, width) in RESOLUTIONS.items():
+        data = cv2.imencode(
+            ".jpg",
+            synthetic_image(height, width),
+            [cv2.IMWRITE_JPEG_QUALITY, args.quality],
+        )[1].tobytes()
+        report[name] = {
+            "full": run_case(decode_full, data, args.budget, args.repeat),
+            "reduced": run_case(decode_reduced, data, args.budget, args.repeat),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+End-to-end load generator: POST /capture until the analysed result is recorded.
+
+The web app's Flask routes and the ML client's callback run in one process.
+MongoDB is replaced by mongomock, image bytes go to a temporary filesystem
+store, and an in-process broker hands jobs to ML worker threads whose replies
+reach main.callback as they would over the reply queue. Every request uploads a
+distinct synthetic JPEG, so the content-hash cache never answers.
+
+    python -m benchmarks.bench_e2e --requests 100 --concurrency 4 --output e2e.json
+"""
+
+# pylint: disable=no-member
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+import mongomock
+import pika
+from benchmarks import use_service, summarize
+from benchmarks.bench_micro import build_corpus
+from benchmarks.bench_palette import RESOLUTIONS
+
+# image_store and mongo_pool are shared by both services, so one import serves both
+use_service("machine-learning-client")
+import ml_client  # pylint: disable=wrong-import-position
+
+# Each service has a metrics module of its own; main must import the web app's
+sys.modules.pop("metrics", None)
+use_service("web-app")
+import main as web_app  # pylint: disable=wrong-import-position
+import mongo_pool  # pylint: disable=wrong-import-position
+import tracing  # pylint: disable=wrong-import-position
+
+RESULT_TIMEOUT = 60
+
+
+class InProcessBroker:
+    """This class stands in for RabbitMQ between main.py and ml_client.py."""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.rejected = 0
+        self._delivery_tags = iter(range(1, 1 << 62))
+        self._lock = threading.Lock()
+
+    def publish_job(self, document_id, reply_to, correlation_id, trace=None):
+        """This function replaces broker.publish_job with an in-memory queue."""
+        properties = pika.BasicProperties(
+            reply_to=reply_to,
+            correlation_id=correlation_id,
+            headers=tracing.to_headers(trace, {"published_at": time.time()}),
+        )
+        self.jobs.put((document_id, properties))
+
+    def basic_publish(
+        self, exchange, routing_key, body, properties=None
+    ):  # pylint: disable=unused-argument
+        """This function delivers an ML client reply straight to the web app callback."""
+        web_app.callback(None, None, properties, body.encode())
+
+    def basic_ack(self, delivery_tag):
+        """This function acknowledges nothing; there is no broker to tell."""
+
+    def basic_nack(self, delivery_tag, requeue=True):  # pylint: disable=unused-argument
+        """This function counts messages the ML client rejected."""
+        with self._lock:
+            self.rejected += 1
+
+    def work(self):
+        """This function runs ml_client.callback for queued jobs until it gets None."""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            document_id, properties = job
+            method = SimpleNamespace(
+                delivery_tag=next(self._delivery_tags), redelivered=False
+            )
+            ml_client.callback(self, method, properties, document_id.encode())
+
+
+def wait_for_result(job_id, timeout=RESULT_TIMEOUT):
+    """This function blocks until the result of a job is recorded; False on timeout."""
+    subscription = web_app.RESULT_HUB.subscribe(job_id)
+    try:
+        if web_app.JOB_RESULTS.get(job_id) is not None:
+            return True
+        subscription.get(timeout=timeout)
+        return True
+    except queue.Empty:
+        return False
+    finally:
+        web_app.RESULT_HUB.unsubscribe(job_id, subscription)
+
+
+def run_client(images, capture_samples, result_samples, failures):
+    """This function uploads images one at a time and records both latencies."""
+    client = web_app.app.test_client()
+    for image in images:
+        start = time.perf_counter()
+        response = client.post(
+            "/capture",
+            data={"image": (io.BytesIO(image), "capture.jpg")},
+            content_type="multipart/form-data",
+        )
+        captured = time.perf_counter()
+        if response.status_code != 202:
+            failures.append(response.status_code)
+            continue
+        if not wait_for_result(response.get_json()["job_id"]):
+            failures.append("timeout")
+            continue
+        capture_samples.append(captured - start)
+        result_samples.append(time.perf_counter() - start)
+
+
+def patch_services(stack, broker):
+    """This function swaps MongoDB, the image store and RabbitMQ for local stand-ins."""
+    db = mongomock.MongoClient()["CAE"]
+    store_path = stack.enter_context(
+        tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+    )
+    stack.enter_context(
+        patch.dict(
+            os.environ,
+            {"IMAGE_STORE": "filesystem", "IMAGE_STORE_PATH": store_path},
+        )
+    )
+    stack.enter_context(patch.object(mongo_pool, "get_db", return_value=db))
+    stack.enter_context(patch.object(web_app, "image_collection", db["Image"]))
+    stack.enter_context(patch.object(web_app, "color_collection", db["Color"]))
+    stack.enter_context(
+        patch.object(web_app.REPLY_CONSUMER, "wait_ready", return_value="in-process")
+    )
+    stack.enter_context(
+        patch.object(web_app.broker, "publish_job", side_effect=broker.publish_job)
+    )
+
+
+def run_load(corpus, concurrency, workers):
+    """This function drives the corpus through /capture and returns the report."""
+    broker = InProcessBroker()
+    capture_samples, result_samples, failures = [], [], []
+
+    with contextlib.ExitStack() as stack:
+        patch_services(stack, broker)
+        # Per-message lines are sampled debug logs; keep them off, even under
+        # LOG_LEVEL=DEBUG, so runs stay comparable
+        stack.callback(logging.root.setLevel, logging.root.level)
+        logging.root.setLevel(logging.INFO)
+
+        ml_threads = [threading.Thread(target=broker.work) for _ in range(workers)]
+        clients = [
+            threading.Thread(
+                target=run_client,
+                args=(
+                    corpus[index::concurrency],
+                    capture_samples,
+                    result_samples,
+                    failures,
+                ),
+            )
+            for index in range(concurrency)
+        ]
+        start = time.perf_counter()
+        for thread in ml_threads + clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        for _ in ml_threads:
+            broker.jobs.put(None)
+        for thread in ml_threads:
+            thread.join()
+
+    report = {
+        "requests": len(corpus),
+        "completed": len(result_samples),
+        "failures": len(failures),
+        "rejected": broker.rejected,
+        "images_per_s": len(result_samples) / elapsed,
+    }
+    if result_samples:
+        report["capture"] = summarize(capture_samples)
+        report["end_to_end"] = summarize(result_samples)
+    return report
+
+
+def main():
+    """This function runs the load generator and prints a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads")
+    parser.add_argument("--workers", type=int, default=1, help="ML worker threads")
+    parser.add_argument("--resolution", choices=RESOLUTIONS, default="720p")
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    height, width = RESOLUTIONS[args.resolution]
+    report = {
+        "resolution": args.resolution,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        **run_load(
+            build_corpus(height, width, args.requests), args.concurrency, args.workers
+        ),
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
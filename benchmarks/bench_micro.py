@@ -0,0 +1,105 @@
+"""
+Micro-benchmarks of the ML client's per-image building blocks.
+
+Covers cv2.imdecode (full and reduced decode), extract_color_palette (1 and
+--colors colors), rgb_to_hex and get_color_name over a corpus of synthetic
+JPEGs at every resolution in bench_palette.RESOLUTIONS.
+
+    python -m benchmarks.bench_micro --images 5 --output micro.json
+"""
+
+# pylint: disable=no-member
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from benchmarks import use_service, summarize
+from benchmarks.bench_palette import RESOLUTIONS, synthetic_image
+
+use_service("machine-learning-client")
+import color_names  # pylint: disable=wrong-import-position
+import decoding  # pylint: disable=wrong-import-position
+import ml_client  # pylint: disable=wrong-import-position
+
+
+def build_corpus(height, width, images, quality=90):
+    """This function encodes `images` distinct synthetic JPEGs of one resolution."""
+    return [
+        cv2.imencode(
+            ".jpg",
+            synthetic_image(height, width, seed=seed),
+            [cv2.IMWRITE_JPEG_QUALITY, quality],
+        )[1].tobytes()
+        for seed in range(images)
+    ]
+
+
+def time_each(function, inputs):
+    """This function times function once per input and summarizes the samples."""
+    samples = []
+    for value in inputs:
+        start = time.perf_counter()
+        function(value)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_resolution(corpus, colors):
+    """This function times decoding and palette extraction over one corpus."""
+    images = [
+        cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) for data in corpus
+    ]
+    return {
+        "jpeg_kb": sum(len(data) for data in corpus) / len(corpus) / 1024,
+        "imdecode": time_each(
+            lambda data: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR),
+            corpus,
+        ),
+        "decode_reduced": time_each(
+            lambda data: decoding.decode_image(data, ml_client.PIXEL_BUDGET), corpus
+        ),
+        "extract_color_palette": time_each(ml_client.extract_color_palette, images),
+        f"extract_color_palette_{colors}": time_each(
+            lambda image: ml_client.extract_color_palette(image, colors=colors),
+            images,
+        ),
+    }
+
+
+def main():
+    """This function runs every micro-benchmark and prints a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=5, help="images per resolution")
+    parser.add_argument("--colors", type=int, default=ml_client.PALETTE_COLORS)
+    parser.add_argument("--calls", type=int, default=10_000)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    color_names.get_index()  # built once, outside the timings
+    rng = np.random.default_rng(0)
+    colors = [
+        tuple(int(value) for value in rgb)
+        for rgb in rng.integers(0, 256, (args.calls, 3))
+    ]
+    report = {
+        "images": args.images,
+        "sampling_mode": ml_client.SAMPLING_MODE,
+        "pixel_budget": ml_client.PIXEL_BUDGET,
+        "rgb_to_hex": time_each(ml_client.rgb_to_hex, colors),
+        "get_color_name": time_each(ml_client.get_color_name, colors),
+    }
+    for name, (height, width) in RESOLUTIONS.items():
+        report[name] = bench_resolution(
+            build_corpus(height, width, args.images), args.colors
+        )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
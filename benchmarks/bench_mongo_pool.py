@@ -0,0 +1,116 @@
+"""
+Per-message MongoDB latency with a fresh MongoClient per message versus the shared pool.
+
+Each "message" does what the ML client does per image: one find_one on Image and
+one insert_one on Color. Needs a reachable MongoDB (MONGODB_URI, default localhost).
+Documents pass the validators of database/init-mongo.js and are deleted afterwards.
+
+    python -m benchmarks.bench_mongo_pool --messages 200
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+from pymongo import MongoClient
+from benchmarks import use_service, summarize
+
+use_service("machine-learning-client")
+import mongo_pool  # pylint: disable=wrong-import-position
+
+
+def image_document(image_bytes):
+    """This function builds a valid Image document carrying image_bytes inline."""
+    return {
+        "storage": "filesystem",
+        "image_ref": "benchmark",
+        "size": len(image_bytes),
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+        # Inline bytes make find_one transfer a realistic payload
+        "image_data": image_bytes,
+        "benchmark": True,
+    }
+
+
+def color_document(image_id):
+    """This function builds a valid Color document for an image."""
+    return {
+        "rgb": [0, 0, 0],
+        "hex": "#000000",
+        "name": "black",
+        "image_id": image_id,
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+        "benchmark": True,
+    }
+
+
+def process_with_fresh_client(mongo_uri, document_id):
+    """This function reproduces the old per-message connect, fetch and write."""
+    client = MongoClient(mongo_uri)
+    try:
+        db_client = client[mongo_pool.DB_NAME]
+        db_client["Image"].find_one({"_id": document_id})
+        db_client["Color"].insert_one(color_document(document_id))
+    finally:
+        client.close()
+
+
+def process_with_pool(document_id):
+    """This function does the same fetch and write on the shared pooled client."""
+    db_client = mongo_pool.get_db()
+    db_client["Image"].find_one({"_id": document_id})
+    db_client["Color"].insert_one(color_document(document_id))
+
+
+def time_calls(function, messages):
+    """This function times each call of a zero-argument function."""
+    samples = []
+    for _ in range(messages):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    """This function runs both modes against the configured MongoDB and prints a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--image-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017/")
+    db_client = mongo_pool.get_db()
+    document_id = (
+        db_client["Image"]
+        .insert_one(image_document(os.urandom(args.image_bytes)))
+        .inserted_id
+    )
+    try:
+        report = {
+            "messages": args.messages,
+            "fresh_client": summarize(
+                time_calls(
+                    lambda: process_with_fresh_client(mongo_uri, document_id),
+                    args.messages,
+                )
+            ),
+            "pooled_client": summarize(
+                time_calls(lambda: process_with_pool(document_id), args.messages)
+            ),
+        }
+    finally:
+        db_client["Image"].delete_many({"benchmark": True})
+        db_client["Color"].delete_many({"benchmark": True})
+        mongo_pool.close_mongo_client()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Per-image CPU time of the old K=1 cv2.kmeans against the closed-form palette engine.
+
+    python -m benchmarks.bench_palette --repeat 5
+"""
+
+# pylint: disable=no-member
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from benchmarks import use_service, summarize
+
+use_service("machine-learning-client")
+import palette  # pylint: disable=wrong-import-position
+
+RESOLUTIONS = {"vga": (480, 640), "720p": (720, 1280), "12mp": (3000, 4000)}
+
+
+def kmeans_k1(image):
+    """This function is the previous extract_color_palette implementation."""
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    pixels = np.float32(image_rgb).reshape(-1, 3)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, 0.1)
+    _, _, centers = cv2.kmeans(pixels, 1, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+    return centers[0]
+
+
+def synthetic_image(height, width, seed=0):
+    """This function builds a smooth, noisy BGR test image."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[..., 0] = gradient
+    image[..., 1] = gradient[::-1]
+    image[..., 2] = 128
+    image += rng.normal(0, 20, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def time_function(function, image, repeat):
+    """This function times repeated calls of a palette function on one image."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(image)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    """This function benchmarks every engine at every resolution and prints a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    engines = {
+        "kmeans_k1": kmeans_k1,
+        "mean": palette.mean_color,
+        "median": palette.median_color,
+    }
+    report = {}
+    for name, (height, width) in RESOLUTIONS.items():
+        image = synthetic_image(height, width)
+        report[name] = {
+            engine: time_function(function, image, args.repeat)
+            for engine, function in engines.items()
+        }
+        report[name]["max_abs_error_mean_vs_kmeans"] = float(
+            np.abs(palette.mean_color(image) - kmeans_k1(image)).max()
+        )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Per-capture publish latency with a fresh RabbitMQ connection versus the channel pool.
+
+The fresh mode reproduces the old /capture path: connect, declare the queue,
+publish, close. The pooled mode uses broker.PublisherPool with publisher
+confirms. Needs a reachable RabbitMQ (RABBITMQ_HOST, default localhost).
+
+    python -m benchmarks.bench_publisher --messages 500 --threads 4
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import pika
+from benchmarks import use_service, summarize
+
+use_service("web-app")
+import broker  # pylint: disable=wrong-import-position
+
+BENCHMARK_QUEUE = "benchmark_publisher"
+
+
+def publish_with_fresh_connection(host, body):
+    """This function reproduces the old per-capture connect, declare and publish."""
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    try:
+        channel = connection.channel()
+        channel.queue_declare(queue=BENCHMARK_QUEUE)
+        channel.basic_publish(exchange="", routing_key=BENCHMARK_QUEUE, body=body)
+    finally:
+        connection.close()
+
+
+def time_concurrent_calls(function, messages, threads):
+    """This function times `messages` calls spread over `threads` threads."""
+    samples = []
+    lock = threading.Lock()
+
+    def run(count):
+        local = []
+        for _ in range(count):
+            start = time.perf_counter()
+            function()
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    workers = [
+        threading.Thread(target=run, args=(messages // threads,))
+        for _ in range(threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report = summarize(samples)
+    report["messages_per_s"] = len(samples) / (time.perf_counter() - started)
+    return report
+
+
+def main():
+    """This function runs both modes against the configured RabbitMQ and prints a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    host = os.environ.get("RABBITMQ_HOST", "localhost")
+    body = "0" * 24  # an ObjectId string
+    pool = broker.PublisherPool(host=host, size=args.threads)
+    pool.publish(BENCHMARK_QUEUE, body)  # open a channel before timing
+    try:
+        report = {
+            "messages": args.messages,
+            "threads": args.threads,
+            "fresh_connection": time_concurrent_calls(
+                lambda: publish_with_fresh_connection(host, body),
+                args.messages,
+                args.threads,
+            ),
+            "pooled_channel": time_concurrent_calls(
+                lambda: pool.publish(BENCHMARK_QUEUE, body),
+                args.messages,
+                args.threads,
+            ),
+        }
+    finally:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+        connection.channel().queue_delete(queue=BENCHMARK_QUEUE)
+        connection.close()
+        pool.close()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Accuracy versus speed of each pixel sampling mode in front of the palette step.
+
+Errors are the largest per-channel difference (0-255 scale) from the palette
+computed on every pixel of the same image.
+
+    python -m benchmarks.bench_sampling --budgets 50000 250000
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+from benchmarks import use_service
+from benchmarks.bench_palette import RESOLUTIONS, synthetic_image
+
+use_service("machine-learning-client")
+import palette  # pylint: disable=wrong-import-position
+import sampling  # pylint: disable=wrong-import-position
+
+
+def extract(image, colors):
+    """This function returns the most common palette color of an image."""
+    if colors == 1:
+        return palette.mean_color(image)
+    centers, _ = palette.kmeans_palette(image, colors)
+    return centers[0]
+
+
+def run_case(image, mode, budget, colors, reference):
+    """This function times sampling plus palette extraction and measures its error."""
+    start = time.perf_counter()
+    sample = sampling.sample_pixels(image, mode, budget)
+    result = extract(sample, colors)
+    elapsed = time.perf_counter() - start
+    return {
+        "ms": elapsed * 1000,
+        "pixels": int(sample.shape[0] * sample.shape[1]),
+        "max_abs_error": float(np.abs(result - reference).max()),
+    }
+
+
+def main():
+    """This function prints the accuracy-vs-speed table for every mode and budget."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budgets", type=int, nargs="+", default=[50_000, 250_000])
+    parser.add_argument("--colors", type=int, default=1)
+    parser.add_argument("--resolution", choices=RESOLUTIONS, default="12mp")
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    image = synthetic_image(*RESOLUTIONS[args.resolution])
+    reference = extract(image, args.colors)
+    report = {
+        "resolution": args.resolution,
+        "colors": args.colors,
+        "none": run_case(image, "none", 0, args.colors, reference),
+    }
+    for budget in args.budgets:
+        for mode in ("resize", "stride", "random"):
+            report[f"{mode}@{budget}"] = run_case(
+                image, mode, budget, args.colors, reference
+            )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
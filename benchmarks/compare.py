@@ -0,0 +1,62 @@
+"""
+Compare two benchmark JSON reports and flag latency regressions.
+
+Every "*_ms" value present in both reports is compared; values that grew by
+more than --threshold percent are regressions and make the exit status 1.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+def flatten(report, prefix=""):
+    """This function maps dotted paths ("720p.imdecode.p50_ms") to numeric values."""
+    values = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(baseline, current, threshold):
+    """This function returns (path, before, after, change %, regressed) rows."""
+    before, after = flatten(baseline), flatten(current)
+    rows = []
+    for path in sorted(before.keys() & after.keys()):
+        if not path.endswith("_ms") or before[path] <= 0:
+            continue
+        change = (after[path] - before[path]) / before[path] * 100
+        rows.append((path, before[path], after[path], change, change > threshold))
+    return rows
+
+
+def main():
+    """This function prints the comparison and exits 1 on any regression."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="allowed slowdown in percent"
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current, encoding="utf-8") as current_file:
+        current = json.load(current_file)
+
+    rows = compare(baseline, current, args.threshold)
+    for path, before, after, change, regressed in rows:
+        marker = "REGRESSION" if regressed else ""
+        print(f"{path:50} {before:10.3f} {after:10.3f} {change:+7.1f}% {marker}")
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
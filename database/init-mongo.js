@@ -1,3 +1,91 @@
 // Initialize the CAE database with Image and Color collections
-db.createCollection("Image");
-db.createCollection("Color");
+db = db.getSiblingDB("CAE");
+
+// Documents written by the web app and the ML client are validated on insert;
+// "moderate" leaves documents written before the validator untouched
+db.createCollection("Image", {
+  validator: {
+    $jsonSchema: {
+      bsonType: "object",
+      required: ["storage", "image_ref", "size", "created_at"],
+      properties: {
+        storage: { enum: ["gridfs", "filesystem"] },
+        image_ref: { bsonType: "string" },
+        size: { bsonType: ["int", "long"], minimum: 0 },
+        content_hash: { bsonType: "string" },
+        created_at: { bsonType: "date" },
+        // Set by the web app when the ML client gave up on the image
+        error: { bsonType: "string" },
+      },
+    },
+  },
+  validationLevel: "moderate",
+  validationAction: "error",
+});
+
+const colorSchema = {
+  rgb: {
+    bsonType: "array",
+    minItems: 3,
+    maxItems: 3,
+    items: { bsonType: "int", minimum: 0, maximum: 255 },
+  },
+  hex: { bsonType: "string", pattern: "^#[0-9a-f]{6}$" },
+  name: { bsonType: "string" },
+  name_distance: { bsonType: ["double", "int"] },
+};
+
+db.createCollection("Color", {
+  validator: {
+    $jsonSchema: {
+      bsonType: "object",
+      required: ["rgb", "hex", "name", "image_id", "created_at"],
+      properties: Object.assign({}, colorSchema, {
+        image_id: { bsonType: "objectId" },
+        created_at: { bsonType: "date" },
+        // Stage timestamps and durations of the job (see tracing.py)
+        trace: { bsonType: "object", required: ["trace_id", "timestamps"] },
+        // zlib-compressed uint32 pixel counts per RGB cell (see histograms.py)
+        histogram: {
+          bsonType: "object",
+          required: ["bits", "encoding", "counts"],
+          properties: {
+            bits: { bsonType: "int", minimum: 1, maximum: 8 },
+            pixels: { bsonType: ["int", "long"] },
+            encoding: { enum: ["zlib"] },
+            counts: { bsonType: "binData" },
+          },
+        },
+        palette: {
+          bsonType: "array",
+          items: {
+            bsonType: "object",
+            required: ["rgb", "hex", "name", "share"],
+            properties: Object.assign({}, colorSchema, {
+              share: { bsonType: ["double", "int"], minimum: 0, maximum: 1 },
+            }),
+          },
+        },
+      }),
+    },
+  },
+  validationLevel: "moderate",
+  validationAction: "error",
+});
+
+// Duplicate uploads are found by content hash, and results by their image
+db.Image.createIndex({ content_hash: 1 });
+db.Color.createIndex({ image_id: 1 });
+
+// Colors are queried by name, for the main color and within palettes
+db.Color.createIndex({ name: 1 });
+db.Color.createIndex({ "palette.name": 1 });
+
+// Retention: with RETENTION_DAYS set, MongoDB deletes documents older than that;
+// otherwise created_at is only indexed for time-range queries. Expired Image
+// documents leave their stored bytes behind, so image stores need their own cleanup.
+const retentionDays = parseInt(process.env.RETENTION_DAYS || "0", 10);
+const createdAtOptions =
+  retentionDays > 0 ? { expireAfterSeconds: retentionDays * 24 * 60 * 60 } : {};
+db.Image.createIndex({ created_at: 1 }, createdAtOptions);
+db.Color.createIndex({ created_at: 1 }, createdAtOptions);
@@ -0,0 +1,245 @@
+"""
+This module runs the ML client on asyncio with aio-pika and Motor.
+
+Up to ML_PREFETCH_COUNT messages are in flight at once: their MongoDB fetches,
+result writes, replies and acks overlap, while decoding and palette extraction
+run in an executor (ML_ASYNC_EXECUTOR "process" or "thread", ML_ASYNC_WORKERS
+workers). Queues, documents and replies are the same as the blocking consumer's.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import signal
+import aio_pika
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo.errors import PyMongoError
+import color_names
+import image_store
+import json_logging
+import metrics
+import ml_client
+import mongo_pool
+import tracing
+
+RABBITMQ_HOST = "rabbitmq"
+RETRY_DELAY = 5
+EXECUTOR = os.environ.get("ML_ASYNC_EXECUTOR", "process")
+WORKERS = int(os.environ.get("ML_ASYNC_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def create_executor(kind=EXECUTOR, workers=WORKERS):
+    """This function creates the executor for the CPU-bound analysis."""
+    if kind == "process":
+        # Build the color name index once so worker processes inherit it
+        color_names.get_index()
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    if kind == "thread":
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    raise ValueError(f"Unknown executor {kind!r}")
+
+
+def get_async_db():
+    """This function returns the CAE database on a Motor client.
+
+    MONGODB_URI and MONGODB_MAX_POOL_SIZE are read as in mongo_pool.
+    """
+    client = AsyncIOMotorClient(
+        os.environ.get("MONGODB_URI", mongo_pool.DEFAULT_MONGODB_URI),
+        maxPoolSize=int(
+            os.environ.get("MONGODB_MAX_POOL_SIZE", mongo_pool.DEFAULT_MAX_POOL_SIZE)
+        ),
+    )
+    return client[mongo_pool.DB_NAME]
+
+
+class AsyncConsumer:
+    """This class analyses ml_client messages concurrently on one event loop."""
+
+    def __init__(self, channel, db, executor):
+        self.channel = channel
+        self.db = db
+        self.executor = executor
+        self.bucket = AsyncIOMotorGridFSBucket(
+            db, bucket_name=image_store.GRIDFS_BUCKET
+        )
+        self._tasks = set()
+
+    async def declare_topology(self):
+        """This function declares the same durable topology as ml_client.declare_topology."""
+        dead_letter_exchange = await self.channel.declare_exchange(
+            ml_client.DEAD_LETTER_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True
+        )
+        dead_letter_queue = await self.channel.declare_queue(
+            ml_client.DEAD_LETTER_QUEUE, durable=True
+        )
+        await dead_letter_queue.bind(dead_letter_exchange)
+        await self.channel.declare_queue(ml_client.REPLY_QUEUE, durable=True)
+        return await self.channel.declare_queue(
+            ml_client.ML_CLIENT_QUEUE,
+            durable=True,
+            arguments=ml_client.ML_CLIENT_QUEUE_ARGUMENTS,
+        )
+
+    async def get_image_data(self, document_id):
+        """This function fetches the image bytes of an Image document, or None."""
+        document = await self.db["Image"].find_one({"_id": ObjectId(document_id)})
+        if document is None:
+            return None
+        if document.get("storage") == image_store.GridFSImageStore.name:
+            grid_out = await self.bucket.open_download_stream(
+                ObjectId(document["image_ref"])
+            )
+            return await grid_out.read()
+        if "image_ref" in document:
+            # Other stores read from disk; keep that off the event loop
+            return await asyncio.get_running_loop().run_in_executor(
+                None, image_store.load_image_data, document
+            )
+        return document.get("image_data")
+
+    async def analyse(self, document_id, trace=None):
+        """This function builds the Color document of an image in the executor."""
+        try:
+            image_data = await self.get_image_data(document_id)
+        except InvalidId as error:
+            raise ValueError(f"Malformed document id {document_id!r}") from error
+        tracing.stamp(trace, "image_fetched")
+        # A process executor stamps a copy of the trace; the document carries it back
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, ml_client.analyse_image_data, document_id, image_data, trace
+        )
+
+    async def publish_color_id(self, color_id, message, trace=None):
+        """This function replies like ml_client.publish_color_id."""
+        if message.reply_to:
+            reply = aio_pika.Message(
+                color_id.encode(),
+                correlation_id=message.correlation_id,
+                headers=tracing.to_headers(trace) or None,
+            )
+            routing_key = message.reply_to
+        else:
+            reply = aio_pika.Message(
+                color_id.encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+            )
+            routing_key = ml_client.REPLY_QUEUE
+        await self.channel.default_exchange.publish(reply, routing_key=routing_key)
+
+    async def publish_failure(self, message, error):
+        """This function sends a failure reply like ml_client.publish_failure."""
+        if not message.reply_to:
+            return
+        reply = aio_pika.Message(
+            b"",
+            correlation_id=message.correlation_id,
+            headers={ml_client.ERROR_HEADER: str(error)},
+        )
+        await self.channel.default_exchange.publish(reply, routing_key=message.reply_to)
+
+    async def reject_message(self, message, error, requeue=False):
+        """This function rejects a message like ml_client.reject_message."""
+        logging.warning(
+            "Rejecting message: %s",
+            error,
+            extra={"delivery_tag": message.delivery_tag, "requeue": requeue},
+        )
+        if not requeue:
+            await self.publish_failure(message, error)
+        await message.nack(requeue=requeue)
+
+    async def handle_message(self, message):
+        """This function analyses one message and acks it once the result is stored.
+
+        Failures are settled as in ml_client.callback.
+        """
+        metrics.observe_queue_wait(message)
+        trace = tracing.from_headers(message.headers)
+        tracing.stamp(trace, "consumed")
+        try:
+            document_id = message.body.decode()
+        except UnicodeDecodeError as error:
+            await self.reject_message(message, error)
+            return
+        with metrics.MESSAGES_IN_PROGRESS.track_inprogress(), metrics.MESSAGE_SECONDS.time():
+            try:
+                color_data = await self.analyse(document_id, trace)
+                with metrics.DB_WRITE_SECONDS.labels("color_insert").time():
+                    result = await self.db["Color"].insert_one(color_data)
+                trace = color_data.get("trace")
+                tracing.stamp(trace, "color_stored")
+                await self.publish_color_id(str(result.inserted_id), message, trace)
+            except PyMongoError as error:
+                await self.reject_message(
+                    message, error, requeue=not message.redelivered
+                )
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                await self.reject_message(message, error)
+            else:
+                await message.ack()
+        ml_client.log_processed(document_id, trace)
+
+    async def consume(self, queue, on_processed=None):
+        """This function handles every delivery of queue in its own task until cancelled.
+
+        on_processed, if given, is called once per handled message.
+        """
+        async with queue.iterator() as messages:
+            async for message in messages:
+                task = asyncio.create_task(self.handle_message(message))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                if on_processed is not None:
+                    task.add_done_callback(lambda _: on_processed(1))
+
+    async def drain(self):
+        """This function waits for the messages still being handled."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def connect(host=RABBITMQ_HOST):
+    """This function opens a robust RabbitMQ connection, retrying until it succeeds."""
+    while True:
+        try:
+            return await aio_pika.connect_robust(host=host)
+        except (OSError, aio_pika.exceptions.AMQPError):
+            logging.warning(
+                "Connection to RabbitMQ failed. Retrying in %d seconds...", RETRY_DELAY
+            )
+            await asyncio.sleep(RETRY_DELAY)
+
+
+async def run(prefetch_count=ml_client.PREFETCH_COUNT):
+    """This function consumes analysis requests until the task is cancelled or SIGTERM."""
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    with create_executor() as executor:
+        connection = await connect()
+        async with connection:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=prefetch_count)
+            consumer = AsyncConsumer(channel, get_async_db(), executor)
+            queue = await consumer.declare_topology()
+            logging.info("Waiting for messages...")
+            try:
+                await consumer.consume(queue)
+            finally:
+                await consumer.drain()
+
+
+def main():
+    """This function runs the asyncio consumer until interrupted."""
+    json_logging.configure_logging("ml-client")
+    try:
+        asyncio.run(run())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logging.info("Stopped")
+
+
+if __name__ == "__main__":
+    main()
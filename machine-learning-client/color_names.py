@@ -0,0 +1,96 @@
+"""
+This module finds the nearest CSS3 color name for any RGB color.
+"""
+
+# pylint: disable=no-member
+# pylint: disable=too-few-public-methods
+
+import functools
+import cv2
+import numpy as np
+import webcolors
+
+LUT_BITS = 5
+
+
+def rgb_to_lab(rgb):
+    """This function converts an (N, 3) array of 0-255 RGB colors to CIELAB."""
+    rgb = np.asarray(rgb, dtype=np.float32).reshape(1, -1, 3) / 255
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2Lab).reshape(-1, 3)
+
+
+def _squared_distances(points, centers):
+    """This function returns all pairwise squared distances between two point sets."""
+    return (
+        (points**2).sum(axis=1)[:, np.newaxis]
+        + (centers**2).sum(axis=1)
+        - 2 * points @ centers.T
+    )
+
+
+class ColorNameIndex:
+    """This class answers nearest-name queries with a precomputed lookup table.
+
+    Every cell of a (2**bits)**3 RGB grid lists the CSS3 colors that can be
+    nearest (in CIELAB) to some color inside the cell: those no farther from
+    the cell center than the best one plus the cell's diameter. That is about
+    four names on average, so a query is one table read and a handful of
+    distances, and the answer matches a brute-force search.
+    """
+
+    def __init__(self, bits=LUT_BITS):
+        self.bits = bits
+        self.names = list(webcolors.CSS3_HEX_TO_NAMES.values())
+        rgb = np.array(
+            [
+                webcolors.hex_to_rgb(hex_value)
+                for hex_value in webcolors.CSS3_HEX_TO_NAMES
+            ]
+        )
+        self.exact = {tuple(color): name for color, name in zip(rgb, self.names)}
+        self.lab = rgb_to_lab(rgb)
+
+        cells = 1 << bits
+        step = 256 / cells
+        lows = np.arange(cells) * step
+        grid = np.stack(np.meshgrid(lows, lows, lows, indexing="ij"), axis=-1)
+        grid = grid.reshape(-1, 3)
+        center_lab = rgb_to_lab(grid + step / 2)
+        # Cell radius in CIELAB, measured at the cell's corners
+        radius = np.zeros(len(grid), dtype=np.float32)
+        for corner in np.ndindex(2, 2, 2):
+            corner_lab = rgb_to_lab(np.minimum(grid + np.array(corner) * step, 255))
+            radius = np.maximum(radius, np.linalg.norm(corner_lab - center_lab, axis=1))
+
+        distances = np.sqrt(np.maximum(_squared_distances(center_lab, self.lab), 0))
+        bound = distances.min(axis=1) + 2 * radius
+        candidates = distances <= bound[:, np.newaxis]
+        self.offsets = np.concatenate(([0], np.cumsum(candidates.sum(axis=1))))
+        self.candidates = np.nonzero(candidates)[1].astype(np.uint8)
+
+    def nearest(self, rgb):
+        """This function returns the nearest color name and its CIELAB distance (Delta E)."""
+        rgb = tuple(min(255, max(0, int(round(float(value))))) for value in rgb)
+        name = self.exact.get(rgb)
+        if name is not None:
+            return name, 0.0
+        shift = 8 - self.bits
+        cells = 1 << self.bits
+        cell = ((rgb[0] >> shift) * cells + (rgb[1] >> shift)) * cells + (
+            rgb[2] >> shift
+        )
+        candidates = self.candidates[self.offsets[cell] : self.offsets[cell + 1]]
+        distances = np.linalg.norm(self.lab[candidates] - rgb_to_lab(rgb)[0], axis=1)
+        best = distances.argmin()
+        return self.names[candidates[best]], float(distances[best])
+
+
+@functools.lru_cache(maxsize=None)
+def get_index():
+    """This function builds the shared index on first use."""
+    return ColorNameIndex()
+
+
+def nearest_color_name(rgb):
+    """This function returns the closest CSS3 color name to rgb and its distance."""
+    return get_index().nearest(rgb)
@@ -0,0 +1,75 @@
+"""
+This module decodes captured images at the lowest resolution the palette step needs.
+
+libjpeg can decode a JPEG directly at 1/2, 1/4 or 1/8 scale, which is much
+faster and smaller than decoding every pixel and sampling afterwards. The scale
+is chosen from the dimensions in the JPEG header so that the decoded image still
+holds at least pixel_budget pixels.
+"""
+
+# pylint: disable=no-member
+
+import struct
+import cv2
+import numpy as np
+
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Start-of-frame markers, which carry the image dimensions
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+
+
+def jpeg_dimensions(data):
+    """This function reads (height, width) from a JPEG header, or None if not a JPEG."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack_from(">HH", data, offset + 5)
+            return height, width
+        (length,) = struct.unpack_from(">H", data, offset + 2)
+        offset += 2 + length
+    return None
+
+
+def reduction_factor(height, width, pixel_budget):
+    """This function returns the largest scale-down (1, 2, 4 or 8) keeping pixel_budget pixels."""
+    for factor in (8, 4, 2):
+        if -(-height // factor) * -(-width // factor) >= pixel_budget:
+            return factor
+    return 1
+
+
+def decode_image(data, pixel_budget=None):
+    """This function decodes an encoded image to BGR, reduced to about pixel_budget pixels.
+
+    Non-JPEG images, and pixel_budget None, are decoded at full resolution.
+    Returns None if the data is empty or cannot be decoded.
+    """
+    if not data:
+        return None
+    factor = 1
+    if pixel_budget is not None:
+        dimensions = jpeg_dimensions(data)
+        if dimensions is not None:
+            factor = reduction_factor(*dimensions, pixel_budget)
+    return cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_COLOR_FLAGS[factor])
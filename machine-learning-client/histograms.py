@@ -0,0 +1,78 @@
+"""
+This module stores a compact color histogram of every analysed image.
+
+The histogram has 4096 cells (4 bits per RGB channel) of uint32 pixel counts,
+taken over the same sampled pixels as the palette. It is kept zlib-compressed
+on the Color document, so new analyses (another K, similarity search) can run
+on the stored counts without fetching and decoding the original image.
+"""
+
+# pylint: disable=no-member
+
+import zlib
+import cv2
+import numpy as np
+from bson import Binary
+import palette
+
+STORED_HISTOGRAM_BITS = 4  # 16 levels per channel, 4096 cells
+COMPRESSION_LEVEL = 6
+
+
+def compute_histogram(image, bits=STORED_HISTOGRAM_BITS):
+    """This function counts the pixels of an image in each of 2**(3*bits) RGB cells.
+
+    Cells are ordered like palette.cell_codes (red most significant). Color
+    images go through cv2.calcHist, several times faster than binning codes.
+    """
+    if image.ndim == 3 and image.shape[2] >= 3:
+        levels = 1 << bits
+        counts = cv2.calcHist(
+            [image], [2, 1, 0], None, [levels] * 3, [0, 256] * 3
+        ).ravel()
+        return counts.astype(np.uint32)
+    codes = palette.cell_codes(palette.rgb_pixels(image), bits)
+    return np.bincount(codes, minlength=1 << (3 * bits)).astype(np.uint32)
+
+
+def encode_histogram(counts, bits=STORED_HISTOGRAM_BITS):
+    """This function returns the histogram field stored on a Color document."""
+    return {
+        "bits": bits,
+        "pixels": int(counts.sum()),
+        "encoding": "zlib",
+        "counts": Binary(
+            zlib.compress(counts.astype("<u4").tobytes(), COMPRESSION_LEVEL)
+        ),
+    }
+
+
+def decode_histogram(field):
+    """This function returns the uint32 counts of a stored histogram field."""
+    if field.get("encoding") != "zlib":
+        raise ValueError(f"Unknown histogram encoding {field.get('encoding')!r}")
+    counts = np.frombuffer(zlib.decompress(field["counts"]), dtype="<u4")
+    if len(counts) != 1 << (3 * field["bits"]):
+        raise ValueError(f"Histogram has {len(counts)} cells for {field['bits']} bits")
+    return counts.astype(np.uint32)
+
+
+def histogram_palette(counts, colors, bits=STORED_HISTOGRAM_BITS, seed=0):
+    """This function clusters a stored histogram into up to `colors` colors.
+
+    Like palette.kmeans_palette, but on cell centers instead of pixel means.
+    Returns the RGB centers and their shares, most common first.
+    """
+    occupied = np.flatnonzero(counts)
+    centers, weights = palette.weighted_kmeans(
+        palette.cell_centers(bits)[occupied], counts[occupied], colors, seed=seed
+    )
+    order = np.argsort(weights)[::-1]
+    return centers[order], weights[order] / weights.sum()
+
+
+def histogram_similarity(first, second):
+    """This function returns the intersection of two normalized histograms, from 0 to 1."""
+    first = first / max(int(first.sum()), 1)
+    second = second / max(int(second.sum()), 1)
+    return float(np.minimum(first, second).sum())
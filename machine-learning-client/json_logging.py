@@ -0,0 +1,113 @@
+"""
+This module sets up structured JSON logging that stays off the hot path.
+
+Records are put on an in-process queue and written by a background thread, so
+a log call costs the caller a record and a queue put, never a write to stdout.
+Each line is one JSON object; keyword fields passed with extra={...} become
+keys of that object. Per-message debug lines pass extra={"sampled": True} and
+only LOG_SAMPLE_RATE of them are kept.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 0.01))
+
+# Attributes every LogRecord has; anything else on a record is a structured field
+RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))
+) | {"message", "asctime", "sampled"}
+
+_LISTENER = None
+_LISTENER_PID = None
+
+
+class JsonFormatter(logging.Formatter):
+    """This class formats a record as one JSON object per line."""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """This class keeps only sample_rate of the records marked sampled=True."""
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.sample_rate
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """This class enqueues records as they are, leaving all formatting to the listener.
+
+    The standard handler formats the message in the caller to make records
+    picklable, which an in-process queue does not need.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(service, level=LOG_LEVEL, sample_rate=LOG_SAMPLE_RATE):
+    """This function routes the root logger through a queue to JSON lines on stderr.
+
+    It is safe to call again, and must be called again in forked processes,
+    which do not inherit the writer thread. Returns the queue listener.
+    """
+    global _LISTENER, _LISTENER_PID  # pylint: disable=global-statement
+    if _LISTENER is not None and _LISTENER_PID == os.getpid():
+        return _LISTENER
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter(service))
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _LISTENER = logging.handlers.QueueListener(records, stream_handler)
+    _LISTENER.start()
+    _LISTENER_PID = os.getpid()
+    return _LISTENER
+
+
+@atexit.register
+def stop_logging():
+    """This function writes out the queued records and stops the writer thread."""
+    global _LISTENER  # pylint: disable=global-statement
+    if _LISTENER is not None and _LISTENER_PID == os.getpid():
+        _LISTENER.stop()
+    _LISTENER = None
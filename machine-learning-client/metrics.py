@@ -0,0 +1,146 @@
+"""
+This module defines the Prometheus metrics of the ML client and serves them on a sidecar port.
+
+Metrics are recorded in process memory, or, when PROMETHEUS_MULTIPROC_DIR is
+set (as in the Docker image), in per-process files of that directory so that
+the supervisor's port reports the totals of all worker processes. Recording a
+value is a lock and a few additions; queue depths are only asked of RabbitMQ
+when the port is scraped.
+"""
+
+import glob
+import os
+import time
+import pika
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9100))
+
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "ml_client_queue_wait_seconds",
+    "Time analysis jobs spent in RabbitMQ before processing started",
+    buckets=WAIT_BUCKETS,
+)
+DECODE_SECONDS = Histogram(
+    "ml_client_decode_seconds", "Time spent decoding images", buckets=FAST_BUCKETS
+)
+PALETTE_SECONDS = Histogram(
+    "ml_client_palette_seconds",
+    "Time spent computing the palette of decoded images",
+    buckets=FAST_BUCKETS,
+)
+DB_WRITE_SECONDS = Histogram(
+    "ml_client_db_write_seconds",
+    "Time spent storing Color documents",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+MESSAGE_SECONDS = Histogram(
+    "ml_client_message_seconds",
+    "Time from receiving an analysis job to acknowledging it",
+    buckets=FAST_BUCKETS,
+)
+MESSAGES_IN_PROGRESS = Gauge(
+    "ml_client_messages_in_progress",
+    "Analysis jobs being processed",
+    multiprocess_mode="livesum",
+)
+
+
+def observe_queue_wait(properties):
+    """This function records the queue wait of a job from its "published_at" header.
+
+    properties is anything with AMQP headers: pika properties or an aio-pika message.
+    """
+    published_at = (getattr(properties, "headers", None) or {}).get("published_at")
+    if isinstance(published_at, (int, float)):
+        QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - published_at))
+
+
+class QueueDepthCollector:
+    """This class reports the depth of RabbitMQ queues, asking the broker at scrape time."""
+
+    def __init__(self, host, queues):
+        self.host = host
+        self.queues = queues
+
+    def describe(self):
+        """This function keeps registration from opening a connection."""
+        return []
+
+    def collect(self):
+        """This function yields the ready messages and consumers of every queue."""
+        depth = GaugeMetricFamily(
+            "ml_client_queue_depth", "Messages ready in a queue", labels=["queue"]
+        )
+        consumers = GaugeMetricFamily(
+            "ml_client_queue_consumers", "Consumers of a queue", labels=["queue"]
+        )
+        try:
+            connection = pika.BlockingConnection(
+                pika.ConnectionParameters(host=self.host)
+            )
+        except pika.exceptions.AMQPError:
+            return
+        try:
+            channel = connection.channel()
+            for queue in self.queues:
+                frame = channel.queue_declare(queue=queue, passive=True)
+                depth.add_metric([queue], frame.method.message_count)
+                consumers.add_metric([queue], frame.method.consumer_count)
+        except pika.exceptions.AMQPError:
+            pass  # a queue that does not exist yet closes the channel
+        finally:
+            if connection.is_open:
+                connection.close()
+        yield depth
+        yield consumers
+
+
+def get_registry():
+    """This function returns the registry to serve, aggregating worker files if any."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def start_server(host, queues, port=METRICS_PORT):
+    """This function serves the metrics and queue depths on port in a daemon thread.
+
+    Returns the registry served, or None if port is 0.
+    """
+    if not port:
+        return None
+    registry = get_registry()
+    registry.register(QueueDepthCollector(host, queues))
+    start_http_server(port, registry=registry)
+    return registry
+
+
+def clear_multiprocess_dir():
+    """This function removes the metric files of earlier runs before workers start."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path is None:
+        return
+    os.makedirs(path, exist_ok=True)
+    for filename in glob.glob(os.path.join(path, "*.db")):
+        os.unlink(filename)
+
+
+def mark_process_dead(pid):
+    """This function drops the live gauges of a worker process that exited."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
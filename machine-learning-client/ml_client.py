@@ -6,13 +6,49 @@ This module initializes the machine learning client.
 # pylint: disable=too-many-function-args
 # pylint: disable=redefined-outer-name
 
+import datetime
+import logging
+import os
 import time
-import cv2
-import numpy as np
-import webcolors
-from pymongo import MongoClient
 import pika
 from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import GridFSError
+from pymongo.errors import PyMongoError
+import color_names
+import decoding
+import histograms
+import image_store
+import json_logging
+import metrics
+import mongo_pool
+import palette
+import sampling
+import tracing
+
+# Pixel sampling in front of the palette step bounds its cost for any resolution
+SAMPLING_MODE = os.environ.get("PALETTE_SAMPLING_MODE", "stride")
+PIXEL_BUDGET = int(
+    os.environ.get("PALETTE_PIXEL_BUDGET", sampling.DEFAULT_PIXEL_BUDGET)
+)
+PALETTE_COLORS = int(os.environ.get("PALETTE_COLORS", 5))
+
+ML_CLIENT_QUEUE = "ml_client"
+REPLY_QUEUE = "main"
+# Messages that cannot be analysed are dead-lettered to ml_client.dead for inspection
+DEAD_LETTER_EXCHANGE = "ml_client.dlx"
+DEAD_LETTER_QUEUE = "ml_client.dead"
+ML_CLIENT_QUEUE_ARGUMENTS = {"x-dead-letter-exchange": DEAD_LETTER_EXCHANGE}
+PERSISTENT_DELIVERY_MODE = 2
+# Header of the reply to a dead-lettered job; it holds the error and the body is empty
+ERROR_HEADER = "error"
+
+# Unacknowledged messages a consumer may hold
+PREFETCH_COUNT = int(os.environ.get("ML_PREFETCH_COUNT", 16))
+# Messages handled per batch; 1 keeps the one-message-at-a-time consumer
+BATCH_SIZE = int(os.environ.get("ML_BATCH_SIZE", 1))
+# Seconds to wait for more messages before processing a partial batch
+BATCH_WAIT = float(os.environ.get("ML_BATCH_WAIT", 0.05))
 
 
 def rgb_to_hex(rgb):
@@ -21,93 +57,411 @@ def rgb_to_hex(rgb):
 
 
 def get_color_name(rgb):
-    """This function use webcolors to try to get the name of the color."""
-    try:
-        return webcolors.rgb_to_name(rgb)
-    except ValueError:
-        # Implement a way to find nearest color name if exact name not found
-        return None
+    """This function returns the name of the nearest CSS3 color."""
+    name, _ = color_names.nearest_color_name(rgb)
+    return name
+
+
+def extract_color_palette(
+    image,
+    colors=1,
+    method="mean",
+    sampling_mode=SAMPLING_MODE,
+    pixel_budget=PIXEL_BUDGET,
+):
+    """This function extracts the main color of the captured image when called.
+
+    The image is first sampled down to pixel_budget pixels. A single color is
+    computed in closed form (mean or median); more colors use k-means and
+    return the most common cluster.
+    """
+    image = sampling.sample_pixels(image, sampling_mode, pixel_budget)
+    if colors == 1:
+        return palette.dominant_color(image, method)
+    centers, _ = palette.kmeans_palette(image, colors)
+    return centers[0]
+
+
+def describe_color(rgb):
+    """This function describes one RGB color the way it is stored in the Color collection."""
+    rgb = [int(round(float(value))) for value in rgb]
+    name, distance = color_names.nearest_color_name(rgb)
+    return {
+        "rgb": rgb,
+        "hex": rgb_to_hex(rgb),
+        "name": name,
+        "name_distance": round(distance, 2),
+    }
 
 
-def extract_color_palette(image):
-    """This function extracts the average color palette of the captured image when called."""
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    pixels = np.float32(image_rgb).reshape(-1, 3)
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, 0.1)
-    flags = cv2.KMEANS_RANDOM_CENTERS
-    _, _, palette = cv2.kmeans(pixels, 1, None, criteria, 10, flags)
-    return palette[0]
+def build_color_data(image, colors=PALETTE_COLORS):
+    """This function builds the Color document for a decoded image.
+
+    The top-level rgb/hex/name is the image's mean color; "palette" lists up to
+    `colors` clustered colors with their share of the pixels, most common first;
+    "histogram" keeps the compressed color histogram of the sampled pixels.
+    """
+    sample = sampling.sample_pixels(image, SAMPLING_MODE, PIXEL_BUDGET)
+    color_data = describe_color(palette.dominant_color(sample))
+    centers, shares = palette.kmeans_palette(sample, colors)
+    color_data["palette"] = [
+        dict(describe_color(center), share=round(float(share), 4))
+        for center, share in zip(centers, shares)
+    ]
+    color_data["histogram"] = histograms.encode_histogram(
+        histograms.compute_histogram(sample)
+    )
+    return color_data
 
 
 def get_image_data_from_db(document_id):
     """This function retrieves image data from the MongoDB database."""
-    # Connect to MongoDB and fetch image data
-    mongo_uri = "mongodb://mongodb:27017/"
-    # mongo_uri = "mongodb://localhost:27017/"
-    if not mongo_uri:
-        raise EnvironmentError("MONGO_URI environment variable is not set.")
-    client = MongoClient(mongo_uri)
-    db_client = client["CAE"]
-    image_collection = db_client["Image"]
+    image_collection = mongo_pool.get_db()["Image"]
 
     document = image_collection.find_one({"_id": ObjectId(document_id)})
     if document:
-        return document.get("image_data")
+        return image_store.load_image_data(document)
     return None
 
 
-def save_color_data_to_db(channel, color_data):
-    """This function saves the color data to db."""
-    # Connect to MongoDB
-    mongo_uri = "mongodb://mongodb:27017/"
-    # mongo_uri = "mongodb://localhost:27017/"
-    if not mongo_uri:
-        raise EnvironmentError("MONGO_URI environment variable is not set.")
-    client = MongoClient(mongo_uri)
-    db_client = client["CAE"]
-    color_collection = db_client["Color"]
+def get_image_documents_from_db(document_ids):
+    """This function retrieves many Image documents with a single query.
+
+    Returns a dict from document id to Image document; unknown or malformed ids
+    are left out. The image bytes are loaded separately, per document, so that
+    one missing stored file only fails its own message.
+    """
+    object_ids = []
+    for document_id in document_ids:
+        try:
+            object_ids.append(ObjectId(document_id))
+        except InvalidId:
+            logging.warning(
+                "Skipping malformed document id", extra={"document_id": document_id}
+            )
+    image_collection = mongo_pool.get_db()["Image"]
+    documents = image_collection.find({"_id": {"$in": object_ids}})
+    return {str(document["_id"]): document for document in documents}
+
+
+def publish_color_id(channel, color_id, properties=None, trace=None):
+    """This function replies to the web app with the id of a saved Color document.
+
+    Requests carrying a reply_to queue are answered there with their correlation id
+    and trace; anything else falls back to the shared "main" queue.
+    """
+    if properties is not None and properties.reply_to:
+        # Answer the requesting web app process directly
+        channel.basic_publish(
+            exchange="",
+            routing_key=properties.reply_to,
+            body=color_id,
+            properties=pika.BasicProperties(
+                correlation_id=properties.correlation_id,
+                headers=tracing.to_headers(trace) or None,
+            ),
+        )
+    else:
+        # Send the MongoDB ID back to main.py; the queue is declared by declare_topology
+        channel.basic_publish(
+            exchange="",
+            routing_key=REPLY_QUEUE,
+            body=color_id,
+            properties=pika.BasicProperties(delivery_mode=PERSISTENT_DELIVERY_MODE),
+        )
+
+
+def publish_failure(channel, properties, error):
+    """This function tells the requester that its job failed and will not be retried.
+
+    Only requests carrying a reply_to queue are answered.
+    """
+    if properties is None or not properties.reply_to:
+        return
+    channel.basic_publish(
+        exchange="",
+        routing_key=properties.reply_to,
+        body=b"",
+        properties=pika.BasicProperties(
+            correlation_id=properties.correlation_id,
+            headers={ERROR_HEADER: str(error)},
+        ),
+    )
+
+
+def save_color_data_to_db(channel, color_data, properties=None):
+    """This function saves the color data to db and replies with the color id."""
+    color_collection = mongo_pool.get_db()["Color"]
 
     # Save color data to the database
-    result = color_collection.insert_one(color_data)
+    with metrics.DB_WRITE_SECONDS.labels("color_insert").time():
+        result = color_collection.insert_one(color_data)
     color_id = str(result.inserted_id)
-    print(color_id)
 
-    # Declare a queue for sending messages to main
-    channel.queue_declare(queue="main")
+    trace = color_data.get("trace")
+    tracing.stamp(trace, "color_stored")
+    publish_color_id(channel, color_id, properties, trace)
 
-    # Send the MongoDB ID back to main.py
-    channel.basic_publish(exchange="", routing_key="main", body=color_id)
 
-    print("Color data saved to the database")
+def analyse_image(document_id, trace=None):
+    """This function builds the Color document of a stored image.
 
+    ValueError is raised for images that are missing or cannot be decoded.
+    """
+    try:
+        image_data = get_image_data_from_db(document_id)
+    except InvalidId as error:
+        raise ValueError(f"Malformed document id {document_id!r}") from error
+    tracing.stamp(trace, "image_fetched")
+    return analyse_image_data(document_id, image_data, trace)
 
-def callback(channel, method, properties, body):  # pylint: disable=unused-argument
-    """This function is called when a message is received from the queue."""
-    document_id = body.decode()  # Decode the byte message to string
-    print("Received message:", document_id)
 
-    # Fetch image data from the database
-    image_data = get_image_data_from_db(document_id)
+def analyse_image_data(document_id, image_data, trace=None):
+    """This function builds the Color document of an image from its encoded bytes.
 
+    A trace, if given, is stamped and stored on the document as "trace".
+    """
     if image_data is None:
-        print("Image data not found in the database")
+        raise ValueError(f"Image data not found in the database: {document_id}")
+
+    # JPEGs are decoded at reduced scale when the sampling budget allows it
+    with metrics.DECODE_SECONDS.time():
+        image = decoding.decode_image(
+            image_data, None if SAMPLING_MODE == "none" else PIXEL_BUDGET
+        )
+    if image is None:
+        raise ValueError(f"Image could not be decoded: {document_id}")
+    tracing.stamp(trace, "decoded")
+    with metrics.PALETTE_SECONDS.time():
+        color_data = build_color_data(image)
+    tracing.stamp(trace, "analysed")
+    color_data["image_id"] = ObjectId(document_id)
+    color_data["created_at"] = datetime.datetime.now(datetime.timezone.utc)
+    if trace is not None:
+        color_data["trace"] = tracing.to_document(trace)
+    return color_data
+
+
+def reject_message(channel, method, properties, error, requeue=False):
+    """This function rejects a message; without requeue it goes to the dead-letter queue.
+
+    A dead-lettered job is answered with a failure reply first, so the web app
+    stops waiting for it.
+    """
+    logging.warning(
+        "Rejecting message: %s",
+        error,
+        extra={"delivery_tag": method.delivery_tag, "requeue": requeue},
+    )
+    if not requeue:
+        publish_failure(channel, properties, error)
+    channel.basic_nack(delivery_tag=method.delivery_tag, requeue=requeue)
+
+
+def callback(channel, method, properties, body):
+    """This function is called when a message is received from the queue.
+
+    The message is acknowledged only after its Color document is stored and the
+    reply sent. MongoDB errors requeue it once; anything else dead-letters it.
+    """
+    started = time.perf_counter()
+    metrics.observe_queue_wait(properties)
+    trace = tracing.from_headers(getattr(properties, "headers", None))
+    tracing.stamp(trace, "consumed")
+    try:
+        document_id = body.decode()  # Decode the byte message to string
+    except UnicodeDecodeError as error:
+        # Not a document id; it would fail again on every redelivery
+        reject_message(channel, method, properties, error)
         return
 
-    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_UNCHANGED)
-    color_palette = extract_color_palette(image)
+    with metrics.MESSAGES_IN_PROGRESS.track_inprogress(), metrics.MESSAGE_SECONDS.time():
+        handle_message(channel, method, properties, document_id, trace)
 
-    # RGB -> HEX conversion, get color name
-    hex_color = rgb_to_hex(color_palette)
-    color_name = get_color_name(color_palette) or "Unknown"
+    log_processed(document_id, trace, elapsed_ms=(time.perf_counter() - started) * 1000)
 
-    color_data = {
-        "rgb": list(map(int, color_palette)),
-        "hex": hex_color,
-        "name": color_name,
-    }
 
-    # Save color data to the database
-    save_color_data_to_db(channel, color_data)
+def log_processed(document_id, trace, **fields):
+    """This function logs a sampled debug line with the stage durations of a message.
+
+    Nothing is built unless debug logging is enabled.
+    """
+    if logging.root.isEnabledFor(logging.DEBUG):
+        logging.debug(
+            "Message processed",
+            extra={
+                "sampled": True,
+                "document_id": document_id,
+                **fields,
+                **tracing.log_fields(trace),
+            },
+        )
+
+
+def handle_message(channel, method, properties, document_id, trace=None):
+    """This function analyses one message, then acknowledges or rejects it."""
+    try:
+        color_data = analyse_image(document_id, trace)
+        # Save color data to the database
+        save_color_data_to_db(channel, color_data, properties)
+    except pika.exceptions.AMQPError:
+        # The channel is gone; the broker redelivers the unacknowledged message
+        raise
+    except PyMongoError as error:
+        reject_message(
+            channel, method, properties, error, requeue=not method.redelivered
+        )
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        # A poison image would fail again on every redelivery
+        reject_message(channel, method, properties, error)
+    else:
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def process_batch(channel, deliveries):
+    """This function analyses a batch of (method, properties, body) deliveries.
+
+    Every delivery counts as in progress until the batch is done, and its
+    processing time is the time of the whole batch.
+    """
+    metrics.MESSAGES_IN_PROGRESS.inc(len(deliveries))
+    started = time.perf_counter()
+    try:
+        handle_batch(channel, deliveries)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.MESSAGES_IN_PROGRESS.dec(len(deliveries))
+        for _ in deliveries:
+            metrics.MESSAGE_SECONDS.observe(elapsed)
+
+
+def handle_batch(channel, deliveries):
+    """This function analyses a batch, then acknowledges or rejects its messages.
+
+    Images are fetched with one query and results written with one insert_many;
+    the stored results are then acknowledged at once. As in handle_message,
+    MongoDB errors requeue the affected messages once and any other failure
+    (missing image or stored bytes, undecodable data) dead-letters them.
+    """
+    deliveries, document_ids = decode_deliveries(channel, deliveries)
+    if not deliveries:
+        return
+    traces = [
+        tracing.from_headers(properties.headers) for _, properties, _ in deliveries
+    ]
+    for (_, properties, _), trace in zip(deliveries, traces):
+        metrics.observe_queue_wait(properties)
+        tracing.stamp(trace, "consumed")
+    try:
+        documents = get_image_documents_from_db(document_ids)
+    except PyMongoError as error:
+        for method, properties, _ in deliveries:
+            reject_message(
+                channel, method, properties, error, requeue=not method.redelivered
+            )
+        return
+
+    color_documents = []
+    analysed = []
+    for (method, properties, _), document_id, trace in zip(
+        deliveries, document_ids, traces
+    ):
+        try:
+            document = documents.get(document_id)
+            image_data = (
+                None if document is None else image_store.load_image_data(document)
+            )
+            tracing.stamp(trace, "image_fetched")
+            color_data = analyse_image_data(document_id, image_data, trace)
+        except pika.exceptions.AMQPError:
+            # The channel is gone; the broker redelivers the unacknowledged batch
+            raise
+        except GridFSError as error:
+            # The stored file is gone; a redelivery cannot bring it back
+            reject_message(channel, method, properties, error)
+            continue
+        except PyMongoError as error:
+            reject_message(
+                channel, method, properties, error, requeue=not method.redelivered
+            )
+            continue
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # A poison image would fail again on every redelivery
+            reject_message(channel, method, properties, error)
+            continue
+        color_documents.append(color_data)
+        analysed.append((method, properties))
+
+    if color_documents:
+        save_batch(channel, analysed, color_documents)
+    logging.debug(
+        "Processed batch", extra={"sampled": True, "messages": len(deliveries)}
+    )
+
+
+def decode_deliveries(channel, deliveries):
+    """This function returns the deliveries whose body decodes, and their document ids.
+
+    Bodies that are not UTF-8 cannot be document ids and are dead-lettered.
+    """
+    decoded, document_ids = [], []
+    for method, properties, body in deliveries:
+        try:
+            document_ids.append(body.decode())
+        except UnicodeDecodeError as error:
+            reject_message(channel, method, properties, error)
+            continue
+        decoded.append((method, properties, body))
+    return decoded, document_ids
+
+
+def save_batch(channel, analysed, color_documents):
+    """This function stores a batch of Color documents, replies and acks them at once.
+
+    analysed holds the (method, properties) of each document. MongoDB errors
+    requeue the whole batch once.
+    """
+    color_collection = mongo_pool.get_db()["Color"]
+    try:
+        with metrics.DB_WRITE_SECONDS.labels("color_insert_many").time():
+            result = color_collection.insert_many(color_documents)
+    except PyMongoError as error:
+        for method, properties in analysed:
+            reject_message(
+                channel, method, properties, error, requeue=not method.redelivered
+            )
+        return
+    stored = time.time()
+    for (_, properties), color_data, color_id in zip(
+        analysed, color_documents, result.inserted_ids
+    ):
+        trace = color_data.get("trace")
+        tracing.stamp(trace, "color_stored", stored)
+        publish_color_id(channel, str(color_id), properties, trace)
+
+    channel.basic_ack(delivery_tag=analysed[-1][0].delivery_tag, multiple=True)
+
+
+def consume_batches(
+    channel, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT, on_processed=None
+):
+    """This function consumes messages in batches of up to batch_size.
+
+    A partial batch is processed once no message has arrived for batch_wait seconds.
+    on_processed, if given, is called with the size of every processed batch.
+    """
+    channel.basic_qos(prefetch_count=batch_size)
+    batch = []
+    for delivery in channel.consume(
+        queue=ML_CLIENT_QUEUE, inactivity_timeout=batch_wait
+    ):
+        if delivery[0] is not None:
+            batch.append(delivery)
+        if batch and (delivery[0] is None or len(batch) >= batch_size):
+            process_batch(channel, batch)
+            if on_processed is not None:
+                on_processed(len(batch))
+            batch = []
 
 
 def establish_connection():
@@ -119,27 +473,65 @@ def establish_connection():
             )
             return connection
         except pika.exceptions.AMQPConnectionError:
-            print("Connection to RabbitMQ failed. Retrying in 5 seconds...")
+            logging.warning("Connection to RabbitMQ failed. Retrying in 5 seconds...")
             time.sleep(5)
 
 
-def main():
-    """This function establishes connection with RabbitMQ and starts consuming messages."""
-    connection = establish_connection()
-    channel = connection.channel()
-
-    # Declare a queue for receiving messages from main.py
-    channel.queue_declare(queue="ml_client")
+def declare_topology(channel):
+    """This function declares the durable queues and the dead-letter exchange.
 
-    # Define a callback function to process incoming messages
-    channel.basic_consume(
-        queue="ml_client", on_message_callback=callback, auto_ack=True
+    It runs once per channel, before consuming starts.
+    """
+    channel.exchange_declare(
+        exchange=DEAD_LETTER_EXCHANGE, exchange_type="fanout", durable=True
+    )
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+    channel.queue_bind(queue=DEAD_LETTER_QUEUE, exchange=DEAD_LETTER_EXCHANGE)
+    channel.queue_declare(
+        queue=ML_CLIENT_QUEUE, durable=True, arguments=ML_CLIENT_QUEUE_ARGUMENTS
     )
+    channel.queue_declare(queue=REPLY_QUEUE, durable=True)
+
+
+def start_consumer(channel, on_processed=None):
+    """This function consumes analysis requests on channel until consuming stops.
+
+    on_processed, if given, is called with the number of messages handled each time.
+    """
+    declare_topology(channel)
+
+    if BATCH_SIZE > 1:
+        logging.info("Waiting for messages in batches of %d...", BATCH_SIZE)
+        consume_batches(channel, on_processed=on_processed)
+        return
+
+    def on_message(channel, method, properties, body):
+        callback(channel, method, properties, body)
+        if on_processed is not None:
+            on_processed(1)
+
+    # Messages are acknowledged by callback once their result is stored
+    channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+    channel.basic_consume(queue=ML_CLIENT_QUEUE, on_message_callback=on_message)
 
     # Start consuming messages from the queue
-    print("Waiting for messages...")
+    logging.info("Waiting for messages...")
     channel.start_consuming()
 
 
+def stop_consumer(channel):
+    """This function stops start_consumer; unacked prefetched messages are requeued."""
+    channel.stop_consuming()
+    channel.cancel()
+
+
+def main():
+    """This function establishes connection with RabbitMQ and starts consuming messages."""
+    json_logging.configure_logging("ml-client")
+    connection = establish_connection()
+    channel = connection.channel()
+    start_consumer(channel)
+
+
 if __name__ == "__main__":
     main()
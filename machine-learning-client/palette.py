@@ -0,0 +1,159 @@
+"""
+This module computes color palettes of decoded OpenCV (BGR) images.
+"""
+
+# pylint: disable=no-member
+
+import cv2
+import numpy as np
+
+SINGLE_COLOR_METHODS = ("mean", "median")
+HISTOGRAM_BITS = 5
+
+
+def _is_gray(image):
+    """This function tells whether an image has a single channel."""
+    return image.ndim == 2 or image.shape[2] == 1
+
+
+def mean_color(image):
+    """This function returns the mean RGB color of a gray, BGR or BGRA image.
+
+    cv2.mean reduces the uint8 pixels in place, so no float copy of the image is made.
+    This is exactly the center k-means converges to when K=1.
+    """
+    means = cv2.mean(image)
+    if _is_gray(image):
+        return np.array([means[0]] * 3)
+    return np.array(means[2::-1])
+
+
+def median_color(image):
+    """This function returns the per-channel median RGB color of a uint8 image.
+
+    The median is read off each channel's 256-bin histogram instead of sorting pixels.
+    """
+    channels = (0, 0, 0) if _is_gray(image) else (2, 1, 0)
+    color = []
+    for channel in channels:
+        histogram = cv2.calcHist([image], [channel], None, [256], [0, 256]).ravel()
+        cumulative = np.cumsum(histogram)
+        color.append(np.searchsorted(cumulative, cumulative[-1] / 2))
+    return np.array(color, dtype=np.float64)
+
+
+def dominant_color(image, method="mean"):
+    """This function returns the single dominant RGB color using a closed-form method."""
+    if method == "mean":
+        return mean_color(image)
+    if method == "median":
+        return median_color(image)
+    raise ValueError(
+        f"Unknown palette method {method!r}, expected one of {SINGLE_COLOR_METHODS}"
+    )
+
+
+def rgb_pixels(image):
+    """This function returns the image pixels as an (N, 3) uint8 RGB array."""
+    if _is_gray(image):
+        return np.repeat(image.reshape(-1, 1), 3, axis=1)
+    return image.reshape(-1, image.shape[2])[:, 2::-1]
+
+
+def cell_codes(pixels, bits):
+    """This function returns the histogram cell (RRRGGGBBB bits) of each RGB pixel."""
+    shift = 8 - bits
+    codes = (pixels[:, 0] >> shift).astype(np.int32) << (2 * bits)
+    codes |= (pixels[:, 1] >> shift).astype(np.int32) << bits
+    codes |= pixels[:, 2] >> shift
+    return codes
+
+
+def cell_centers(bits):
+    """This function returns the RGB color at the center of every histogram cell."""
+    levels = (np.arange(1 << bits) + 0.5) * (1 << (8 - bits))
+    red, green, blue = np.meshgrid(levels, levels, levels, indexing="ij")
+    return np.stack([red.ravel(), green.ravel(), blue.ravel()], axis=1)
+
+
+def color_histogram(image, bits=HISTOGRAM_BITS):
+    """This function bins the pixels into a 2**(3*bits)-cell RGB histogram.
+
+    Returns the mean RGB color and the pixel count of every occupied cell.
+    """
+    pixels = rgb_pixels(image)
+    codes = cell_codes(pixels, bits)
+    cells = 1 << (3 * bits)
+    counts = np.bincount(codes, minlength=cells)
+    occupied = np.flatnonzero(counts)
+    sums = np.stack(
+        [
+            np.bincount(codes, weights=pixels[:, channel], minlength=cells)[occupied]
+            for channel in range(3)
+        ],
+        axis=1,
+    )
+    counts = counts[occupied]
+    return sums / counts[:, np.newaxis], counts
+
+
+def _nearest_center(points, centers):
+    """This function labels each point with the index of its nearest center."""
+    return ((points[:, np.newaxis] - centers) ** 2).sum(axis=2).argmin(axis=1)
+
+
+def _kmeans_plus_plus(points, weights, clusters, rng):
+    """This function picks initial centers with weighted k-means++ seeding."""
+    centers = [points[rng.choice(len(points), p=weights / weights.sum())]]
+    distances = ((points - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, min(clusters, len(points))):
+        probabilities = weights * distances
+        if probabilities.sum() == 0:
+            break
+        center = points[rng.choice(len(points), p=probabilities / probabilities.sum())]
+        centers.append(center)
+        distances = np.minimum(distances, ((points - center) ** 2).sum(axis=1))
+    return np.array(centers, dtype=np.float64)
+
+
+def weighted_kmeans(points, weights, clusters, max_iterations=20, seed=0):
+    """This function runs k-means++ seeded Lloyd iterations on weighted points.
+
+    Returns the centers and the total weight of each cluster. Fewer than
+    `clusters` centers come back when there are fewer distinct points.
+    """
+    weights = weights.astype(np.float64)
+    centers = _kmeans_plus_plus(points, weights, clusters, np.random.default_rng(seed))
+
+    for _ in range(max_iterations):
+        labels = _nearest_center(points, centers)
+        cluster_weights = np.bincount(labels, weights=weights, minlength=len(centers))
+        occupied = cluster_weights > 0
+        updated = centers.copy()
+        for channel in range(points.shape[1]):
+            sums = np.bincount(
+                labels, weights=weights * points[:, channel], minlength=len(centers)
+            )
+            updated[occupied, channel] = sums[occupied] / cluster_weights[occupied]
+        converged = np.allclose(updated, centers, atol=0.5)
+        centers = updated
+        if converged:
+            break
+
+    labels = _nearest_center(points, centers)
+    cluster_weights = np.bincount(labels, weights=weights, minlength=len(centers))
+    return centers[cluster_weights > 0], cluster_weights[cluster_weights > 0]
+
+
+def kmeans_palette(image, colors, bits=HISTOGRAM_BITS, seed=0):
+    """This function clusters the pixels into up to `colors` colors.
+
+    k-means runs on the occupied cells of a color histogram weighted by their
+    pixel counts, so after sampling its cost no longer grows with image size.
+    Returns the RGB centers and the share of pixels in each cluster, both
+    sorted from the most to the least common color.
+    """
+    cell_colors, counts = color_histogram(image, bits)
+    centers, cluster_weights = weighted_kmeans(cell_colors, counts, colors, seed=seed)
+    order = np.argsort(cluster_weights)[::-1]
+    return centers[order], cluster_weights[order] / cluster_weights.sum()
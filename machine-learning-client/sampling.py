@@ -0,0 +1,61 @@
+"""
+This module bounds the number of pixels the palette step has to look at.
+"""
+
+# pylint: disable=no-member
+
+import math
+import cv2
+import numpy as np
+
+SAMPLING_MODES = ("none", "resize", "stride", "random")
+DEFAULT_PIXEL_BUDGET = 250_000
+
+
+def resize_to_budget(image, pixel_budget):
+    """This function area-resizes the image down to at most pixel_budget pixels."""
+    scale = math.sqrt(pixel_budget / (image.shape[0] * image.shape[1]))
+    width = max(1, int(image.shape[1] * scale))
+    height = max(1, int(image.shape[0] * scale))
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def stride_to_budget(image, pixel_budget):
+    """This function keeps every n-th row and column, returning a view without copying."""
+    height, width = image.shape[:2]
+    step = math.ceil(math.sqrt(height * width / pixel_budget))
+    while math.ceil(height / step) * math.ceil(width / step) > pixel_budget:
+        step += 1
+    return image[::step, ::step]
+
+
+def random_to_budget(image, pixel_budget, seed=0):
+    """This function draws pixel_budget pixels uniformly without replacement.
+
+    The result is shaped (pixel_budget, 1, channels) so it is still an image.
+    A fixed seed keeps the palette of a given image reproducible.
+    """
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    pixels = image.reshape(-1, channels)
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(len(pixels), size=pixel_budget, replace=False, shuffle=False)
+    indices.sort()  # gather in memory order
+    return pixels[indices].reshape(pixel_budget, 1, channels)
+
+
+def sample_pixels(image, mode="stride", pixel_budget=DEFAULT_PIXEL_BUDGET, seed=0):
+    """This function reduces an image to roughly pixel_budget pixels.
+
+    Images already within the budget, and mode "none", are returned unchanged.
+    """
+    if mode not in SAMPLING_MODES:
+        raise ValueError(
+            f"Unknown sampling mode {mode!r}, expected one of {SAMPLING_MODES}"
+        )
+    if mode == "none" or image.shape[0] * image.shape[1] <= pixel_budget:
+        return image
+    if mode == "resize":
+        return resize_to_budget(image, pixel_budget)
+    if mode == "stride":
+        return stride_to_budget(image, pixel_budget)
+    return random_to_budget(image, pixel_budget, seed)
@@ -0,0 +1,142 @@
+"""
+This module runs several ML client worker processes and supervises them.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import async_client
+import color_names
+import json_logging
+import metrics
+import mongo_pool
+import ml_client
+
+REPORT_INTERVAL = float(os.environ.get("ML_REPORT_INTERVAL", 30))
+SHUTDOWN_TIMEOUT = 10
+
+
+def worker_main(index, counter):
+    """This function is the body of one worker process.
+
+    Each worker opens its own AMQP connection and MongoDB pool. SIGTERM stops it
+    gracefully after the message in progress; SIGINT is left to the supervisor.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    json_logging.configure_logging("ml-client")  # the log writer thread is not forked
+    try:
+        mongo_pool.close_mongo_client()  # never share a pool across fork
+
+        connection = ml_client.establish_connection()
+        channel = connection.channel()
+
+        def request_stop(signum, frame):  # pylint: disable=unused-argument
+            connection.add_callback_threadsafe(lambda: ml_client.stop_consumer(channel))
+
+        signal.signal(signal.SIGTERM, request_stop)
+
+        def count(messages):
+            with counter.get_lock():
+                counter.value += messages
+
+        logging.info("Worker %d started", index, extra={"pid": os.getpid()})
+        ml_client.start_consumer(channel, on_processed=count)
+        connection.close()
+        logging.info("Worker %d stopped", index)
+    finally:
+        # Worker processes end in os._exit, which skips the atexit flush
+        json_logging.stop_logging()
+
+
+def start_worker(index, counter):
+    """This function starts one worker process."""
+    process = multiprocessing.Process(
+        target=worker_main, args=(index, counter), name=f"ml-worker-{index}"
+    )
+    process.start()
+    return process
+
+
+def throughput_report(counters, previous, elapsed):
+    """This function returns per-worker message rates since the previous report."""
+    totals = [counter.value for counter in counters]
+    rates = [(total - last) / elapsed for total, last in zip(totals, previous)]
+    return totals, rates
+
+
+def run_supervisor(workers=None, report_interval=REPORT_INTERVAL):
+    """This function runs `workers` processes (default one per core) until SIGINT/SIGTERM.
+
+    Workers that die are restarted, and per-worker throughput is printed every
+    report_interval seconds.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Build the color name index once so forked workers share it
+    color_names.get_index()
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: stop.set())
+
+    counters = [multiprocessing.Value("Q", 0) for _ in range(workers)]
+    processes = [start_worker(index, counters[index]) for index in range(workers)]
+    previous = [0] * workers
+    last_report = time.monotonic()
+
+    while not stop.wait(report_interval):
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                logging.warning(
+                    "Worker %d exited with %s, restarting", index, process.exitcode
+                )
+                metrics.mark_process_dead(process.pid)
+                processes[index] = start_worker(index, counters[index])
+        now = time.monotonic()
+        previous, rates = throughput_report(counters, previous, now - last_report)
+        last_report = now
+        logging.info(
+            "All workers: %.1f messages/s",
+            sum(rates),
+            extra={
+                "worker_rates": [round(rate, 1) for rate in rates],
+                "processed": previous,
+            },
+        )
+
+    logging.info("Stopping workers...")
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(SHUTDOWN_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        metrics.mark_process_dead(process.pid)
+    logging.info(
+        "Processed %d messages in total", sum(counter.value for counter in counters)
+    )
+
+
+def main():
+    """This function starts the supervisor with ML_WORKERS workers (default: CPU count).
+
+    With ML_CONSUMER=async, the single-process asyncio consumer runs instead.
+    Either way, metrics are served on METRICS_PORT (0 disables them).
+    """
+    json_logging.configure_logging("ml-client")
+    metrics.clear_multiprocess_dir()
+    metrics.start_server(
+        async_client.RABBITMQ_HOST,
+        [ml_client.ML_CLIENT_QUEUE, ml_client.DEAD_LETTER_QUEUE],
+    )
+    if os.environ.get("ML_CONSUMER", "blocking") == "async":
+        async_client.main()
+        return
+    run_supervisor(int(os.environ.get("ML_WORKERS", 0)) or None)
+
+
+if __name__ == "__main__":
+    main()
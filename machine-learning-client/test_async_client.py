@@ -0,0 +1,163 @@
+"""
+This module initializes the pytest test cases for async_client.py.
+"""
+
+import asyncio
+import concurrent.futures
+from unittest.mock import AsyncMock, MagicMock, patch
+import cv2
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+import async_client
+
+
+def make_jpeg(bgr):
+    """This function encodes a solid-color BGR test image as JPEG bytes."""
+    image = np.zeros((20, 20, 3), dtype=np.uint8)
+    image[:, :] = bgr
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+def make_consumer(image_document):
+    """This function builds an AsyncConsumer on mocked Motor and aio-pika objects."""
+    db = MagicMock()
+    db["Image"].find_one = AsyncMock(return_value=image_document)
+    db["Color"].insert_one = AsyncMock(return_value=MagicMock(inserted_id="color_id"))
+    channel = MagicMock()
+    channel.default_exchange.publish = AsyncMock()
+    with patch("async_client.AsyncIOMotorGridFSBucket"):
+        consumer = async_client.AsyncConsumer(
+            channel, db, concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        )
+    return consumer, db
+
+
+def make_message(body, redelivered=False):
+    """This function builds a mocked incoming message."""
+    return MagicMock(
+        body=body,
+        reply_to="amq.gen-reply",
+        correlation_id="job_id",
+        redelivered=redelivered,
+        ack=AsyncMock(),
+        nack=AsyncMock(),
+    )
+
+
+def test_handle_message_stores_replies_and_acks():
+    """This function tests the analysis, result write, reply and ack of one message."""
+    document_id = str(ObjectId())
+    consumer, db = make_consumer({"image_data": make_jpeg((0, 0, 255))})
+    message = make_message(document_id.encode())
+
+    asyncio.run(consumer.handle_message(message))
+
+    (color_data,), _ = db["Color"].insert_one.call_args
+    assert color_data["palette"][0]["name"] == "red"
+    assert color_data["image_id"] == ObjectId(document_id)
+    (reply,), kwargs = consumer.channel.default_exchange.publish.call_args
+    assert kwargs == {"routing_key": "amq.gen-reply"}
+    assert reply.body == b"color_id"
+    assert reply.correlation_id == "job_id"
+    message.ack.assert_awaited_once()
+    message.nack.assert_not_awaited()
+
+
+def test_handle_message_dead_letters_poison_image():
+    """This function tests that undecodable or unknown images are not requeued."""
+    consumer, db = make_consumer({"image_data": b"not an image"})
+    undecodable = make_message(str(ObjectId()).encode())
+    malformed = make_message(b"bad-id")
+
+    asyncio.run(consumer.handle_message(undecodable))
+    asyncio.run(consumer.handle_message(malformed))
+
+    undecodable.nack.assert_awaited_once_with(requeue=False)
+    malformed.nack.assert_awaited_once_with(requeue=False)
+    db["Color"].insert_one.assert_not_awaited()
+    # Each requester is told its job failed
+    replies = consumer.channel.default_exchange.publish.call_args_list
+    assert [reply.kwargs for reply in replies] == [{"routing_key": "amq.gen-reply"}] * 2
+    assert all(reply.args[0].headers.keys() == {"error"} for reply in replies)
+    assert all(reply.args[0].correlation_id == "job_id" for reply in replies)
+
+
+def test_handle_message_dead_letters_undecodable_body():
+    """This function tests that a non-UTF-8 body is rejected instead of failing the task."""
+    consumer, db = make_consumer(None)
+    message = make_message(b"\xff\xfe")
+
+    asyncio.run(consumer.handle_message(message))
+
+    message.nack.assert_awaited_once_with(requeue=False)
+    db["Image"].find_one.assert_not_awaited()
+
+
+def test_handle_message_requeues_once_on_mongo_error():
+    """This function tests that MongoDB errors requeue a message only once."""
+    consumer, db = make_consumer(None)
+    db["Image"].find_one.side_effect = AutoReconnect("down")
+    first = make_message(str(ObjectId()).encode())
+    second = make_message(str(ObjectId()).encode(), redelivered=True)
+
+    asyncio.run(consumer.handle_message(first))
+    asyncio.run(consumer.handle_message(second))
+
+    first.nack.assert_awaited_once_with(requeue=True)
+    second.nack.assert_awaited_once_with(requeue=False)
+    # Only the final rejection is answered
+    consumer.channel.default_exchange.publish.assert_awaited_once()
+
+
+def test_consume_overlaps_messages():
+    """This function tests that deliveries are handled concurrently and counted."""
+    consumer, _ = make_consumer(None)
+    started = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def handle_message(message):
+            started.append(message)
+            await gate.wait()
+
+        consumer.handle_message = handle_message
+        messages = MagicMock()
+        messages.__aenter__ = AsyncMock(return_value=messages)
+        messages.__aexit__ = AsyncMock(return_value=False)
+        messages.__aiter__.return_value = ["first", "second", "third"]
+        queue = MagicMock()
+        queue.iterator.return_value = messages
+        processed = []
+
+        await consumer.consume(queue, on_processed=processed.append)
+        await asyncio.sleep(0)
+        # All three are in flight before any has finished
+        assert started == ["first", "second", "third"]
+        gate.set()
+        await consumer.drain()
+        await asyncio.sleep(0)
+        return processed
+
+    assert asyncio.run(scenario()) == [1, 1, 1]
+
+
+def test_handle_message_traces_stages():
+    """This function tests that a traced job is stamped and its trace sent back."""
+    consumer, db = make_consumer({"image_data": make_jpeg((0, 0, 255))})
+    message = make_message(str(ObjectId()).encode())
+    message.headers = {"trace": {"trace_id": "abc", "timestamps": {"published": 1.0}}}
+
+    asyncio.run(consumer.handle_message(message))
+
+    (color_data,), _ = db["Color"].insert_one.call_args
+    assert set(color_data["trace"]["durations"]) == {
+        "queue",
+        "fetch",
+        "decode",
+        "palette",
+    }
+    (reply,), _ = consumer.channel.default_exchange.publish.call_args
+    assert reply.headers["trace"]["trace_id"] == "abc"
+    assert "color_stored" in reply.headers["trace"]["timestamps"]
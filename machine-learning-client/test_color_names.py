@@ -0,0 +1,29 @@
+"""
+This module initializes the pytest test cases for color_names.py.
+"""
+
+import numpy as np
+import color_names
+
+
+def test_exact_names_have_zero_distance():
+    """This function tests that CSS3 colors map to themselves."""
+    assert color_names.nearest_color_name((255, 0, 0)) == ("red", 0.0)
+    assert color_names.nearest_color_name((0, 128, 0)) == ("green", 0.0)
+
+
+def test_nearest_color_name():
+    """This function tests that off-palette colors get the nearest name."""
+    name, distance = color_names.nearest_color_name((250, 10, 5))
+    assert name == "red"
+    assert 0 < distance < 5
+
+
+def test_lookup_table_matches_brute_force():
+    """This function tests the lookup table against a search over every CSS3 color."""
+    index = color_names.get_index()
+    colors = np.random.default_rng(0).integers(0, 256, (2000, 3))
+    lab = color_names.rgb_to_lab(colors)
+    expected = np.sqrt(((lab[:, np.newaxis] - index.lab) ** 2).sum(axis=2)).min(axis=1)
+    distances = [index.nearest(color)[1] for color in colors]
+    assert np.allclose(distances, expected, atol=1e-3)
@@ -0,0 +1,56 @@
+"""
+This module initializes the pytest test cases for decoding.py.
+"""
+
+# pylint: disable=no-member
+
+import cv2
+import numpy as np
+import decoding
+
+
+def encode(height, width, extension=".jpg", bgr=(0, 0, 255)):
+    """This function encodes a solid-color BGR test image."""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :] = bgr
+    return cv2.imencode(extension, image)[1].tobytes()
+
+
+def test_jpeg_dimensions():
+    """This function tests reading the size from the JPEG header."""
+    assert decoding.jpeg_dimensions(encode(120, 200)) == (120, 200)
+    assert decoding.jpeg_dimensions(encode(120, 200, ".png")) is None
+    assert decoding.jpeg_dimensions(b"\xff\xd8\xff") is None
+    assert decoding.jpeg_dimensions(b"") is None
+
+
+def test_reduction_factor_keeps_budget():
+    """This function tests that the chosen scale keeps at least pixel_budget pixels."""
+    assert decoding.reduction_factor(3000, 4000, 250_000) == 4
+    assert decoding.reduction_factor(480, 640, 250_000) == 1
+    assert decoding.reduction_factor(3000, 4000, 10) == 8
+    assert decoding.reduction_factor(720, 1280, 250_000) == 1
+    assert decoding.reduction_factor(1440, 2560, 250_000) == 2
+
+
+def test_decode_image_reduces_jpeg():
+    """This function tests reduced JPEG decoding and full decoding otherwise."""
+    jpeg = encode(800, 1600)
+    reduced = decoding.decode_image(jpeg, pixel_budget=20_000)
+    assert reduced.shape == (100, 200, 3)
+    assert tuple(reduced[50, 100]) == tuple(
+        cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)[0, 0]
+    )
+    assert decoding.decode_image(jpeg).shape == (800, 1600, 3)
+    assert decoding.decode_image(encode(800, 1600, ".png"), 20_000).shape == (
+        800,
+        1600,
+        3,
+    )
+    assert decoding.decode_image(b"not an image", 20_000) is None
+
+
+def test_decode_image_empty_data():
+    """This function tests that empty data decodes to None instead of raising."""
+    assert decoding.decode_image(b"") is None
+    assert decoding.decode_image(b"", pixel_budget=20_000) is None
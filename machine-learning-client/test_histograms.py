@@ -0,0 +1,73 @@
+"""
+This module initializes the pytest test cases for histograms.py.
+"""
+
+import zlib
+import numpy as np
+import pytest
+from bson import Binary
+import histograms
+import palette
+
+
+def striped_image():
+    """This function builds a BGR image that is 3/4 blue and 1/4 red."""
+    image = np.zeros((40, 40, 3), dtype=np.uint8)
+    image[:30] = (255, 0, 0)
+    image[30:] = (0, 0, 255)
+    return image
+
+
+def test_compute_histogram_matches_cell_codes():
+    """This function tests that color and gray images are binned like cell_codes."""
+    image = np.random.default_rng(0).integers(0, 256, (30, 50, 3), dtype=np.uint8)
+    expected = np.bincount(
+        palette.cell_codes(palette.rgb_pixels(image), 4), minlength=4096
+    )
+    counts = histograms.compute_histogram(image)
+    assert counts.dtype == np.uint32
+    assert np.array_equal(counts, expected)
+
+    gray = np.full((10, 10), 128, dtype=np.uint8)
+    assert histograms.compute_histogram(gray)[(8 << 8) | (8 << 4) | 8] == 100
+
+
+def test_encode_decode_round_trip():
+    """This function tests that a stored histogram decodes to the same counts."""
+    counts = histograms.compute_histogram(striped_image())
+    field = histograms.encode_histogram(counts)
+    assert field["bits"] == 4
+    assert field["pixels"] == 1600
+    assert isinstance(field["counts"], Binary)
+    assert len(field["counts"]) < counts.nbytes
+    assert np.array_equal(histograms.decode_histogram(field), counts)
+
+
+def test_decode_histogram_rejects_bad_fields():
+    """This function tests unknown encodings and wrong cell counts."""
+    field = histograms.encode_histogram(np.zeros(4096, dtype=np.uint32))
+    with pytest.raises(ValueError):
+        histograms.decode_histogram({**field, "encoding": "raw"})
+    with pytest.raises(ValueError):
+        histograms.decode_histogram(
+            {**field, "counts": Binary(zlib.compress(b"\0" * 16))}
+        )
+
+
+def test_histogram_palette():
+    """This function tests the palette clustered from a stored histogram."""
+    counts = histograms.compute_histogram(striped_image())
+    centers, shares = histograms.histogram_palette(counts, 5)
+    # Colors come back as cell centers, within half a cell of the pixels
+    assert np.allclose(centers, [[0, 0, 255], [255, 0, 0]], atol=8)
+    assert np.allclose(shares, [0.75, 0.25])
+
+
+def test_histogram_similarity():
+    """This function tests identical, disjoint and overlapping histograms."""
+    counts = histograms.compute_histogram(striped_image())
+    red = histograms.compute_histogram(np.full((10, 10, 3), (0, 0, 255), np.uint8))
+    green = histograms.compute_histogram(np.full((5, 5, 3), (0, 255, 0), np.uint8))
+    assert histograms.histogram_similarity(counts, counts) == pytest.approx(1.0)
+    assert histograms.histogram_similarity(counts, red) == pytest.approx(0.25)
+    assert histograms.histogram_similarity(red, green) == 0.0
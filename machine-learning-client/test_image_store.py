@@ -0,0 +1,63 @@
+"""
+This module initializes the pytest test cases for image_store.py.
+"""
+
+import hashlib
+import io
+from unittest.mock import patch, MagicMock
+import pytest
+from bson import ObjectId
+import image_store
+
+
+def test_read_into_buffer():
+    """This function tests chunked reads into one buffer, including short streams."""
+    data = bytes(range(256)) * 4000
+    assert image_store.read_into_buffer(io.BytesIO(data), len(data)) == data
+    assert image_store.read_into_buffer(io.BytesIO(b"abc"), 10) == b"abc"
+
+
+def test_filesystem_store_round_trip(tmp_path):
+    """This function tests content-addressed writes, reads and deletes."""
+    store = image_store.FileSystemImageStore(str(tmp_path))
+    data = b"fake jpeg bytes" * 50000
+
+    ref, size = store.put(io.BytesIO(data))
+    again, _ = store.put(io.BytesIO(data))
+
+    assert ref == again == hashlib.sha256(data).hexdigest()
+    assert size == len(data)
+    assert store.read(ref) == data
+    assert sorted(path.name for path in tmp_path.rglob("*") if path.is_file()) == [ref]
+    store.delete(ref)
+    assert not list(path for path in tmp_path.rglob("*") if path.is_file())
+
+
+def test_gridfs_store_streams_chunks():
+    """This function tests that GridFS uploads are written chunk by chunk."""
+    with patch("image_store.gridfs.GridFSBucket") as mock_bucket:
+        store = image_store.GridFSImageStore(MagicMock())
+        grid_in = mock_bucket.return_value.open_upload_stream_with_id.return_value
+        grid_in.__enter__.return_value = grid_in
+        grid_in.length = image_store.CHUNK_SIZE + 1
+
+        ref, size = store.put(io.BytesIO(b"x" * (image_store.CHUNK_SIZE + 1)))
+
+    assert ObjectId.is_valid(ref)
+    assert size == image_store.CHUNK_SIZE + 1
+    assert grid_in.write.call_count == 2
+
+
+def test_load_image_data(tmp_path, monkeypatch):
+    """This function tests reading referenced and legacy inline images."""
+    monkeypatch.setenv("IMAGE_STORE_PATH", str(tmp_path))
+    ref, size = image_store.get_image_store("filesystem").put(io.BytesIO(b"stored"))
+    document = {"storage": "filesystem", "image_ref": ref, "size": size}
+    assert image_store.load_image_data(document) == b"stored"
+    assert image_store.load_image_data({"image_data": b"inline"}) == b"inline"
+
+
+def test_unknown_store():
+    """This function tests that an unknown store name is rejected."""
+    with pytest.raises(ValueError):
+        image_store.get_image_store("s3")
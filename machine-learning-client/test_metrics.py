@@ -0,0 +1,71 @@
+"""
+This module initializes the pytest test cases for metrics.py.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import patch
+import pika
+import metrics
+
+
+def test_observe_queue_wait():
+    """This function tests that queue wait is read from the published_at header."""
+    with patch("metrics.QUEUE_WAIT_SECONDS") as mock_histogram, patch(
+        "metrics.time.time", return_value=102.5
+    ):
+        metrics.observe_queue_wait(SimpleNamespace(headers={"published_at": 100.0}))
+        metrics.observe_queue_wait(SimpleNamespace(headers=None))
+        metrics.observe_queue_wait(SimpleNamespace(headers={"published_at": "x"}))
+        metrics.observe_queue_wait(None)
+    mock_histogram.observe.assert_called_once_with(2.5)
+
+
+def test_queue_depth_collector():
+    """This function tests that queue depths are asked of RabbitMQ at scrape time."""
+    collector = metrics.QueueDepthCollector("rabbitmq", ["ml_client", "ml_client.dead"])
+    assert not collector.describe()
+    with patch("metrics.pika.BlockingConnection") as mock_bc:
+        frame = mock_bc.return_value.channel.return_value.queue_declare.return_value
+        frame.method.message_count = 7
+        frame.method.consumer_count = 2
+        depth, consumers = list(collector.collect())
+    assert [sample.value for sample in depth.samples] == [7, 7]
+    assert consumers.samples[0].labels == {"queue": "ml_client"}
+    mock_bc.return_value.close.assert_called_once()
+
+
+def test_queue_depth_collector_without_broker():
+    """This function tests that an unreachable broker reports nothing."""
+    collector = metrics.QueueDepthCollector("rabbitmq", ["ml_client"])
+    with patch(
+        "metrics.pika.BlockingConnection",
+        side_effect=pika.exceptions.AMQPConnectionError,
+    ):
+        assert not list(collector.collect())
+
+
+def test_start_server(tmp_path, monkeypatch):
+    """This function tests that the sidecar serves the aggregated registry."""
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    with patch("metrics.start_http_server") as mock_start_http_server:
+        assert metrics.start_server("rabbitmq", ["ml_client"], port=0) is None
+        registry = metrics.start_server("rabbitmq", ["ml_client"], port=9100)
+    mock_start_http_server.assert_called_once_with(9100, registry=registry)
+    assert registry is not metrics.REGISTRY
+
+
+def test_clear_multiprocess_dir(tmp_path, monkeypatch):
+    """This function tests that metric files of earlier runs are removed."""
+    (tmp_path / "gauge_livesum_1.db").write_bytes(b"")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    metrics.clear_multiprocess_dir()
+    assert not list(tmp_path.iterdir())
+    with patch("metrics.multiprocess.mark_process_dead") as mock_mark_process_dead:
+        metrics.mark_process_dead(1234)
+    mock_mark_process_dead.assert_called_once_with(1234)
+
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+    metrics.clear_multiprocess_dir()
+    with patch("metrics.multiprocess.mark_process_dead") as mock_mark_process_dead:
+        metrics.mark_process_dead(1234)
+    mock_mark_process_dead.assert_not_called()
@@ -2,9 +2,15 @@
 This module initializes the pytest test cases for ml_client.py client.
 """
 
+import logging
 from unittest.mock import patch, MagicMock
+import cv2
 import numpy as np
+import pika
 from bson import ObjectId
+from gridfs.errors import NoFile
+from pymongo.errors import AutoReconnect
+import histograms
 import ml_client
 
 
@@ -19,27 +25,52 @@ def test_get_color_name():
     rgb = (255, 0, 0)
     assert ml_client.get_color_name(rgb) == "red"
 
+    # Colors without an exact CSS3 name get the nearest one
     rgb = (100, 100, 100)
-    assert ml_client.get_color_name(rgb) is None
+    assert ml_client.get_color_name(rgb) == "dimgray"
 
 
-@patch("ml_client.cv2.kmeans")
-def test_extract_color_palette(mock_kmeans):
+def test_extract_color_palette():
     """This function tests extract color palette function."""
-    mock_kmeans.return_value = (None, None, np.array([[255, 0, 0]], dtype=np.float32))
     image = np.zeros((100, 100, 3), dtype=np.uint8)
+    image[:, :] = (0, 0, 255)  # OpenCV images are BGR
     palette = ml_client.extract_color_palette(image)
-    assert np.array_equal(palette, np.array([255, 0, 0], dtype=np.float32))
+    assert np.array_equal(palette, np.array([255, 0, 0]))
 
 
-@patch("ml_client.MongoClient")
-def test_get_image_data_from_db(mock_mongo_client):
+def test_extract_color_palette_multi_color():
+    """This function tests that several colors return the most common cluster."""
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    image[:70] = (255, 0, 0)
+    palette = ml_client.extract_color_palette(image, colors=2)
+    assert np.allclose(palette, [0, 0, 255])
+
+
+def test_build_color_data():
+    """This function tests the Color document holds the mean color, palette and histogram."""
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    image[:75] = (0, 0, 255)  # OpenCV images are BGR
+    image[75:] = (255, 0, 0)
+    color_data = ml_client.build_color_data(image, colors=5)
+    assert color_data["rgb"] == [191, 0, 64]
+    assert color_data["hex"] == "#bf0040"
+    assert [color["hex"] for color in color_data["palette"]] == ["#ff0000", "#0000ff"]
+    assert [color["share"] for color in color_data["palette"]] == [0.75, 0.25]
+    assert color_data["name"] == "crimson"
+    assert color_data["name_distance"] > 0
+    assert color_data["palette"][0]["name"] == "red"
+    assert color_data["palette"][0]["name_distance"] == 0
+    counts = histograms.decode_histogram(color_data["histogram"])
+    assert len(counts) == 4096
+    assert counts.sum() == 100 * 100
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_get_image_data_from_db(mock_get_db):
     """This function tests get image data from db function."""
-    # Mock the MongoClient and its methods
+    # Mock the shared database and its collection
     mock_image_collection = MagicMock()
-    mock_db_client = MagicMock()
-    mock_mongo_client.return_value.__getitem__.return_value = mock_db_client
-    mock_db_client.__getitem__.return_value = mock_image_collection
+    mock_get_db.return_value.__getitem__.return_value = mock_image_collection
 
     # Mock the document to be returned by find_one
     mock_document = {
@@ -49,19 +80,18 @@ def test_get_image_data_from_db(mock_mongo_client):
     mock_image_collection.find_one.return_value = mock_document
 
     # Call get_image_data_from_db with a mock document_id
-    ml_client.get_image_data_from_db("605a698c80b5eaf424b1bb78")
+    image_data = ml_client.get_image_data_from_db("605a698c80b5eaf424b1bb78")
 
-    # Assert that the MongoClient was called
-    assert mock_mongo_client.called
+    # Assert that the pooled database was used
+    mock_get_db.return_value.__getitem__.assert_called_once_with("Image")
+    assert image_data == b"fake_image_data"
 
 
-@patch("ml_client.MongoClient")
-def test_save_color_data_to_db(mock_mongo_client):
+@patch("ml_client.mongo_pool.get_db")
+def test_save_color_data_to_db(mock_get_db):
     """This function tests save color data to db function."""
     mock_cc = MagicMock()
-    mock_mongo_client.return_value.__getitem__.return_value.__getitem__.return_value = (
-        mock_cc
-    )
+    mock_get_db.return_value.__getitem__.return_value = mock_cc
     mock_cc.insert_one.return_value.inserted_id = "some_color_id"
     cha = MagicMock()
     ml_client.channel = cha
@@ -71,10 +101,11 @@ def test_save_color_data_to_db(mock_mongo_client):
         cha, {"rgb": [255, 0, 0], "hex": "#FF0000", "name": "red"}
     )
 
-    cha.queue_declare.assert_called_once_with(queue="main")
-    cha.basic_publish.assert_called_once_with(
-        exchange="", routing_key="main", body="some_color_id"
-    )
+    cha.queue_declare.assert_not_called()
+    _, kwargs = cha.basic_publish.call_args
+    assert kwargs["routing_key"] == "main"
+    assert kwargs["body"] == "some_color_id"
+    assert kwargs["properties"].delivery_mode == 2
 
 
 # Test case for the establish_connection function
@@ -114,3 +145,412 @@ def test_main(mock_establish_connection):
 
     # Assert that start_consuming was called on the channel
     mock_channel.start_consuming.assert_called_once()
+    _, kwargs = mock_channel.basic_consume.call_args
+    assert kwargs.get("auto_ack", False) is False
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_save_color_data_to_db_replies_to_requester(mock_get_db):
+    """This function tests that replies go to reply_to with the correlation id."""
+    mock_cc = MagicMock()
+    mock_get_db.return_value.__getitem__.return_value = mock_cc
+    mock_cc.insert_one.return_value.inserted_id = "some_color_id"
+    cha = MagicMock()
+    properties = MagicMock(reply_to="amq.gen-reply", correlation_id="job_id")
+
+    ml_client.save_color_data_to_db(
+        cha, {"rgb": [255, 0, 0], "hex": "#FF0000", "name": "red"}, properties
+    )
+
+    cha.queue_declare.assert_not_called()
+    _, kwargs = cha.basic_publish.call_args
+    assert kwargs["routing_key"] == "amq.gen-reply"
+    assert kwargs["body"] == "some_color_id"
+    assert kwargs["properties"].correlation_id == "job_id"
+
+
+def make_jpeg(bgr):
+    """This function encodes a solid-color BGR test image as JPEG bytes."""
+    image = np.zeros((20, 20, 3), dtype=np.uint8)
+    image[:, :] = bgr
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_get_image_documents_from_db(mock_get_db):
+    """This function tests that many Image documents are fetched with one $in query."""
+    mock_image_collection = mock_get_db.return_value.__getitem__.return_value
+    first, second = ObjectId(), ObjectId()
+    first_document = {"_id": first, "image_data": b"first"}
+    second_document = {"_id": second, "image_data": b"second"}
+    mock_image_collection.find.return_value = [first_document, second_document]
+
+    documents = ml_client.get_image_documents_from_db(
+        [str(first), str(second), "bad-id"]
+    )
+
+    assert documents == {str(first): first_document, str(second): second_document}
+    (query,), _ = mock_image_collection.find.call_args
+    assert query == {"_id": {"$in": [first, second]}}
+
+
+@patch("ml_client.image_store.get_image_store")
+@patch("ml_client.mongo_pool.get_db")
+def test_get_image_data_from_store(mock_get_db, mock_get_image_store):
+    """This function tests that referenced images are read from their image store."""
+    mock_image_collection = mock_get_db.return_value.__getitem__.return_value
+    mock_image_collection.find_one.return_value = {
+        "_id": ObjectId("605a698c80b5eaf424b1bb78"),
+        "storage": "gridfs",
+        "image_ref": "605a698c80b5eaf424b1bb79",
+        "size": 5,
+    }
+    mock_get_image_store.return_value.read.return_value = bytearray(b"bytes")
+
+    image_data = ml_client.get_image_data_from_db("605a698c80b5eaf424b1bb78")
+
+    mock_get_image_store.assert_called_once_with("gridfs")
+    mock_get_image_store.return_value.read.assert_called_once_with(
+        "605a698c80b5eaf424b1bb79"
+    )
+    assert image_data == b"bytes"
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_process_batch(mock_get_db):
+    """This function tests bulk fetch, bulk insert, per-job replies and one bulk ack."""
+    red_id, missing_id = str(ObjectId()), str(ObjectId())
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find.return_value = [
+        {"_id": ObjectId(red_id), "image_data": make_jpeg((0, 0, 255))}
+    ]
+    collection.insert_many.return_value.inserted_ids = ["color_id"]
+    channel = MagicMock()
+    deliveries = [
+        (
+            MagicMock(delivery_tag=1),
+            MagicMock(reply_to="reply", correlation_id=red_id),
+            red_id.encode(),
+        ),
+        (
+            MagicMock(delivery_tag=2),
+            MagicMock(reply_to="reply", correlation_id=missing_id),
+            missing_id.encode(),
+        ),
+    ]
+
+    ml_client.process_batch(channel, deliveries)
+
+    collection.find.assert_called_once()
+    (documents,), _ = collection.insert_many.call_args
+    assert len(documents) == 1
+    assert documents[0]["palette"][0]["name"] == "red"
+    assert documents[0]["image_id"] == ObjectId(red_id)
+    assert documents[0]["created_at"].tzinfo is not None
+    _, kwargs = channel.basic_publish.call_args
+    assert kwargs["body"] == "color_id"
+    assert kwargs["properties"].correlation_id == red_id
+    channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=False)
+    channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+
+@patch("ml_client.image_store.get_image_store")
+@patch("ml_client.mongo_pool.get_db")
+def test_process_batch_dead_letters_missing_stored_files(
+    mock_get_db, mock_get_image_store
+):
+    """This function tests that an Image whose stored bytes are gone fails only its message."""
+    red_id, lost_id, lost_gridfs_id = (str(ObjectId()) for _ in range(3))
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find.return_value = [
+        {"_id": ObjectId(red_id), "image_data": make_jpeg((0, 0, 255))},
+        {"_id": ObjectId(lost_id), "storage": "filesystem", "image_ref": "lost"},
+        {"_id": ObjectId(lost_gridfs_id), "storage": "gridfs", "image_ref": "lost"},
+    ]
+    mock_get_image_store.return_value.read.side_effect = [
+        FileNotFoundError("lost"),
+        NoFile("lost"),
+    ]
+    collection.insert_many.return_value.inserted_ids = ["color_id"]
+    channel = MagicMock()
+    deliveries = [
+        (MagicMock(delivery_tag=tag), MagicMock(), document_id.encode())
+        for tag, document_id in enumerate([red_id, lost_id, lost_gridfs_id], 1)
+    ]
+
+    ml_client.process_batch(channel, deliveries)
+
+    assert [call.kwargs for call in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 2, "requeue": False},
+        {"delivery_tag": 3, "requeue": False},
+    ]
+    (documents,), _ = collection.insert_many.call_args
+    assert [document["image_id"] for document in documents] == [ObjectId(red_id)]
+    channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_process_batch_dead_letters_undecodable_images(mock_get_db):
+    """This function tests that empty or garbage image bytes fail only their own message."""
+    red_id, empty_id, garbage_id = (str(ObjectId()) for _ in range(3))
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find.return_value = [
+        {"_id": ObjectId(red_id), "image_data": make_jpeg((0, 0, 255))},
+        {"_id": ObjectId(empty_id), "image_data": b""},
+        {"_id": ObjectId(garbage_id), "image_data": b"not an image"},
+    ]
+    collection.insert_many.return_value.inserted_ids = ["color_id"]
+    channel = MagicMock()
+    deliveries = [
+        (MagicMock(delivery_tag=tag), MagicMock(), document_id.encode())
+        for tag, document_id in enumerate([red_id, empty_id, garbage_id], 1)
+    ]
+
+    ml_client.process_batch(channel, deliveries)
+
+    assert [call.kwargs for call in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 2, "requeue": False},
+        {"delivery_tag": 3, "requeue": False},
+    ]
+    channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_process_batch_requeues_once_on_mongo_error(mock_get_db):
+    """This function tests that a failed batch query requeues its messages only once."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find.side_effect = AutoReconnect("down")
+    channel = MagicMock()
+    deliveries = [
+        (MagicMock(delivery_tag=1, redelivered=False), MagicMock(), b"id"),
+        (MagicMock(delivery_tag=2, redelivered=True), MagicMock(), b"id"),
+    ]
+
+    ml_client.process_batch(channel, deliveries)
+
+    assert [call.kwargs for call in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 1, "requeue": True},
+        {"delivery_tag": 2, "requeue": False},
+    ]
+    channel.basic_ack.assert_not_called()
+
+
+def test_consume_batches_flushes_on_size_and_idle():
+    """This function tests that full batches and idle partial batches are processed."""
+    channel = MagicMock()
+    deliveries = [(MagicMock(delivery_tag=tag), MagicMock(), b"id") for tag in range(3)]
+    channel.consume.return_value = iter(
+        deliveries[:2] + [(None, None, None)] + deliveries[2:] + [(None, None, None)]
+    )
+    with patch("ml_client.process_batch") as mock_process_batch:
+        ml_client.consume_batches(channel, batch_size=2, batch_wait=0.01)
+
+    channel.basic_qos.assert_called_once_with(prefetch_count=2)
+    assert [call.args[1] for call in mock_process_batch.call_args_list] == [
+        deliveries[:2],
+        deliveries[2:],
+    ]
+
+
+def test_declare_topology():
+    """This function tests the durable queues and the dead-letter exchange."""
+    channel = MagicMock()
+    ml_client.declare_topology(channel)
+
+    channel.exchange_declare.assert_called_once_with(
+        exchange="ml_client.dlx", exchange_type="fanout", durable=True
+    )
+    channel.queue_bind.assert_called_once_with(
+        queue="ml_client.dead", exchange="ml_client.dlx"
+    )
+    channel.queue_declare.assert_any_call(
+        queue="ml_client",
+        durable=True,
+        arguments={"x-dead-letter-exchange": "ml_client.dlx"},
+    )
+    channel.queue_declare.assert_any_call(queue="main", durable=True)
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_callback_acks_after_saving(mock_get_db):
+    """This function tests that a message is acknowledged after its result is stored."""
+    document_id = str(ObjectId())
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.return_value = {"image_data": make_jpeg((0, 0, 255))}
+    collection.insert_one.return_value.inserted_id = "color_id"
+    channel = MagicMock()
+    channel.basic_ack.side_effect = lambda **kwargs: (
+        collection.insert_one.assert_called_once()
+    )
+
+    ml_client.callback(
+        channel, MagicMock(delivery_tag=7), MagicMock(), document_id.encode()
+    )
+
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    channel.basic_nack.assert_not_called()
+
+
+@patch("ml_client.metrics")
+@patch("ml_client.mongo_pool.get_db")
+def test_callback_records_metrics(mock_get_db, mock_metrics):
+    """This function tests that every stage of a message is timed."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.return_value = {"image_data": make_jpeg((0, 0, 255))}
+    properties = MagicMock(headers={"published_at": 0.0})
+
+    ml_client.callback(MagicMock(), MagicMock(), properties, str(ObjectId()).encode())
+
+    mock_metrics.observe_queue_wait.assert_called_once_with(properties)
+    mock_metrics.MESSAGES_IN_PROGRESS.track_inprogress.assert_called_once()
+    for histogram in ("MESSAGE_SECONDS", "DECODE_SECONDS", "PALETTE_SECONDS"):
+        getattr(mock_metrics, histogram).time.assert_called_once()
+    mock_metrics.DB_WRITE_SECONDS.labels.assert_called_once_with("color_insert")
+
+
+@patch("ml_client.metrics")
+@patch("ml_client.handle_batch")
+def test_process_batch_records_metrics(mock_handle_batch, mock_metrics):
+    """This function tests that every message of a batch is counted and timed."""
+    deliveries = [(MagicMock(), MagicMock(), b"id")] * 3
+    in_progress = mock_metrics.MESSAGES_IN_PROGRESS
+    mock_handle_batch.side_effect = lambda *args: in_progress.dec.assert_not_called()
+
+    ml_client.process_batch(MagicMock(), deliveries)
+
+    in_progress.inc.assert_called_once_with(3)
+    in_progress.dec.assert_called_once_with(3)
+    assert mock_metrics.MESSAGE_SECONDS.observe.call_count == 3
+
+
+def test_undecodable_bodies_are_dead_lettered():
+    """This function tests that non-UTF-8 bodies are rejected in single and batch mode."""
+    channel = MagicMock()
+    ml_client.callback(channel, MagicMock(delivery_tag=1), None, b"\xff\xfe")
+    with patch("ml_client.get_image_documents_from_db") as mock_get_documents:
+        ml_client.process_batch(
+            channel, [(MagicMock(delivery_tag=2), None, b"\xff\xfe")]
+        )
+
+    mock_get_documents.assert_not_called()
+    assert [call.kwargs for call in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 1, "requeue": False},
+        {"delivery_tag": 2, "requeue": False},
+    ]
+    channel.basic_ack.assert_not_called()
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_callback_dead_letters_poison_image(mock_get_db):
+    """This function tests that undecodable images are rejected without requeue."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.return_value = {"image_data": b"not an image"}
+    channel = MagicMock()
+
+    ml_client.callback(
+        channel, MagicMock(delivery_tag=7), MagicMock(), str(ObjectId()).encode()
+    )
+    ml_client.callback(channel, MagicMock(delivery_tag=8), MagicMock(), b"bad-id")
+
+    assert [call.kwargs for call in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 7, "requeue": False},
+        {"delivery_tag": 8, "requeue": False},
+    ]
+    channel.basic_ack.assert_not_called()
+    collection.insert_one.assert_not_called()
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_dead_lettered_job_gets_failure_reply(mock_get_db):
+    """This function tests that the requester hears about a job before it is dead-lettered."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.side_effect = AutoReconnect("down")
+    channel = MagicMock()
+    properties = MagicMock(reply_to="amq.gen-reply", correlation_id="job_id")
+    body = str(ObjectId()).encode()
+
+    # The first failure is requeued and retried, so nothing is sent yet
+    ml_client.callback(channel, MagicMock(redelivered=False), properties, body)
+    channel.basic_publish.assert_not_called()
+    ml_client.callback(channel, MagicMock(redelivered=True), properties, body)
+
+    assert [name for name, _, _ in channel.mock_calls] == [
+        "basic_nack",
+        "basic_publish",
+        "basic_nack",
+    ]
+    _, kwargs = channel.basic_publish.call_args
+    assert kwargs["routing_key"] == "amq.gen-reply"
+    assert kwargs["body"] == b""
+    assert kwargs["properties"].correlation_id == "job_id"
+    assert kwargs["properties"].headers == {"error": "down"}
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_callback_requeues_once_on_mongo_error(mock_get_db):
+    """This function tests that MongoDB errors requeue a message only once."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.side_effect = AutoReconnect("down")
+    channel = MagicMock()
+    body = str(ObjectId()).encode()
+
+    ml_client.callback(
+        channel, MagicMock(delivery_tag=1, redelivered=False), None, body
+    )
+    ml_client.callback(channel, MagicMock(delivery_tag=2, redelivered=True), None, body)
+
+    assert [call.kwargs for call in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 1, "requeue": True},
+        {"delivery_tag": 2, "requeue": False},
+    ]
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_callback_traces_stages(mock_get_db):
+    """This function tests that a traced job is stamped and its trace sent back."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.return_value = {"image_data": make_jpeg((0, 0, 255))}
+    collection.insert_one.return_value.inserted_id = "color_id"
+    channel = MagicMock()
+    properties = pika.BasicProperties(
+        reply_to="amq.gen-reply",
+        correlation_id="job_id",
+        headers={"trace": {"trace_id": "abc", "timestamps": {"published": 1.0}}},
+    )
+
+    ml_client.callback(channel, MagicMock(), properties, str(ObjectId()).encode())
+
+    (color_data,), _ = collection.insert_one.call_args
+    assert color_data["trace"]["trace_id"] == "abc"
+    assert list(color_data["trace"]["durations"]) == [
+        "queue",
+        "fetch",
+        "decode",
+        "palette",
+    ]
+    reply = channel.basic_publish.call_args.kwargs["properties"]
+    assert reply.correlation_id == "job_id"
+    assert list(reply.headers["trace"]["timestamps"])[-1] == "color_stored"
+
+
+def test_untraced_reply_has_no_headers():
+    """This function tests that replies to untraced jobs carry no headers."""
+    channel = MagicMock()
+    properties = pika.BasicProperties(reply_to="amq.gen-reply", correlation_id="job")
+    ml_client.publish_color_id(channel, "color_id", properties)
+    assert channel.basic_publish.call_args.kwargs["properties"].headers is None
+
+
+@patch("ml_client.mongo_pool.get_db")
+def test_callback_logs_processed_message(mock_get_db, caplog):
+    """This function tests the sampled debug line of a processed message."""
+    collection = mock_get_db.return_value.__getitem__.return_value
+    collection.find_one.return_value = {"image_data": make_jpeg((0, 0, 255))}
+    document_id = str(ObjectId())
+    caplog.set_level(logging.DEBUG)
+
+    ml_client.callback(MagicMock(), MagicMock(), MagicMock(), document_id.encode())
+
+    (record,) = [r for r in caplog.records if r.msg == "Message processed"]
+    assert record.document_id == document_id
+    assert record.elapsed_ms > 0
@@ -0,0 +1,28 @@
+"""
+This module initializes the pytest test cases for mongo_pool.py.
+"""
+
+from unittest.mock import patch
+import mongo_pool
+
+
+def test_get_mongo_client_is_shared(monkeypatch):
+    """This function tests that one pooled client is built from the environment."""
+    monkeypatch.setenv("MONGODB_URI", "mongodb://example:27017/")
+    monkeypatch.setenv("MONGODB_MAX_POOL_SIZE", "7")
+    mongo_pool.close_mongo_client()
+    with patch("mongo_pool.MongoClient") as mock_mongo_client:
+        first = mongo_pool.get_mongo_client()
+        second = mongo_pool.get_mongo_client()
+        mongo_pool.close_mongo_client()
+
+    assert first is second
+    mock_mongo_client.assert_called_once_with("mongodb://example:27017/", maxPoolSize=7)
+    mock_mongo_client.return_value.close.assert_called_once()
+
+
+def test_get_db():
+    """This function tests that get_db returns the CAE database of the shared client."""
+    with patch("mongo_pool.get_mongo_client") as mock_get_mongo_client:
+        mongo_pool.get_db()
+    mock_get_mongo_client.return_value.__getitem__.assert_called_once_with("CAE")
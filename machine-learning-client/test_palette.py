@@ -0,0 +1,81 @@
+"""
+This module initializes the pytest test cases for palette.py.
+"""
+
+# pylint: disable=redefined-outer-name
+
+import cv2
+import numpy as np
+import pytest
+import palette
+
+
+@pytest.fixture
+def striped_image():
+    """This function builds a BGR image that is 3/4 blue and 1/4 red."""
+    image = np.zeros((40, 40, 3), dtype=np.uint8)
+    image[:30] = (255, 0, 0)
+    image[30:] = (0, 0, 255)
+    return image
+
+
+def test_mean_color_matches_single_cluster_kmeans(striped_image):
+    """This function tests that the mean equals the K=1 k-means center."""
+    pixels = np.float32(cv2.cvtColor(striped_image, cv2.COLOR_BGR2RGB)).reshape(-1, 3)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, 0.1)
+    _, _, centers = cv2.kmeans(pixels, 1, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+    assert np.allclose(palette.mean_color(striped_image), centers[0], atol=1e-3)
+
+
+def test_median_color(striped_image):
+    """This function tests the histogram median picks the majority color."""
+    assert np.array_equal(palette.median_color(striped_image), [0, 0, 255])
+
+
+def test_dominant_color_gray_and_alpha():
+    """This function tests single-channel and BGRA inputs."""
+    gray = np.full((10, 10), 128, dtype=np.uint8)
+    assert np.array_equal(palette.dominant_color(gray), [128, 128, 128])
+    assert np.array_equal(palette.dominant_color(gray, "median"), [128, 128, 128])
+
+    bgra = np.zeros((10, 10, 4), dtype=np.uint8)
+    bgra[:, :] = (0, 255, 0, 10)
+    assert np.array_equal(palette.dominant_color(bgra), [0, 255, 0])
+
+
+def test_dominant_color_unknown_method(striped_image):
+    """This function tests that an unknown method is rejected."""
+    with pytest.raises(ValueError):
+        palette.dominant_color(striped_image, "mode")
+
+
+def test_kmeans_palette(striped_image):
+    """This function tests multi-color clusters are sorted by pixel share."""
+    centers, shares = palette.kmeans_palette(striped_image, 2)
+    assert np.allclose(centers, [[0, 0, 255], [255, 0, 0]])
+    assert np.allclose(shares, [0.75, 0.25])
+
+
+def test_color_histogram_counts_every_pixel(striped_image):
+    """This function tests that histogram cells keep exact colors and counts."""
+    cell_colors, counts = palette.color_histogram(striped_image)
+    assert counts.sum() == striped_image.shape[0] * striped_image.shape[1]
+    assert sorted(map(tuple, cell_colors.tolist())) == [(0, 0, 255), (255, 0, 0)]
+
+
+def test_kmeans_palette_returns_fewer_colors_for_flat_image():
+    """This function tests that a single-color image yields a single cluster."""
+    image = np.full((20, 20, 3), 200, dtype=np.uint8)
+    centers, shares = palette.kmeans_palette(image, 5)
+    assert np.allclose(centers, [[200, 200, 200]])
+    assert np.allclose(shares, [1.0])
+
+
+def test_cell_codes_and_centers():
+    """This function tests that a pixel's cell center lies in the same cell."""
+    pixels = np.array([[0, 0, 0], [255, 255, 255], [200, 100, 50]], dtype=np.uint8)
+    codes = palette.cell_codes(pixels, 4)
+    assert codes.tolist() == [0, 4095, (12 << 8) | (6 << 4) | 3]
+    centers = palette.cell_centers(4)
+    assert centers.shape == (4096, 3)
+    assert np.array_equal(palette.cell_codes(centers[codes].astype(np.uint8), 4), codes)
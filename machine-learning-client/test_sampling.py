@@ -0,0 +1,44 @@
+"""
+This module initializes the pytest test cases for sampling.py.
+"""
+
+import numpy as np
+import pytest
+import sampling
+
+
+def test_sample_pixels_within_budget_is_unchanged():
+    """This function tests that small images are not sampled."""
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    for mode in sampling.SAMPLING_MODES:
+        assert sampling.sample_pixels(image, mode, pixel_budget=100) is image
+
+
+@pytest.mark.parametrize("mode", ["resize", "stride", "random"])
+def test_sample_pixels_respects_budget(mode):
+    """This function tests that every mode bounds the number of pixels."""
+    image = np.random.default_rng(1).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    sample = sampling.sample_pixels(image, mode, pixel_budget=1000)
+    assert sample.shape[0] * sample.shape[1] <= 1000
+    assert sample.shape[2] == 3
+    assert sample.dtype == np.uint8
+
+
+def test_stride_is_a_view():
+    """This function tests that strided sampling does not copy pixels."""
+    image = np.zeros((300, 400, 3), dtype=np.uint8)
+    assert np.shares_memory(sampling.sample_pixels(image, "stride", 1000), image)
+
+
+def test_random_is_reproducible():
+    """This function tests that the fixed seed makes random sampling deterministic."""
+    image = np.random.default_rng(2).integers(0, 256, (200, 200, 3), dtype=np.uint8)
+    first = sampling.sample_pixels(image, "random", 500, seed=7)
+    second = sampling.sample_pixels(image, "random", 500, seed=7)
+    assert np.array_equal(first, second)
+
+
+def test_unknown_mode():
+    """This function tests that an unknown sampling mode is rejected."""
+    with pytest.raises(ValueError):
+        sampling.sample_pixels(np.zeros((2, 2, 3), dtype=np.uint8), "bogus")
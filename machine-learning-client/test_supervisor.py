@@ -0,0 +1,98 @@
+"""
+This module initializes the pytest test cases for supervisor.py.
+"""
+
+import multiprocessing
+import signal
+from unittest.mock import patch, MagicMock
+import pytest
+import supervisor
+
+
+def test_throughput_report():
+    """This function tests per-worker rates since the previous report."""
+    counters = [multiprocessing.Value("Q", 30), multiprocessing.Value("Q", 10)]
+    totals, rates = supervisor.throughput_report(counters, [10, 10], 2.0)
+    assert totals == [30, 10]
+    assert rates == [10.0, 0.0]
+
+
+@patch("supervisor.json_logging")
+@patch("supervisor.signal.signal")
+@patch("supervisor.ml_client")
+def test_worker_main_counts_and_stops_gracefully(
+    mock_ml_client, mock_signal, mock_json_logging
+):
+    """This function tests that a worker counts messages and stops on SIGTERM."""
+    counter = multiprocessing.Value("Q", 0)
+    mock_ml_client.start_consumer.side_effect = (
+        lambda channel, on_processed: on_processed(3)
+    )
+
+    supervisor.worker_main(0, counter)
+
+    assert counter.value == 3
+    connection = mock_ml_client.establish_connection.return_value
+    connection.close.assert_called_once()
+
+    handlers = {call.args[0]: call.args[1] for call in mock_signal.call_args_list}
+    assert handlers[signal.SIGINT] == signal.SIG_IGN
+    handlers[signal.SIGTERM](signal.SIGTERM, None)
+    (stop,), _ = connection.add_callback_threadsafe.call_args
+    stop()
+    mock_ml_client.stop_consumer.assert_called_once_with(
+        connection.channel.return_value
+    )
+    mock_json_logging.stop_logging.assert_called_once()
+
+
+@patch("supervisor.json_logging")
+@patch("supervisor.signal.signal")
+@patch("supervisor.ml_client")
+def test_worker_main_flushes_logs_when_it_fails(
+    mock_ml_client, mock_signal, mock_json_logging
+):  # pylint: disable=unused-argument
+    """This function tests that a failing worker still writes out its queued log records."""
+    mock_ml_client.start_consumer.side_effect = RuntimeError("consumer failed")
+    with pytest.raises(RuntimeError):
+        supervisor.worker_main(0, multiprocessing.Value("Q", 0))
+    mock_json_logging.stop_logging.assert_called_once()
+
+
+@patch("supervisor.signal.signal")
+@patch("supervisor.threading.Event")
+@patch("supervisor.start_worker")
+def test_run_supervisor_restarts_and_shuts_down(
+    mock_start_worker, mock_event, mock_signal
+):  # pylint: disable=unused-argument
+    """This function tests restarting dead workers and terminating all on stop."""
+    dead, alive, replacement = MagicMock(), MagicMock(), MagicMock()
+    dead.is_alive.return_value = False
+    alive.is_alive.return_value = True
+    replacement.is_alive.return_value = False
+    mock_start_worker.side_effect = [dead, alive, replacement]
+    mock_event.return_value.wait.side_effect = [False, True]
+
+    supervisor.run_supervisor(workers=2, report_interval=0)
+
+    assert mock_start_worker.call_count == 3
+    alive.terminate.assert_called_once()
+    replacement.terminate.assert_called_once()
+    dead.terminate.assert_not_called()
+
+
+@patch("supervisor.run_supervisor")
+@patch("supervisor.async_client.main")
+@patch("supervisor.metrics")
+def test_main_serves_metrics(
+    mock_metrics, mock_async_main, mock_run_supervisor, monkeypatch
+):
+    """This function tests that metrics are served for either consumer."""
+    monkeypatch.setenv("ML_CONSUMER", "async")
+    supervisor.main()
+    mock_async_main.assert_called_once()
+    mock_run_supervisor.assert_not_called()
+    mock_metrics.clear_multiprocess_dir.assert_called_once()
+    mock_metrics.start_server.assert_called_once_with(
+        "rabbitmq", ["ml_client", "ml_client.dead"]
+    )
@@ -0,0 +1,68 @@
+"""
+This module initializes the pytest test cases for tracing.py.
+"""
+
+from unittest.mock import patch
+import tracing
+
+
+def test_trace_round_trip_through_headers():
+    """This function tests that a stamped trace survives AMQP headers."""
+    with patch("tracing.time.time", return_value=10.0):
+        trace = tracing.new_trace()
+    tracing.stamp(trace, "image_stored", 10.25)
+    tracing.stamp(None, "published")  # untraced jobs are ignored
+
+    headers = tracing.to_headers(trace, {"published_at": 10.5})
+    received = tracing.from_headers(headers)
+
+    assert headers["published_at"] == 10.5
+    assert received == trace
+    assert received["timestamps"] is not trace["timestamps"]
+    assert tracing.to_headers(None) == {}
+
+
+def test_from_headers_without_trace():
+    """This function tests that missing or malformed traces are ignored."""
+    assert tracing.from_headers(None) is None
+    assert tracing.from_headers({}) is None
+    assert tracing.from_headers({"trace": "abc"}) is None
+    assert tracing.from_headers({"trace": {"trace_id": "abc"}}) is None
+
+
+def test_to_document_computes_stage_durations():
+    """This function tests that only stages with both events stamped are measured."""
+    trace = {
+        "trace_id": "abc",
+        "timestamps": {"received": 1.0, "image_stored": 1.5, "consumed": 3.0},
+    }
+    document = tracing.to_document(trace)
+    assert document["durations"] == {"save_image": 0.5}
+    assert document["timestamps"] == trace["timestamps"]
+
+
+def test_stage_report():
+    """This function tests per-stage percentiles and the slowest jobs first."""
+    traces = [
+        {"trace_id": str(index), "durations": {"queue": index / 10, "decode": 0.01}}
+        for index in range(1, 11)
+    ]
+    traces.append({"trace_id": "untraced"})
+
+    report = tracing.stage_report(traces, slowest=2)
+
+    assert report["traces"] == 10
+    assert [stage["stage"] for stage in report["stages"]] == ["queue", "decode"]
+    queue = report["stages"][0]
+    assert queue["count"] == 10
+    assert queue["p50_ms"] == 600
+    assert queue["max_ms"] == 1000
+    assert [job["trace_id"] for job in report["slowest"]] == ["10", "9"]
+    assert report["slowest"][0]["slowest_stage"] == "queue"
+
+
+def test_log_fields():
+    """This function tests that a trace becomes flat log fields in milliseconds."""
+    trace = {"trace_id": "abc", "timestamps": {"decoded": 1.0, "analysed": 1.25}}
+    assert tracing.log_fields(trace) == {"trace_id": "abc", "palette_ms": 250.0}
+    assert not tracing.log_fields(None)
@@ -0,0 +1,135 @@
+"""
+This module traces capture jobs through both services.
+
+A trace is {"trace_id": <hex>, "timestamps": {<event>: <epoch seconds>}}. The
+web app starts it in capture(), it travels to the ML client and back in the
+"trace" AMQP header, and each service stamps the events it sees. The Color
+document keeps the finished trace with the duration of every stage.
+"""
+
+import time
+import uuid
+
+# (stage, start event, end event), in the order a job goes through them
+STAGES = (
+    ("save_image", "received", "image_stored"),
+    ("dispatch", "image_stored", "published"),
+    ("queue", "published", "consumed"),
+    ("fetch", "consumed", "image_fetched"),
+    ("decode", "image_fetched", "decoded"),
+    ("palette", "decoded", "analysed"),
+    ("write_back", "analysed", "color_stored"),
+    ("reply", "color_stored", "reply_received"),
+)
+TRACE_HEADER = "trace"
+
+
+def new_trace():
+    """This function starts a trace at the "received" event."""
+    return {"trace_id": uuid.uuid4().hex, "timestamps": {"received": time.time()}}
+
+
+def stamp(trace, event, when=None):
+    """This function records when an event of a trace happened; no-op without a trace."""
+    if trace is not None:
+        trace["timestamps"][event] = time.time() if when is None else when
+
+
+def from_headers(headers):
+    """This function returns the trace carried in AMQP headers, or None."""
+    if not isinstance(headers, dict):
+        return None
+    trace = headers.get(TRACE_HEADER)
+    if not isinstance(trace, dict) or not isinstance(trace.get("timestamps"), dict):
+        return None
+    return {
+        "trace_id": str(trace.get("trace_id")),
+        "timestamps": dict(trace["timestamps"]),
+    }
+
+
+def to_headers(trace, headers=None):
+    """This function adds a trace to AMQP headers (a new dict if headers is None)."""
+    headers = {} if headers is None else headers
+    if trace is not None:
+        headers[TRACE_HEADER] = {
+            "trace_id": trace["trace_id"],
+            "timestamps": trace["timestamps"],
+        }
+    return headers
+
+
+def durations(timestamps):
+    """This function returns the seconds spent in each stage whose events were stamped."""
+    return {
+        stage: max(0.0, timestamps[end] - timestamps[start])
+        for stage, start, end in STAGES
+        if start in timestamps and end in timestamps
+    }
+
+
+def to_document(trace):
+    """This function returns the trace as stored on a Color document."""
+    return {
+        "trace_id": trace["trace_id"],
+        "timestamps": dict(trace["timestamps"]),
+        "durations": durations(trace["timestamps"]),
+    }
+
+
+def log_fields(trace):
+    """This function returns the id and stage durations (ms) of a trace as log fields."""
+    if trace is None:
+        return {}
+    fields = {"trace_id": trace["trace_id"]}
+    for stage, seconds in durations(trace["timestamps"]).items():
+        fields[f"{stage}_ms"] = seconds * 1000
+    return fields
+
+
+def percentile_ms(ordered, fraction):
+    """This function returns a percentile of sorted durations (seconds) in milliseconds."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+
+def stage_report(traces, slowest=10):
+    """This function summarizes stored traces: per-stage percentiles and the slowest jobs.
+
+    Durations are reported in milliseconds; stages are listed in pipeline order.
+    """
+    samples = {stage: [] for stage, _, _ in STAGES}
+    jobs = []
+    for trace in traces:
+        stage_durations = trace.get("durations") or {}
+        for stage, seconds in stage_durations.items():
+            if stage in samples:
+                samples[stage].append(seconds)
+        if stage_durations:
+            slowest_stage = max(stage_durations, key=stage_durations.get)
+            jobs.append(
+                {
+                    "trace_id": trace.get("trace_id"),
+                    "job_id": trace.get("job_id"),
+                    "total_ms": sum(stage_durations.values()) * 1000,
+                    "slowest_stage": slowest_stage,
+                    "slowest_stage_ms": stage_durations[slowest_stage] * 1000,
+                }
+            )
+
+    stages = []
+    for stage, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        stages.append(
+            {
+                "stage": stage,
+                "count": len(values),
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": percentile_ms(values, 0.50),
+                "p95_ms": percentile_ms(values, 0.95),
+                "max_ms": values[-1] * 1000,
+            }
+        )
+    jobs.sort(key=lambda job: job["total_ms"], reverse=True)
+    return {"traces": len(jobs), "stages": stages, "slowest": jobs[:slowest]}
@@ -0,0 +1,309 @@
+"""
+This module manages the web app's RabbitMQ request/reply messaging with ml_client.py.
+"""
+
+# pylint: disable=global-statement
+
+import logging
+import os
+import queue
+import threading
+import time
+import pika
+import tracing
+
+RABBITMQ_HOST = "rabbitmq"
+ML_CLIENT_QUEUE = "ml_client"
+# Must match ml_client.py's declaration of the durable ml_client queue
+ML_CLIENT_QUEUE_ARGUMENTS = {"x-dead-letter-exchange": "ml_client.dlx"}
+PERSISTENT_DELIVERY_MODE = 2
+# Must match ml_client.py: replies to dead-lettered jobs carry their error in this header
+ERROR_HEADER = "error"
+DEFAULT_PUBLISHER_POOL_SIZE = 8
+PUBLISH_ATTEMPTS = 2
+# Seconds a publish waits for a pooled channel when all of them are in use
+DEFAULT_ACQUIRE_TIMEOUT = 5
+
+_PUBLISHER = None
+_PUBLISHER_LOCK = threading.Lock()
+
+
+class PublishError(Exception):
+    """This exception is raised when a message could not be handed to RabbitMQ."""
+
+
+def declare_topology(channel):
+    """This function declares the queues the web app publishes to."""
+    channel.queue_declare(
+        queue=ML_CLIENT_QUEUE, durable=True, arguments=ML_CLIENT_QUEUE_ARGUMENTS
+    )
+
+
+class PublisherPool:
+    """This class publishes over a pool of long-lived channels, one per connection.
+
+    pika connections are not thread-safe, so every pooled channel has its own
+    connection and is lent to one thread at a time. Queues are declared once per
+    connection and, with confirm=True, every publish waits for the broker's ack.
+    Channels that fail are dropped and the publish is retried on a fresh one.
+    A publish that finds no free channel within acquire_timeout raises PublishError.
+    """
+
+    def __init__(
+        self,
+        host=RABBITMQ_HOST,
+        size=DEFAULT_PUBLISHER_POOL_SIZE,
+        confirm=True,
+        acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT,
+    ):
+        self.host = host
+        self.size = size
+        self.confirm = confirm
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        # Notified whenever a channel is returned or a slot is freed
+        self._available = threading.Condition()
+
+    def _open_channel(self):
+        """This function opens a connection and channel with the topology declared."""
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host))
+        try:
+            channel = connection.channel()
+            declare_topology(channel)
+            if self.confirm:
+                channel.confirm_delivery()
+        except BaseException:
+            connection.close()
+            raise
+        return connection, channel
+
+    def _take(self, deadline):
+        """This function returns an idle channel, or None after reserving a slot for a new one.
+
+        It waits for a channel or a free slot until deadline (time.monotonic()).
+        """
+        with self._available:
+            while True:
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    pass
+                if self._created < self.size:
+                    self._created += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PublishError(
+                        f"No publisher channel free within {self.acquire_timeout}s"
+                    )
+                self._available.wait(remaining)
+
+    def _acquire(self):
+        """This function borrows an open channel, opening one while below size."""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            pooled = self._take(deadline)
+            if pooled is None:
+                try:
+                    return self._open_channel()
+                except BaseException:
+                    self._free_slot()
+                    raise
+            connection, channel = pooled
+            # Serve heartbeats of the idle connection and notice if it was closed
+            try:
+                connection.process_data_events(0)
+            except pika.exceptions.AMQPError:
+                pass
+            if channel.is_open:
+                return pooled
+            self._discard(pooled)
+
+    def _release(self, pooled):
+        """This function returns a healthy channel to the pool."""
+        with self._available:
+            self._idle.put(pooled)
+            self._available.notify()
+
+    def _free_slot(self):
+        """This function gives up a channel slot and wakes one waiting publish."""
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, pooled):
+        """This function closes a broken channel and frees its slot."""
+        _close_quietly(pooled[0])
+        self._free_slot()
+
+    def publish(self, routing_key, body, properties=None):
+        """This function publishes one message, retrying once on a fresh channel."""
+        error = None
+        for _ in range(PUBLISH_ATTEMPTS):
+            try:
+                pooled = self._acquire()
+            except pika.exceptions.AMQPError as acquire_error:
+                error = acquire_error
+                continue
+            try:
+                pooled[1].basic_publish(
+                    exchange="",
+                    routing_key=routing_key,
+                    body=body,
+                    properties=properties,
+                )
+            except pika.exceptions.AMQPError as publish_error:
+                self._discard(pooled)
+                error = publish_error
+                continue
+            self._release(pooled)
+            return
+        raise PublishError(f"Could not publish to {routing_key!r}: {error!r}")
+
+    def close(self):
+        """This function closes all idle pooled connections."""
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(pooled)
+
+
+def get_publisher():
+    """This function returns the process-wide PublisherPool, creating it on first use.
+
+    RABBITMQ_PUBLISHER_POOL_SIZE sets the number of pooled channels.
+    """
+    global _PUBLISHER
+    if _PUBLISHER is None:
+        with _PUBLISHER_LOCK:
+            if _PUBLISHER is None:
+                _PUBLISHER = PublisherPool(
+                    size=int(
+                        os.environ.get(
+                            "RABBITMQ_PUBLISHER_POOL_SIZE", DEFAULT_PUBLISHER_POOL_SIZE
+                        )
+                    )
+                )
+    return _PUBLISHER
+
+
+def close_publisher():
+    """This function closes the process-wide PublisherPool."""
+    global _PUBLISHER
+    with _PUBLISHER_LOCK:
+        if _PUBLISHER is not None:
+            _PUBLISHER.close()
+            _PUBLISHER = None
+
+
+def publish_job(document_id, reply_to, correlation_id, trace=None):
+    """This function publishes an analysis job for ml_client.py on a pooled channel.
+
+    A trace, if given, travels with the job in its headers.
+    """
+    get_publisher().publish(
+        ML_CLIENT_QUEUE,
+        document_id,
+        pika.BasicProperties(
+            reply_to=reply_to,
+            correlation_id=correlation_id,
+            delivery_mode=PERSISTENT_DELIVERY_MODE,
+            # The ML client measures queue wait from this; AMQP timestamps are whole seconds
+            headers=tracing.to_headers(trace, {"published_at": time.time()}),
+        ),
+    )
+
+
+def reply_error(headers):
+    """This function returns the error of a failure reply from its AMQP headers, or None."""
+    if not isinstance(headers, dict):
+        return None
+    error = headers.get(ERROR_HEADER)
+    if isinstance(error, bytes):
+        error = error.decode(errors="replace")
+    return error
+
+
+class ReplyConsumer:
+    """This class consumes ml_client.py replies on an exclusive queue in a background thread.
+
+    The exclusive queue is named by the broker and disappears with the connection,
+    so a reconnect yields a new queue name; replies addressed to the old one are lost.
+    """
+
+    def __init__(self, on_message_callback, host=RABBITMQ_HOST, retry_delay=5):
+        self.on_message_callback = on_message_callback
+        self.host = host
+        self.retry_delay = retry_delay
+        self.queue_name = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """This function starts the consumer thread unless it is already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="reply-consumer", daemon=True
+                )
+                self._thread.start()
+
+    def wait_ready(self, timeout=None):
+        """This function returns the reply queue name, or None if not ready in time."""
+        self.start()
+        if self._ready.wait(timeout):
+            return self.queue_name
+        return None
+
+    def _on_message(self, channel, method, properties, body):
+        """This function passes one reply to the callback, logging its errors.
+
+        A failing reply must not stop the thread: the web app would keep
+        handing out the name of a queue nobody consumes.
+        """
+        try:
+            self.on_message_callback(channel, method, properties, body)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logging.exception(
+                "Reply callback failed",
+                extra={"correlation_id": getattr(properties, "correlation_id", None)},
+            )
+
+    def _run(self):
+        """This function consumes replies forever, reconnecting on broker failures."""
+        while True:
+            connection = None
+            try:
+                connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=self.host)
+                )
+                channel = connection.channel()
+                result = channel.queue_declare(queue="", exclusive=True)
+                self.queue_name = result.method.queue
+                channel.basic_consume(
+                    queue=self.queue_name,
+                    on_message_callback=self._on_message,
+                    auto_ack=True,
+                )
+                self._ready.set()
+                channel.start_consuming()
+            except pika.exceptions.AMQPError as error:
+                logging.warning("Reply consumer lost RabbitMQ connection: %s", error)
+            finally:
+                # Even if the thread dies, wait_ready() must not return this queue
+                self._ready.clear()
+                _close_quietly(connection)
+            time.sleep(self.retry_delay)
+
+
+def _close_quietly(connection):
+    """This function closes a connection that may already be closed or broken."""
+    try:
+        if connection is not None and connection.is_open:
+            connection.close()
+    except pika.exceptions.AMQPError:
+        pass
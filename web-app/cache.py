@@ -0,0 +1,57 @@
+"""
+This module provides a small thread-safe in-process LRU cache.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """This class keeps up to max_size entries, evicting the least recently used first.
+
+    With a ttl (seconds), entries also expire that long after they were stored.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """This function returns the cached value and marks it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """This function stores a value, evicting the oldest entries beyond max_size."""
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """This function removes an entry and returns its value if it has not expired."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            return default
+        return value
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
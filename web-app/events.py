@@ -0,0 +1,103 @@
+"""
+This module pushes analysis results to browsers as Server-Sent Events.
+
+The single background reply consumer publishes each result to a ResultHub,
+which fans it out to every request streaming that job.
+"""
+
+import json
+import queue
+import threading
+import time
+
+KEEPALIVE_INTERVAL = 15
+CHECK_INTERVAL = 1
+
+
+class ResultHub:
+    """This class hands job results from the reply consumer to waiting streams."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id):
+        """This function returns a queue that receives the next result of a job."""
+        subscription = queue.SimpleQueue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, job_id, subscription):
+        """This function stops delivering results of a job to a subscription."""
+        with self._lock:
+            subscriptions = self._subscribers.get(job_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[job_id]
+
+    def publish(self, job_id, message):
+        """This function delivers a result to all current subscribers of a job.
+
+        Returns the number of subscribers reached.
+        """
+        with self._lock:
+            subscriptions = self._subscribers.pop(job_id, set())
+        for subscription in subscriptions:
+            subscription.put(message)
+        return len(subscriptions)
+
+    def __len__(self):
+        with self._lock:
+            return sum(
+                len(subscriptions) for subscriptions in self._subscribers.values()
+            )
+
+
+def format_event(event, data):
+    """This function formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_result(
+    hub,
+    job_id,
+    subscription,
+    timeout,
+    *,
+    check=None,
+    check_interval=CHECK_INTERVAL,
+    keepalive_interval=KEEPALIVE_INTERVAL,
+):  # pylint: disable=too-many-arguments
+    """This function yields a "result" event as soon as the job's result arrives.
+
+    check, if given, is called every check_interval seconds and may return the
+    result message; it finds results whose reply reached another server process.
+    Comment lines keep idle connections open every keepalive_interval seconds; a
+    "timeout" event ends the stream after `timeout` seconds without a result.
+    """
+    try:
+        deadline = time.monotonic() + timeout
+        next_keepalive = time.monotonic() + keepalive_interval
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                yield format_event("timeout", {"job_id": job_id})
+                return
+            wait = min(deadline, next_keepalive) - now
+            if check is not None:
+                wait = min(wait, check_interval)
+            try:
+                message = subscription.get(timeout=wait)
+            except queue.Empty:
+                message = check() if check is not None else None
+            if message is not None:
+                yield format_event("result", message)
+                return
+            if time.monotonic() >= next_keepalive:
+                yield ": keepalive\n\n"
+                next_keepalive += keepalive_interval
+    finally:
+        hub.unsubscribe(job_id, subscription)
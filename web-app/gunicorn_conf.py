@@ -0,0 +1,58 @@
+"""
+This module configures gunicorn, the production server of the web app.
+
+    gunicorn --config gunicorn_conf.py main:app
+
+WEB_WORKERS worker processes (default one per CPU core) each run
+WEB_WORKER_CLASS: "gthread" with WEB_THREADS threads, or "gevent". Every open
+/events stream holds a gthread thread, so gevent suits many concurrent streams.
+"""
+
+# gunicorn reads its settings from these lowercase module variables
+# pylint: disable=invalid-name
+
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_WORKERS", 0)) or os.cpu_count() or 1
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WEB_THREADS", 8))
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", 1000))
+# Result streams stay open for up to RESULT_EVENT_TIMEOUT seconds
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.environ.get("WEB_PRELOAD", "0") == "1"
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    """This function opens per-worker MongoDB and RabbitMQ clients.
+
+    It runs in each worker after fork, once the gevent worker has monkey-patched.
+    """
+    import main  # pylint: disable=import-outside-toplevel
+
+    main.init_worker()
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """This function removes the metric files of a previous run before workers start."""
+    import metrics  # pylint: disable=import-outside-toplevel
+
+    metrics.clear_multiprocess_dir()
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """This function drops the live gauges of a worker that exited."""
+    import metrics  # pylint: disable=import-outside-toplevel
+
+    metrics.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """This function writes out the queued log records of a worker before it exits."""
+    import json_logging  # pylint: disable=import-outside-toplevel
+
+    json_logging.stop_logging()
@@ -0,0 +1,130 @@
+"""
+This module stores captured image bytes outside the Image documents.
+
+Image documents only reference the stored bytes: {"storage": <store name>,
+"image_ref": <reference>, "size": <bytes>}. Older documents that still carry
+the bytes in "image_data" remain readable.
+"""
+
+import hashlib
+import os
+import tempfile
+import gridfs
+from bson import ObjectId
+import mongo_pool
+
+CHUNK_SIZE = 255 * 1024  # GridFS default chunk size
+DEFAULT_STORE = "gridfs"
+DEFAULT_STORE_PATH = "/data/images"
+GRIDFS_BUCKET = "images"
+
+
+def read_into_buffer(stream, size):
+    """This function streams `size` bytes into one preallocated bytearray.
+
+    The result can go straight to np.frombuffer and cv2.imdecode without
+    joining chunks into an intermediate bytes object.
+    """
+    buffer = bytearray(size)
+    offset = 0
+    with memoryview(buffer) as view:
+        while offset < size:
+            chunk = stream.read(min(CHUNK_SIZE, size - offset))
+            if not chunk:
+                break
+            view[offset : offset + len(chunk)] = chunk
+            offset += len(chunk)
+    del buffer[offset:]
+    return buffer
+
+
+class GridFSImageStore:
+    """This class keeps images in the "images" GridFS bucket of the CAE database."""
+
+    name = "gridfs"
+
+    def __init__(self, db, bucket_name=GRIDFS_BUCKET):
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name)
+
+    def put(self, stream, filename="image.jpg"):
+        """This function streams a binary file object into GridFS; returns (ref, size)."""
+        file_id = ObjectId()
+        with self.bucket.open_upload_stream_with_id(file_id, filename) as grid_in:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                grid_in.write(chunk)
+        return str(file_id), grid_in.length
+
+    def read(self, ref):
+        """This function reads a stored image into a bytearray."""
+        grid_out = self.bucket.open_download_stream(ObjectId(ref))
+        try:
+            return read_into_buffer(grid_out, grid_out.length)
+        finally:
+            grid_out.close()
+
+    def delete(self, ref):
+        """This function deletes a stored image."""
+        self.bucket.delete(ObjectId(ref))
+
+
+class FileSystemImageStore:
+    """This class keeps images in a directory, named by the SHA-256 of their content.
+
+    Identical uploads therefore share one file.
+    """
+
+    name = "filesystem"
+
+    def __init__(self, root=DEFAULT_STORE_PATH):
+        self.root = root
+
+    def path(self, ref):
+        """This function returns the file path of a reference."""
+        return os.path.join(self.root, ref[:2], ref)
+
+    def put(self, stream, filename=None):  # pylint: disable=unused-argument
+        """This function streams a binary file object to disk; returns (ref, size)."""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, delete=False) as temp_file:
+            try:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.unlink(temp_file.name)
+                raise
+        ref = digest.hexdigest()
+        os.makedirs(os.path.dirname(self.path(ref)), exist_ok=True)
+        os.replace(temp_file.name, self.path(ref))
+        return ref, size
+
+    def read(self, ref):
+        """This function reads a stored image into a bytearray."""
+        with open(self.path(ref), "rb") as image_file:
+            return read_into_buffer(image_file, os.fstat(image_file.fileno()).st_size)
+
+    def delete(self, ref):
+        """This function deletes a stored image."""
+        os.unlink(self.path(ref))
+
+
+def get_image_store(name=None):
+    """This function returns the store called `name` (default: the IMAGE_STORE setting)."""
+    name = name or os.environ.get("IMAGE_STORE", DEFAULT_STORE)
+    if name == GridFSImageStore.name:
+        return GridFSImageStore(mongo_pool.get_db())
+    if name == FileSystemImageStore.name:
+        return FileSystemImageStore(
+            os.environ.get("IMAGE_STORE_PATH", DEFAULT_STORE_PATH)
+        )
+    raise ValueError(f"Unknown image store {name!r}")
+
+
+def load_image_data(document):
+    """This function returns the image bytes of an Image document as a buffer."""
+    if "image_ref" in document:
+        return get_image_store(document["storage"]).read(document["image_ref"])
+    return document.get("image_data")
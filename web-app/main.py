@@ -2,67 +2,83 @@
 This module initializes the main Flask web app.
 """
 
-# pylint: disable=global-statement
-
+import datetime
+import hashlib
 import os
 import logging
 import sys
-from flask import Flask, request, jsonify, render_template
-from pymongo import MongoClient
+import tempfile
+import time
+from flask import Flask, Request, Response, request, jsonify, render_template, url_for
 from dotenv import load_dotenv
-import pika
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+import broker
+import cache
+import events
+import image_store
+import json_logging
+import metrics
+import mongo_pool
+import tracing
 
 load_dotenv()
+json_logging.configure_logging("webapp")
 
-app = Flask(__name__, template_folder="templates")
-app.config["UPLOAD_FOLDER"] = "uploads"
-
-COUNTER = 0
-
+# Uploads up to this many bytes stay in memory; larger ones spool to a temporary file
+UPLOAD_SPOOL_SIZE = int(os.environ.get("UPLOAD_SPOOL_SIZE", 1024 * 1024))
 
-def generate_filename():
-    """This function generates unique file names for the temporarily stored images."""
-    global COUNTER
-    COUNTER += 1
-    return f"image_{COUNTER}.jpg"
 
+class CaptureRequest(Request):  # pylint: disable=too-few-public-methods
+    """This class keeps uploaded files in memory unless they exceed UPLOAD_SPOOL_SIZE."""
 
-def get_mongo_client():
-    """This function retrieves mongo client via mongo_uri."""
-    mongo_uri = "mongodb://mongodb:27017/"
-    # mongo_uri = "mongodb://localhost:27017/"
-    if not mongo_uri:
-        raise ValueError("MongoDB URI not found in environment variables.")
-    return MongoClient(mongo_uri)
+    def _get_file_stream(self, *args, **kwargs):  # pylint: disable=unused-argument
+        # An anonymous temporary file is removed as soon as the upload is closed
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE, mode="rb+")
 
 
-def get_db(client):
-    """This function retrieves main database for the program."""
-    db_name = "CAE"
-    return client[db_name]
+app = Flask(__name__, template_folder="templates")
+app.request_class = CaptureRequest
 
 
 # Connect to MongoDB
 try:
-    mongo_client = get_mongo_client()
-    db = get_db(mongo_client)
+    db = mongo_pool.get_db()
     image_collection = db["Image"]
     color_collection = db["Color"]
-    print("Connected to MongoDB successfully.")
+    logging.info("Connected to MongoDB successfully.")
 except ConnectionError as e:
-    print("Error connecting to MongoDB:", e)
+    logging.error("Error connecting to MongoDB: %s", e)
     sys.exit(1)  # Fix for R1722
 
 
+# How the capture page downscales and encodes frames before uploading them
+CAPTURE_FORMATS = ("image/jpeg", "image/webp")
+CAPTURE_PROFILE = {
+    "max_dimension": int(os.environ.get("CAPTURE_MAX_DIMENSION", 1024)),
+    "format": os.environ.get("CAPTURE_FORMAT", "image/jpeg"),
+    "quality": float(os.environ.get("CAPTURE_QUALITY", 0.85)),
+}
+if CAPTURE_PROFILE["format"] not in CAPTURE_FORMATS:
+    raise ValueError(f"CAPTURE_FORMAT must be one of {CAPTURE_FORMATS}")
+
+
 # Define routes and other Flask application logic below
 @app.route("/")
 def home():
     """This function renders the default index.html home page."""
-    return render_template("index.html")
+    return render_template("index.html", capture_profile=CAPTURE_PROFILE)
+
+
+@app.route("/capture/profile")
+def capture_profile():
+    """This function advertises the capture profile the page applies before uploading."""
+    return jsonify(CAPTURE_PROFILE)
 
 
 @app.route("/capture", methods=["POST"])
+@metrics.CAPTURES_IN_PROGRESS.track_inprogress()
 def capture():
     """This function handles image capture requests."""
     if "image" not in request.files:
@@ -72,69 +88,335 @@ def capture():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
-    # Generate a filename
-    filename = generate_filename()
-    image_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    print(image_path)
-
-    # Save the image to the uploads folder
-    file.save(image_path)
-
-    # Save image filename to database
-    document_id = save_image_to_db(image_path)
-
-    # Initialize the message broker connection
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host="rabbitmq"))
-    channel = connection.channel()
+    trace = tracing.new_trace()
+    # Identical bytes analysed before are answered from the stored result
+    content_hash, size = hash_upload(file.stream)
+    if size == 0:
+        file.close()
+        return jsonify({"error": "Empty image"}), 400
+    cached = find_cached_result(content_hash)
+    if cached is not None:
+        file.close()
+        return cached_result_response(*cached)
+
+    # Stream the upload straight into the image store, then drop the spooled copy
+    try:
+        document_id = save_image_to_db(file.stream, file.filename, content_hash)
+    finally:
+        file.close()
+    if document_id is None:
+        return jsonify({"error": "Failed to save image"}), 500
+    tracing.stamp(trace, "image_stored")
+    return dispatch_job(document_id, trace)
+
+
+def dispatch_job(document_id, trace=None):
+    """This function publishes the analysis job of a stored image and answers 202."""
+    # Publish the job with the image id as correlation id; the reply arrives
+    # asynchronously on this process's exclusive reply queue
+    reply_queue = REPLY_CONSUMER.wait_ready(timeout=REPLY_QUEUE_TIMEOUT)
+    if reply_queue is None:
+        return jsonify({"error": "Message broker unavailable"}), 503
+    tracing.stamp(trace, "published")
+    # Started before publishing, as the reply can arrive before publish_job returns
+    JOB_STARTS.put(document_id, time.monotonic())
+    try:
+        broker.publish_job(
+            document_id, reply_to=reply_queue, correlation_id=document_id, trace=trace
+        )
+    except broker.PublishError as error:
+        JOB_STARTS.pop(document_id)
+        logging.error(
+            "Error publishing analysis job: %s", error, extra={"job_id": document_id}
+        )
+        return jsonify({"error": "Message broker unavailable"}), 503
 
-    # Declare a queue for sending messages to ml_client.py
-    channel.queue_declare(queue="main")
+    response = jsonify(
+        message="Image saved to database and analysis triggered",
+        document_id=document_id,
+        job_id=document_id,
+    )
+    response.headers["Location"] = url_for("job_status", job_id=document_id)
+    return response, 202
+
+
+def hash_upload(stream):
+    """This function returns the BLAKE2b content hash and the size of an upload.
+
+    The stream is rewound afterwards.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    size = 0
+    for chunk in iter(lambda: stream.read(image_store.CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def find_cached_result(content_hash):
+    """This function returns (image id, color id) of an analysed upload with this hash.
+
+    The in-process cache is consulted first, then the content_hash index on Image.
+    Uploads still being analysed are not matched, nor are results that MongoDB
+    has since expired (see RETENTION_DAYS in init-mongo.js).
+    """
+    cached = RESULT_CACHE.get(content_hash)
+    if cached is not None:
+        if color_collection.find_one({"_id": ObjectId(cached[1])}, {"_id": 1}):
+            return cached
+        RESULT_CACHE.pop(content_hash)
+    image_ids = [
+        image["_id"]
+        for image in image_collection.find({"content_hash": content_hash}, {"_id": 1})
+    ]
+    if not image_ids:
+        return None
+    color = color_collection.find_one(
+        {"image_id": {"$in": image_ids}}, {"_id": 1, "image_id": 1}
+    )
+    if color is None:
+        return None
+    cached = (str(color["image_id"]), str(color["_id"]))
+    RESULT_CACHE.put(content_hash, cached)
+    return cached
+
+
+def cached_result_response(image_id, color_id):
+    """This function answers a duplicate upload with its finished job."""
+    record_job_result(image_id, color_id)
+    response = jsonify(
+        message="Identical image already analyzed",
+        document_id=image_id,
+        job_id=image_id,
+        color_id=color_id,
+    )
+    response.headers["Location"] = url_for("job_status", job_id=image_id)
+    return response, 200
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """This function reports whether the analysis job for an image has finished or failed."""
+    message = finished_job_message(job_id)
+    if message is None:
+        return jsonify(status="pending", job_id=job_id), 202
+    return jsonify(message), 200
+
+
+@app.route("/events/<job_id>")
+def job_events(job_id):
+    """This function streams the result of a job as a Server-Sent Event.
+
+    The event is sent the moment the reply consumer receives the result, or
+    immediately if the job has already finished.
+    """
+    # Subscribe before checking for a result so a reply in between is not missed
+    subscription = RESULT_HUB.subscribe(job_id)
+    message = finished_job_message(job_id)
+    if message is not None:
+        RESULT_HUB.publish(job_id, message)
+
+    # Replies reach the server process that published the job; others find the
+    # result in MongoDB
+    stream = events.stream_result(
+        RESULT_HUB,
+        job_id,
+        subscription,
+        timeout=RESULT_EVENT_TIMEOUT,
+        check=lambda: finished_job_message(job_id),
+    )
+    return Response(
+        stream,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # Declare a queue for receiving messages from ml_client.py
-    channel.queue_declare(queue="ml_client")
 
-    # Publish a message to the message broker
-    channel.basic_publish(exchange="", routing_key="ml_client", body=document_id)
+def finished_color_id(job_id):
+    """This function returns the color id of a finished job, or None while it is pending."""
+    color_id = JOB_RESULTS.get(job_id)
+    if color_id is None:
+        color = get_job_result(job_id)
+        color_id = None if color is None else str(color["_id"])
+    return color_id
 
-    # Define a callback function to process incoming messages
-    channel.basic_consume(queue="main", on_message_callback=callback, auto_ack=True)
 
-    # Start consuming messages from the queue
-    print("Waiting for messages...")
-    channel.start_consuming()
+def job_error(job_id):
+    """This function returns the error of a job the ML client gave up on, or None.
 
-    return (
-        jsonify(
-            message="Image saved to database and analysis triggered",
-            document_id=document_id,
-        ),
-        201,
+    Failures are stored on the Image document, so every server process sees them.
+    """
+    error = JOB_FAILURES.get(job_id)
+    if error is not None:
+        return error
+    try:
+        image_id = ObjectId(job_id)
+    except InvalidId:
+        return None
+    image = image_collection.find_one(
+        {"_id": image_id, "error": {"$exists": True}}, {"error": 1}
     )
+    if image is None:
+        return None
+    JOB_FAILURES.put(job_id, image["error"])
+    return image["error"]
+
+
+def finished_job_message(job_id):
+    """This function returns the status message of a finished or failed job, or None."""
+    color_id = finished_color_id(job_id)
+    if color_id is not None:
+        return job_done_message(job_id, color_id)
+    error = job_error(job_id)
+    return None if error is None else job_failed_message(job_id, error)
+
+
+def job_done_message(job_id, color_id):
+    """This function builds the status message of a finished job."""
+    return {"status": "done", "job_id": job_id, "color_id": color_id}
+
+
+def job_failed_message(job_id, error):
+    """This function builds the status message of a job the ML client gave up on."""
+    return {"status": "failed", "job_id": job_id, "error": error}
+
+
+@app.route("/results/<job_id>")
+def job_result(job_id):
+    """This function returns the color data of a job as JSON."""
+    color = get_job_result(job_id)
+    if color is not None:
+        return jsonify(status="done", job_id=job_id, color=color_to_json(color)), 200
+    error = job_error(job_id)
+    if error is not None:
+        return jsonify(job_failed_message(job_id, error)), 200
+    if not job_exists(job_id):
+        return jsonify(error="Unknown job", job_id=job_id), 404
+    return jsonify(status="pending", job_id=job_id), 202
+
+
+# Finished jobs (image id -> color id)
+JOB_RESULTS = cache.LRUCache(max_size=10000)
+# Jobs the ML client dead-lettered (image id -> error)
+JOB_FAILURES = cache.LRUCache(max_size=10000)
+# Analysed uploads (content hash -> (image id, color id))
+RESULT_CACHE = cache.LRUCache(
+    max_size=10000, ttl=float(os.environ.get("RESULT_CACHE_TTL", 300))
+)
+# Color documents of recent jobs (image id -> Color document)
+COLOR_CACHE = cache.LRUCache(
+    max_size=1000, ttl=float(os.environ.get("RESULT_CACHE_TTL", 300))
+)
+# Publish times of jobs awaiting their result (image id -> monotonic seconds)
+JOB_STARTS = cache.LRUCache(max_size=10000)
+REPLY_QUEUE_TIMEOUT = 5
+# Fields of Color documents the web app never reads (the stored histogram is
+# binary and only used by the ML client)
+COLOR_PROJECTION = {"histogram": 0}
+# Recent traced jobs summarized by /traces/slow
+TRACE_REPORT_SIZE = int(os.environ.get("TRACE_REPORT_SIZE", 500))
+# Streams of /events/<job_id> waiting for a reply
+RESULT_HUB = events.ResultHub()
+RESULT_EVENT_TIMEOUT = float(os.environ.get("RESULT_EVENT_TIMEOUT", 60))
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """This function exposes the web app's metrics in the Prometheus text format."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/traces/slow")
+def slow_stages():
+    """This function reports where recent jobs spent their time, slowest first."""
+    limit = max(1, min(request.args.get("limit", TRACE_REPORT_SIZE, type=int), 10000))
+    documents = (
+        color_collection.find(
+            {"trace.durations": {"$exists": True}}, {"image_id": 1, "trace": 1}
+        )
+        .sort("_id", -1)
+        .limit(limit)
+    )
+    traces = [
+        {**document["trace"], "job_id": str(document.get("image_id"))}
+        for document in documents
+    ]
+    return jsonify(tracing.stage_report(traces))
 
 
-COLOR_DATA = None
+@app.route("/color_display/<job_id>")
+def job_color_display(job_id):
+    """This function renders color_display.html with the color data of one job."""
+    return render_template("color_display.html", COLOR_DATA=get_job_result(job_id))
 
 
 @app.route("/color_display")
 def color_display():
-    """This function renders color_display.html with color data retrieved from database."""
-    return render_template("color_display.html", COLOR_DATA=COLOR_DATA)
+    """This function renders color_display.html with the most recent color data."""
+    latest = color_collection.find_one({}, COLOR_PROJECTION, sort=[("_id", -1)])
+    return render_template("color_display.html", COLOR_DATA=latest)
+
 
+def get_job_result(job_id):
+    """This function returns the Color document of a job, or None while it is pending.
 
-def save_image_to_db(image_path):
-    """This function saves the image data to the database."""
+    Job ids are Image ids; results are served from COLOR_CACHE when possible.
+    """
+    color = COLOR_CACHE.get(job_id)
+    if color is not None:
+        return color
     try:
-        with open(image_path, "rb") as image_file:
-            image_data = image_file.read()
-        data = {"image_data": image_data}
-        result = image_collection.insert_one(data)
+        image_id = ObjectId(job_id)
+    except InvalidId:
+        return None
+    color = color_collection.find_one({"image_id": image_id}, COLOR_PROJECTION)
+    if color is not None:
+        COLOR_CACHE.put(job_id, color)
+    return color
+
+
+def job_exists(job_id):
+    """This function tells whether a job id names a stored image."""
+    try:
+        image_id = ObjectId(job_id)
+    except InvalidId:
+        return False
+    return image_collection.find_one({"_id": image_id}, {"_id": 1}) is not None
+
+
+def color_to_json(color):
+    """This function converts a Color document into JSON-serializable data."""
+    return {
+        key: str(value) if isinstance(value, ObjectId) else value
+        for key, value in color.items()
+    }
+
+
+def save_image_to_db(image_file, filename="image.jpg", content_hash=None):
+    """This function streams an image file object into the image store and records it."""
+    try:
+        store = image_store.get_image_store()
+        with metrics.DB_WRITE_SECONDS.labels("image_store").time():
+            image_ref, size = store.put(image_file, filename)
+        metrics.UPLOAD_BYTES.observe(size)
+        data = {
+            "storage": store.name,
+            "image_ref": image_ref,
+            "size": size,
+            "created_at": datetime.datetime.now(datetime.timezone.utc),
+        }
+        if content_hash is not None:
+            data["content_hash"] = content_hash
+        with metrics.DB_WRITE_SECONDS.labels("image_insert").time():
+            result = image_collection.insert_one(data)
         document_id = str(result.inserted_id)
-        logging.debug("Image inserted into database with document ID: %s", document_id)
-        return document_id
-    except FileNotFoundError as file_not_found_error:
-        logging.error(
-            "Error inserting image into db: File not found - %s", file_not_found_error
+        logging.debug(
+            "Image inserted into database",
+            extra={"sampled": True, "document_id": document_id, "size": size},
         )
+        return document_id
     except IOError as io_error:
         logging.error("Error inserting image into db: I/O error - %s", io_error)
     return None
@@ -142,30 +424,97 @@ def save_image_to_db(image_path):
 
 def get_color_data_from_db(color_id):
     """This function retrieves color data from the MongoDB database."""
-    # Connect to MongoDB and fetch image data
-    mongo_uri = "mongodb://mongodb:27017/"
-    # mongo_uri = "mongodb://localhost:27017/"
-    if not mongo_uri:
-        raise EnvironmentError("MONGO_URI environment variable is not set.")
-    client = MongoClient(mongo_uri)
-    db_client = client["CAE"]
-    local_color_collection = db_client["Color"]
-
-    document = local_color_collection.find_one({"_id": ObjectId(color_id)})
+    document = color_collection.find_one({"_id": ObjectId(color_id)}, COLOR_PROJECTION)
     if document:
         return document
     return None
 
 
+def save_trace(color_id, trace):
+    """This function stores the finished trace of a job and returns the Color document."""
+    return color_collection.find_one_and_update(
+        {"_id": ObjectId(color_id)},
+        {"$set": {"trace": tracing.to_document(trace)}},
+        projection=COLOR_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
 def callback(channel, method, properties, body):  # pylint: disable=unused-argument
     """This function is called when a message is received from the queue."""
     color_id = body.decode()  # Decode the byte message to string
-    print("Received message:", color_id)
 
-    # Fetch image data from the database
-    global COLOR_DATA
-    COLOR_DATA = get_color_data_from_db(color_id)
+    error = broker.reply_error(properties.headers)
+    if properties.correlation_id and error is not None:
+        # The ML client dead-lettered the job; there is no Color document
+        record_job_failure(properties.correlation_id, error)
+    elif properties.correlation_id:
+        # Warm the result cache off the request path
+        trace = tracing.from_headers(properties.headers)
+        if trace is None:
+            color = get_color_data_from_db(color_id)
+        else:
+            tracing.stamp(trace, "reply_received")
+            color = save_trace(color_id, trace)
+        if color is not None:
+            COLOR_CACHE.put(properties.correlation_id, color)
+        record_job_result(properties.correlation_id, color_id)
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(
+                "Job finished",
+                extra={
+                    "sampled": True,
+                    "job_id": properties.correlation_id,
+                    "color_id": color_id,
+                    **tracing.log_fields(trace),
+                },
+            )
+
+
+def record_job_failure(job_id, error):
+    """This function stores that a job failed and pushes the failure to streams."""
+    JOB_FAILURES.put(job_id, error)
+    JOB_STARTS.pop(job_id)
+    logging.warning("Job failed: %s", error, extra={"job_id": job_id})
+    RESULT_HUB.publish(job_id, job_failed_message(job_id, error))
+    # Streams and polls served by other processes find the failure here
+    try:
+        image_collection.update_one(
+            {"_id": ObjectId(job_id)}, {"$set": {"error": error}}
+        )
+    except InvalidId:
+        pass
+
+
+def record_job_result(job_id, color_id):
+    """This function remembers the color id produced for a job and pushes it to streams."""
+    JOB_RESULTS.put(job_id, color_id)
+    started = JOB_STARTS.pop(job_id)
+    if started is not None:
+        metrics.JOB_SECONDS.observe(time.monotonic() - started)
+    RESULT_HUB.publish(job_id, job_done_message(job_id, color_id))
+
+
+REPLY_CONSUMER = broker.ReplyConsumer(callback)
+
+
+def init_worker():
+    """This function gives a forked server worker its own MongoDB and RabbitMQ clients.
+
+    Connections and the reply consumer thread must not be shared across fork;
+    gunicorn_conf.py calls this in every worker.
+    """
+    global db, image_collection, color_collection  # pylint: disable=global-statement
+    global REPLY_CONSUMER  # pylint: disable=global-statement
+    json_logging.configure_logging("webapp")
+    mongo_pool.close_mongo_client()
+    broker.close_publisher()
+    db = mongo_pool.get_db()
+    image_collection = db["Image"]
+    color_collection = db["Color"]
+    REPLY_CONSUMER = broker.ReplyConsumer(callback)
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5001)
+    # Development server; production runs gunicorn with gunicorn_conf.py
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", host="0.0.0.0", port=5001)
@@ -0,0 +1,74 @@
+"""
+This module defines the Prometheus metrics of the web app and renders them for /metrics.
+
+Metrics are recorded in process memory, or, when PROMETHEUS_MULTIPROC_DIR is
+set (as in the Docker image), in per-process files of that directory so that
+/metrics on any gunicorn worker reports the totals of all workers. Recording a
+value is a lock and a few additions; nothing is computed until a scrape.
+"""
+
+import glob
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+SIZE_BUCKETS = tuple(2**power * 1024 for power in range(4, 16, 2))  # 16 KiB..16 MiB
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+JOB_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+UPLOAD_BYTES = Histogram(
+    "webapp_upload_bytes", "Size of uploaded captures in bytes", buckets=SIZE_BUCKETS
+)
+DB_WRITE_SECONDS = Histogram(
+    "webapp_db_write_seconds",
+    "Time spent storing captures",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+JOB_SECONDS = Histogram(
+    "webapp_job_seconds",
+    "Time from publishing an analysis job to receiving its result",
+    buckets=JOB_BUCKETS,
+)
+CAPTURES_IN_PROGRESS = Gauge(
+    "webapp_captures_in_progress",
+    "Capture requests being handled",
+    multiprocess_mode="livesum",
+)
+
+
+def get_registry():
+    """This function returns the registry to scrape, aggregating worker files if any."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render():
+    """This function returns (body, content type) of the Prometheus text format."""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def clear_multiprocess_dir():
+    """This function removes the metric files of earlier runs before workers start."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path is None:
+        return
+    os.makedirs(path, exist_ok=True)
+    for filename in glob.glob(os.path.join(path, "*.db")):
+        os.unlink(filename)
+
+
+def mark_process_dead(pid):
+    """This function drops the live gauges of a worker process that exited."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
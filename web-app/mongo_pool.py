@@ -0,0 +1,47 @@
+"""
+This module provides the process-wide pooled MongoDB client.
+"""
+
+# pylint: disable=global-statement
+
+import os
+import threading
+from pymongo import MongoClient
+
+DEFAULT_MONGODB_URI = "mongodb://mongodb:27017/"
+DEFAULT_MAX_POOL_SIZE = 100
+DB_NAME = "CAE"
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_mongo_client():
+    """This function returns the shared MongoClient, creating it on first use.
+
+    MONGODB_URI and MONGODB_MAX_POOL_SIZE are read from the environment.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                mongo_uri = os.environ.get("MONGODB_URI", DEFAULT_MONGODB_URI)
+                max_pool_size = int(
+                    os.environ.get("MONGODB_MAX_POOL_SIZE", DEFAULT_MAX_POOL_SIZE)
+                )
+                _CLIENT = MongoClient(mongo_uri, maxPoolSize=max_pool_size)
+    return _CLIENT
+
+
+def get_db():
+    """This function retrieves the main database for the program from the shared client."""
+    return get_mongo_client()[DB_NAME]
+
+
+def close_mongo_client():
+    """This function closes the shared client so the next call opens a fresh pool."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+            _CLIENT = None
@@ -0,0 +1,217 @@
+"""
+This module initializes the pytest test cases for broker.py messaging.
+"""
+
+import threading
+import time
+from unittest.mock import ANY, patch, MagicMock
+import pika
+import pytest
+import broker
+
+
+def test_publish_job():
+    """This function tests that jobs are published with reply_to and correlation_id."""
+    with patch("broker.pika.BlockingConnection") as mock_bc, patch(
+        "broker._PUBLISHER", broker.PublisherPool()
+    ):
+        mock_channel = mock_bc.return_value.channel.return_value
+        broker.publish_job("doc_id", reply_to="reply_queue", correlation_id="doc_id")
+
+    _, kwargs = mock_channel.basic_publish.call_args
+    assert kwargs["routing_key"] == "ml_client"
+    assert kwargs["body"] == "doc_id"
+    assert kwargs["properties"].reply_to == "reply_queue"
+    assert kwargs["properties"].correlation_id == "doc_id"
+    assert kwargs["properties"].delivery_mode == 2
+    assert isinstance(kwargs["properties"].headers["published_at"], float)
+
+
+def test_publisher_pool_reuses_channel_and_declares_once():
+    """This function tests that consecutive publishes share one connection and declaration."""
+    pool = broker.PublisherPool(size=2)
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_channel = mock_bc.return_value.channel.return_value
+        for _ in range(3):
+            pool.publish("ml_client", "doc_id")
+        pool.close()
+
+    mock_bc.assert_called_once()
+    mock_channel.queue_declare.assert_called_once_with(
+        queue="ml_client",
+        durable=True,
+        arguments={"x-dead-letter-exchange": "ml_client.dlx"},
+    )
+    mock_channel.confirm_delivery.assert_called_once()
+    assert mock_channel.basic_publish.call_count == 3
+    mock_bc.return_value.close.assert_called_once()
+
+
+def test_publisher_pool_limits_concurrent_channels():
+    """This function tests that threads beyond the pool size wait for a free channel."""
+    pool = broker.PublisherPool(size=2)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_publish(**kwargs):  # pylint: disable=unused-argument
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.pop()
+
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_bc.return_value.channel.return_value.basic_publish.side_effect = (
+            slow_publish
+        )
+        threads = [
+            threading.Thread(target=pool.publish, args=("ml_client", "doc_id"))
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert max(peak) <= 2
+    assert len(peak) == 6
+    assert mock_bc.call_count <= 2
+
+
+def test_publisher_pool_reconnects_after_failure():
+    """This function tests that a failed channel is replaced and the publish retried."""
+    pool = broker.PublisherPool()
+    broken = MagicMock()
+    broken.channel.return_value.basic_publish.side_effect = (
+        pika.exceptions.StreamLostError()
+    )
+    healthy = MagicMock()
+    with patch("broker.pika.BlockingConnection", side_effect=[broken, healthy]):
+        pool.publish("ml_client", "doc_id")
+
+    broken.close.assert_called_once()
+    healthy.channel.return_value.basic_publish.assert_called_once()
+
+
+def test_publisher_pool_raises_when_broker_unreachable():
+    """This function tests that PublishError is raised once all attempts fail."""
+    pool = broker.PublisherPool()
+    with patch(
+        "broker.pika.BlockingConnection",
+        side_effect=pika.exceptions.AMQPConnectionError(),
+    ) as mock_bc:
+        with pytest.raises(broker.PublishError):
+            pool.publish("ml_client", "doc_id")
+    assert mock_bc.call_count == broker.PUBLISH_ATTEMPTS
+
+
+def test_publisher_pool_times_out_when_all_channels_are_busy():
+    """This function tests that a publish gives up when no channel frees up in time."""
+    pool = broker.PublisherPool(size=1, acquire_timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def held_publish(**kwargs):  # pylint: disable=unused-argument
+        started.set()
+        release.wait(5)
+
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_bc.return_value.channel.return_value.basic_publish.side_effect = (
+            held_publish
+        )
+        holder = threading.Thread(target=pool.publish, args=("ml_client", "doc_a"))
+        holder.start()
+        started.wait(5)
+        with pytest.raises(broker.PublishError):
+            pool.publish("ml_client", "doc_b")
+        release.set()
+        holder.join()
+
+
+def test_publisher_pool_wakes_waiters_when_channels_fail():
+    """This function tests that a discarded channel frees its slot for a waiting publish."""
+    pool = broker.PublisherPool(size=1, acquire_timeout=30)
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def failing_publish(**kwargs):  # pylint: disable=unused-argument
+        started.set()
+        release.wait(5)
+        raise pika.exceptions.StreamLostError()
+
+    def publish(document_id):
+        try:
+            pool.publish("ml_client", document_id)
+        except broker.PublishError as error:
+            errors.append(error)
+
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_bc.return_value.channel.return_value.basic_publish.side_effect = (
+            failing_publish
+        )
+        threads = [threading.Thread(target=publish, args=("doc_a",))]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=publish, args=("doc_b",)))
+        threads[1].start()
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(errors) == 2
+
+
+def test_reply_consumer_declares_exclusive_queue():
+    """This function tests that the reply consumer reports its exclusive queue name."""
+    on_message = MagicMock()
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_channel = mock_bc.return_value.channel.return_value
+        mock_channel.queue_declare.return_value.method.queue = "amq.gen-reply"
+        # Park the consumer thread inside start_consuming until the test is done
+        mock_channel.start_consuming.side_effect = threading.Event().wait
+        consumer = broker.ReplyConsumer(on_message)
+        assert consumer.wait_ready(timeout=5) == "amq.gen-reply"
+
+    mock_channel.queue_declare.assert_called_with(queue="", exclusive=True)
+    mock_channel.basic_consume.assert_called_with(
+        queue="amq.gen-reply", on_message_callback=ANY, auto_ack=True
+    )
+
+
+def test_reply_consumer_survives_callback_errors():
+    """This function tests that a failing reply is logged instead of stopping the thread."""
+    on_message = MagicMock(side_effect=[ValueError("bad reply"), None])
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_channel = mock_bc.return_value.channel.return_value
+        mock_channel.start_consuming.side_effect = threading.Event().wait
+        broker.ReplyConsumer(on_message).wait_ready(timeout=5)
+
+    consume = mock_channel.basic_consume.call_args.kwargs["on_message_callback"]
+    properties = MagicMock(correlation_id="job_id")
+    consume(MagicMock(), MagicMock(), properties, b"bad")
+    consume(MagicMock(), MagicMock(), properties, b"good")
+    assert on_message.call_count == 2
+
+
+def test_reply_consumer_cleans_up_when_thread_dies():
+    """This function tests that an unexpected error clears readiness and closes the connection."""
+    with patch("broker.pika.BlockingConnection") as mock_bc:
+        mock_bc.return_value.is_open = True
+        mock_channel = mock_bc.return_value.channel.return_value
+        mock_channel.start_consuming.side_effect = RuntimeError("boom")
+        consumer = broker.ReplyConsumer(MagicMock())
+        with pytest.raises(RuntimeError):
+            consumer._run()  # pylint: disable=protected-access
+
+    assert not consumer._ready.is_set()  # pylint: disable=protected-access
+    mock_bc.return_value.close.assert_called_once()
+
+
+def test_reply_error():
+    """This function tests reading the error of a failure reply from its headers."""
+    assert broker.reply_error({"error": "bad image"}) == "bad image"
+    assert broker.reply_error({"error": b"bad image"}) == "bad image"
+    assert broker.reply_error({"trace": {}}) is None
+    assert broker.reply_error(None) is None
@@ -0,0 +1,49 @@
+"""
+This module initializes the pytest test cases for cache.py.
+"""
+
+from unittest.mock import patch
+import cache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """This function tests that reads refresh entries and the oldest one is evicted."""
+    lru = cache.LRUCache(max_size=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_lru_cache_default():
+    """This function tests the default returned for missing keys."""
+    assert cache.LRUCache(max_size=1).get("missing", "default") == "default"
+
+
+def test_lru_cache_ttl():
+    """This function tests that entries expire ttl seconds after they are stored."""
+    lru = cache.LRUCache(max_size=2, ttl=60)
+    with patch("cache.time.monotonic", return_value=100.0):
+        lru.put("a", 1)
+    with patch("cache.time.monotonic", return_value=159.0):
+        assert lru.get("a") == 1
+    with patch("cache.time.monotonic", return_value=160.0):
+        assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_lru_cache_pop():
+    """This function tests that pop removes an entry and ignores expired ones."""
+    lru = cache.LRUCache(max_size=2, ttl=60)
+    with patch("cache.time.monotonic", return_value=100.0):
+        lru.put("a", 1)
+        lru.put("b", 2)
+        assert lru.pop("a") == 1
+        assert lru.pop("a", "default") == "default"
+    with patch("cache.time.monotonic", return_value=160.0):
+        assert lru.pop("b") is None
+    assert len(lru) == 0
@@ -0,0 +1,67 @@
+"""
+This module initializes the pytest test cases for events.py.
+"""
+
+import json
+import threading
+import events
+
+
+def test_result_hub_fans_out_to_all_subscribers():
+    """This function tests that one published result reaches every subscriber once."""
+    hub = events.ResultHub()
+    first = hub.subscribe("job")
+    second = hub.subscribe("job")
+    other = hub.subscribe("other_job")
+    assert hub.publish("job", {"color_id": "c"}) == 2
+    assert first.get_nowait() == {"color_id": "c"}
+    assert second.get_nowait() == {"color_id": "c"}
+    assert other.empty()
+    assert hub.publish("job", {"color_id": "c"}) == 0
+    hub.unsubscribe("other_job", other)
+    assert len(hub) == 0
+
+
+def test_stream_result_yields_result_when_published():
+    """This function tests that a stream ends with the result published from another thread."""
+    hub = events.ResultHub()
+    subscription = hub.subscribe("job")
+    stream = events.stream_result(hub, "job", subscription, timeout=5)
+    threading.Timer(0.05, hub.publish, args=("job", {"status": "done"})).start()
+    chunks = list(stream)
+    assert chunks == ['event: result\ndata: {"status": "done"}\n\n']
+    assert len(hub) == 0
+
+
+def test_stream_result_keepalive_and_timeout():
+    """This function tests keepalive comments and the timeout event without a result."""
+    hub = events.ResultHub()
+    subscription = hub.subscribe("job")
+    chunks = list(
+        events.stream_result(
+            hub, "job", subscription, timeout=0.05, keepalive_interval=0.02
+        )
+    )
+    assert chunks[0] == ": keepalive\n\n"
+    event, data = chunks[-1].strip().split("\n")
+    assert event == "event: timeout"
+    assert json.loads(data[len("data: ") :]) == {"job_id": "job"}
+    assert len(hub) == 0
+
+
+def test_stream_result_finds_result_with_check():
+    """This function tests that a result delivered elsewhere is found by the check."""
+    hub = events.ResultHub()
+    subscription = hub.subscribe("job")
+    results = iter([None, {"status": "done"}])
+    chunks = list(
+        events.stream_result(
+            hub,
+            "job",
+            subscription,
+            timeout=5,
+            check=lambda: next(results),
+            check_interval=0.01,
+        )
+    )
+    assert chunks == ['event: result\ndata: {"status": "done"}\n\n']
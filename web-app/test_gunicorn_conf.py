@@ -0,0 +1,50 @@
+"""
+This module initializes the pytest test cases for gunicorn_conf.py.
+"""
+
+import importlib
+from unittest.mock import patch, MagicMock
+import gunicorn_conf
+
+
+def test_settings_from_environment(monkeypatch):
+    """This function tests that the server is configured from the environment."""
+    monkeypatch.setenv("WEB_WORKERS", "3")
+    monkeypatch.setenv("WEB_WORKER_CLASS", "gevent")
+    monkeypatch.setenv("WEB_THREADS", "4")
+    config = importlib.reload(gunicorn_conf)
+    assert config.workers == 3
+    assert config.worker_class == "gevent"
+    assert config.threads == 4
+    assert config.bind == "0.0.0.0:5001"
+    assert not config.preload_app
+
+    monkeypatch.delenv("WEB_WORKERS")
+    monkeypatch.delenv("WEB_WORKER_CLASS")
+    config = importlib.reload(gunicorn_conf)
+    assert config.workers >= 1
+    assert config.worker_class == "gthread"
+
+
+def test_post_worker_init_initializes_worker():
+    """This function tests that every forked worker gets its own clients."""
+    with patch("main.init_worker") as mock_init_worker:
+        gunicorn_conf.post_worker_init(MagicMock())
+    mock_init_worker.assert_called_once()
+
+
+def test_metrics_hooks():
+    """This function tests the hooks that maintain the multiprocess metric files."""
+    with patch("metrics.clear_multiprocess_dir") as mock_clear:
+        gunicorn_conf.on_starting(MagicMock())
+    mock_clear.assert_called_once()
+    with patch("metrics.mark_process_dead") as mock_mark_process_dead:
+        gunicorn_conf.child_exit(MagicMock(), MagicMock(pid=1234))
+    mock_mark_process_dead.assert_called_once_with(1234)
+
+
+def test_worker_exit_flushes_logs():
+    """This function tests that an exiting worker writes out its queued log records."""
+    with patch("json_logging.stop_logging") as mock_stop_logging:
+        gunicorn_conf.worker_exit(MagicMock(), MagicMock())
+    mock_stop_logging.assert_called_once()
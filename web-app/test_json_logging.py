@@ -0,0 +1,78 @@
+"""
+This module initializes the pytest test cases for json_logging.py.
+"""
+
+import json
+import logging
+import sys
+import json_logging
+
+
+def make_record(message="Message processed", args=(), level=logging.INFO, **fields):
+    """This function builds a log record carrying structured fields."""
+    record = logging.LogRecord("test", level, __file__, 1, message, args, None)
+    record.__dict__.update(fields)
+    return record
+
+
+def test_json_formatter_includes_fields():
+    """This function tests that extra fields become keys of the JSON line."""
+    formatter = json_logging.JsonFormatter("ml-client")
+    record = make_record(
+        "Rejecting message: %s", ("bad",), document_id="abc", sampled=True
+    )
+    entry = json.loads(formatter.format(record))
+    assert entry["message"] == "Rejecting message: bad"
+    assert entry["service"] == "ml-client"
+    assert entry["level"] == "INFO"
+    assert entry["document_id"] == "abc"
+    assert "sampled" not in entry and "args" not in entry
+
+
+def test_json_formatter_includes_exception():
+    """This function tests that exceptions are formatted into the line."""
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = make_record(level=logging.ERROR)
+        record.exc_info = sys.exc_info()
+    entry = json.loads(json_logging.JsonFormatter("webapp").format(record))
+    assert "ValueError: broken" in entry["exception"]
+
+
+def test_sampling_filter():
+    """This function tests that only sampled records are thinned out."""
+    assert json_logging.SamplingFilter(0.0).filter(make_record()) is True
+    assert json_logging.SamplingFilter(0.0).filter(make_record(sampled=True)) is False
+    assert json_logging.SamplingFilter(1.0).filter(make_record(sampled=True)) is True
+
+
+def test_queue_handler_leaves_records_unformatted():
+    """This function tests that formatting is left to the writer thread."""
+    record = make_record("%s", ("lazy",))
+    assert json_logging.QueueHandler(None).prepare(record) is record
+    assert record.args == ("lazy",)
+
+
+def test_configure_logging_writes_json_lines(capsys, monkeypatch):
+    """This function tests that log calls end up as JSON lines on stderr."""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    monkeypatch.setattr(json_logging, "_LISTENER", None)
+    try:
+        listener = json_logging.configure_logging("webapp", "DEBUG", sample_rate=0.0)
+        assert json_logging.configure_logging("webapp") is listener
+        logging.info("Worker %d started", 1, extra={"pid": 42})
+        logging.debug("Job finished", extra={"sampled": True})
+        json_logging.stop_logging()
+    finally:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+
+    lines = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert [(line["message"], line["pid"]) for line in lines] == [
+        ("Worker 1 started", 42)
+    ]
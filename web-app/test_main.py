@@ -4,8 +4,11 @@ This module initializes the pytest test cases for main.py web app.
 
 # pylint: disable=redefined-outer-name
 
-import tempfile
-from unittest.mock import patch, MagicMock
+import hashlib
+import io
+import logging
+import threading
+from unittest.mock import ANY, patch, MagicMock
 import pytest
 from bson import ObjectId
 from main import app, save_image_to_db, callback, image_collection
@@ -17,10 +20,6 @@ def test_client():
     """This function sets up a testing client."""
     app.config["TESTING"] = True
     test_client = app.test_client()
-
-    # Setup: Create a temporary directory for file uploads
-    with app.app_context():
-        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
     yield test_client
 
 
@@ -30,6 +29,18 @@ def test_home_route(test_client):
     assert response.status_code == 200
     assert b"Main Color Detector" in response.data
     assert b"Capture Image" in response.data
+    assert b'"max_dimension": 1024' in response.data
+
+
+def test_capture_profile(test_client):
+    """This function tests that the capture profile is advertised as JSON."""
+    response = test_client.get("/capture/profile")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "max_dimension": 1024,
+        "format": "image/jpeg",
+        "quality": 0.85,
+    }
 
 
 def test_capture_with_no_image_part():
@@ -64,21 +75,8 @@ def test_capture_with_no_selected_file():
         assert b"No selected file" in response.data
 
 
-@pytest.fixture
-def mock_mongo_client_fixture():
-    """This function starts a mock mongo client for testing."""
-    with patch("main.MongoClient") as mock_mongo_client:
-        yield mock_mongo_client
-
-
-@patch("main.MongoClient")
-def test_get_color_data_from_db(mock_mongo_client_fixture):
+def test_get_color_data_from_db():
     """This function tests if the program can get color data from db."""
-    # Mock the MongoDB collection object
-    mock_color_collection = MagicMock()
-    mock_mongo_client_fixture.return_value.__getitem__.return_value.__getitem__.return_value = (
-        mock_color_collection
-    )
     # Set up a mock document to be returned by find_one
     mock_document = {
         "_id": ObjectId("605a698c80b5eaf424b1bb78"),
@@ -86,13 +84,17 @@ def test_get_color_data_from_db(mock_mongo_client_fixture):
         "rgb": "(255, 0, 0)",
         "hex": "#FF0000",
     }
-    mock_color_collection.find_one.return_value = mock_document
+    with patch.object(
+        main.color_collection, "find_one", return_value=mock_document
+    ) as mock_find_one:
+        # Call the function with a mock color_id
+        result = main.get_color_data_from_db("605a698c80b5eaf424b1bb78")
 
-    # Call the function with a mock color_id
-    main.get_color_data_from_db("605a698c80b5eaf424b1bb78")
-
-    # Assert that MongoClient was called
-    assert mock_mongo_client_fixture.called
+    # Assert that the shared collection was queried by id, without the histogram
+    mock_find_one.assert_called_once_with(
+        {"_id": ObjectId("605a698c80b5eaf424b1bb78")}, {"histogram": 0}
+    )
+    assert result == mock_document
 
 
 @pytest.fixture
@@ -101,41 +103,81 @@ def mock_image_file_content_fixture():
     return b"Fake image data"
 
 
-def test_save_image_to_db(mock_image_file_content_fixture):
+def test_save_image_to_db(mock_image_file_content_fixture, tmp_path, monkeypatch):
     """This function tests if the image could be saved to db."""
-    image_path = "/path/to/image.jpg"
     document_id = "fake_document_id"
+    monkeypatch.setenv("IMAGE_STORE", "filesystem")
+    monkeypatch.setenv("IMAGE_STORE_PATH", str(tmp_path))
 
-    # Mocking the open function to return fake image data
-    with patch(
-        "builtins.open",
-        MagicMock(
-            return_value=MagicMock(
-                read=MagicMock(return_value=mock_image_file_content_fixture)
-            )
-        ),
-    ):
-        # Mocking the insert_one method of image_collection to return fake document ID
-        with patch.object(
-            image_collection,
-            "insert_one",
-            return_value=MagicMock(inserted_id=document_id),
-        ):
-            result = save_image_to_db(image_path)
+    # Mocking the insert_one method of image_collection to return fake document ID
+    with patch.object(
+        image_collection,
+        "insert_one",
+        return_value=MagicMock(inserted_id=document_id),
+    ) as mock_insert_one:
+        result = save_image_to_db(io.BytesIO(mock_image_file_content_fixture))
 
     # Assert that the result is equal to the fake document ID
     assert result == document_id
+    # Assert that the document references the stored bytes instead of holding them
+    (data,), _ = mock_insert_one.call_args
+    assert data.pop("created_at").tzinfo is not None
+    assert data == {
+        "storage": "filesystem",
+        "image_ref": hashlib.sha256(mock_image_file_content_fixture).hexdigest(),
+        "size": len(mock_image_file_content_fixture),
+    }
 
 
 def test_save_image_to_db_exception():
     """Test the previous function's exception handling."""
-    # Mock image file path
-    image_path = "/path/to/image.jpg"
-    # Mock image file open context manager to raise an exception
-    with patch("builtins.open", MagicMock(side_effect=Exception("Fake error"))):
-        # Call save_image_to_db function and assert that it raises an exception
-        with pytest.raises(Exception):
-            save_image_to_db(image_path)
+    # Mock an image stream that fails while being read
+    image_file = MagicMock()
+    image_file.read.side_effect = Exception("Fake error")
+    # Call save_image_to_db function and assert that it raises an exception
+    with pytest.raises(Exception):
+        save_image_to_db(image_file)
+
+
+def test_save_image_to_db_io_error():
+    """This function tests that I/O errors while storing the image are reported as None."""
+    with patch("main.image_store.get_image_store") as mock_get_image_store:
+        mock_get_image_store.return_value.put.side_effect = IOError("Fake error")
+        assert save_image_to_db(io.BytesIO(b"Fake image data")) is None
+
+
+def test_capture_streams_upload_without_temp_file(test_client, tmp_path, monkeypatch):
+    """This function tests that uploads go straight to the store and are then closed."""
+    monkeypatch.setattr(main, "UPLOAD_SPOOL_SIZE", 16)
+    stored = {}
+
+    def fake_save_image_to_db(image_file, filename, content_hash):
+        stored["data"] = image_file.read()
+        stored["filename"] = filename
+        stored["content_hash"] = content_hash
+        stored["file"] = image_file
+        return "fake_document_id"
+
+    monkeypatch.chdir(tmp_path)
+    with patch("main.find_cached_result", return_value=None), patch(
+        "main.save_image_to_db", side_effect=fake_save_image_to_db
+    ), patch.object(
+        main.REPLY_CONSUMER, "wait_ready", return_value="amq.gen-reply"
+    ), patch(
+        "main.broker.publish_job"
+    ):
+        response = test_client.post(
+            "/capture",
+            data={"image": (io.BytesIO(b"x" * 1000), "blob")},
+            content_type="multipart/form-data",
+        )
+
+    assert response.status_code == 202
+    assert stored["data"] == b"x" * 1000
+    assert stored["filename"] == "blob"
+    assert stored["content_hash"] == main.hash_upload(io.BytesIO(b"x" * 1000))[0]
+    assert stored["file"].closed
+    assert not list(tmp_path.iterdir())
 
 
 def test_callback_with_valid_color_id():
@@ -149,3 +191,421 @@ def test_callback_with_valid_color_id():
         callback(mock_channel, mock_method, mock_properties, mock_body)
         mock_body.decode.assert_called_once()
         mock_get_color_data_from_db.assert_called_once_with("fake_color_id")
+
+
+def test_capture_publishes_job_and_returns_accepted(test_client):
+    """This function tests that capture publishes a correlated job without blocking."""
+    with patch("main.find_cached_result", return_value=None), patch(
+        "main.save_image_to_db", return_value="fake_document_id"
+    ), patch.object(
+        main.REPLY_CONSUMER, "wait_ready", return_value="amq.gen-reply"
+    ), patch(
+        "main.broker.publish_job"
+    ) as mock_publish_job:
+        response = test_client.post(
+            "/capture",
+            data={"image": (io.BytesIO(b"Fake image data"), "image.jpg")},
+            content_type="multipart/form-data",
+        )
+    assert response.status_code == 202
+    assert response.get_json()["job_id"] == "fake_document_id"
+    assert response.headers["Location"].endswith("/jobs/fake_document_id")
+    mock_publish_job.assert_called_once_with(
+        "fake_document_id",
+        reply_to="amq.gen-reply",
+        correlation_id="fake_document_id",
+        trace=ANY,
+    )
+    trace = mock_publish_job.call_args.kwargs["trace"]
+    assert list(trace["timestamps"]) == ["received", "image_stored", "published"]
+
+
+def test_capture_without_broker(test_client):
+    """This function tests that capture fails fast when no reply queue is available."""
+    with patch("main.find_cached_result", return_value=None), patch(
+        "main.save_image_to_db", return_value="fake_document_id"
+    ), patch.object(main.REPLY_CONSUMER, "wait_ready", return_value=None):
+        response = test_client.post(
+            "/capture",
+            data={"image": (io.BytesIO(b"Fake image data"), "image.jpg")},
+            content_type="multipart/form-data",
+        )
+    assert response.status_code == 503
+
+
+def test_job_status(test_client):
+    """This function tests the job status route before and after the reply arrives."""
+    response = test_client.get("/jobs/pending_job_id")
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "pending"
+
+    mock_properties = MagicMock(correlation_id="done_job_id")
+    with patch("main.get_color_data_from_db"):
+        callback(MagicMock(), MagicMock(), mock_properties, b"fake_color_id")
+    response = test_client.get("/jobs/done_job_id")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "status": "done",
+        "job_id": "done_job_id",
+        "color_id": "fake_color_id",
+    }
+
+
+def test_color_display_renders_palette(test_client):
+    """This function tests that the full palette is rendered with pixel shares."""
+    color_data = {
+        "rgb": [128, 0, 128],
+        "hex": "#800080",
+        "name": "purple",
+        "palette": [
+            {"rgb": [255, 0, 0], "hex": "#ff0000", "name": "red", "share": 0.75},
+            {"rgb": [0, 0, 255], "hex": "#0000ff", "name": "blue", "share": 0.25},
+        ],
+    }
+    main.COLOR_CACHE.put("palette_job_id", color_data)
+    response = test_client.get("/color_display/palette_job_id")
+    assert response.status_code == 200
+    assert b"#ff0000" in response.data
+    assert b"75.0%" in response.data
+    assert b"25.0%" in response.data
+
+
+def test_hash_upload_rewinds_stream():
+    """This function tests that hashing leaves the upload ready to be stored."""
+    stream = io.BytesIO(b"Fake image data")
+    assert main.hash_upload(stream) == (
+        hashlib.blake2b(b"Fake image data", digest_size=20).hexdigest(),
+        len(b"Fake image data"),
+    )
+    assert stream.read() == b"Fake image data"
+
+
+def test_capture_rejects_empty_upload(test_client):
+    """This function tests that a zero-byte upload is neither stored nor published."""
+    with patch("main.save_image_to_db") as mock_save_image_to_db, patch(
+        "main.broker.publish_job"
+    ) as mock_publish_job:
+        response = test_client.post(
+            "/capture",
+            data={"image": (io.BytesIO(b""), "blob")},
+            content_type="multipart/form-data",
+        )
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Empty image"}
+    mock_save_image_to_db.assert_not_called()
+    mock_publish_job.assert_not_called()
+
+
+def test_find_cached_result():
+    """This function tests the Mongo lookup by content hash and the in-process cache."""
+    image_id, color_id = ObjectId(), ObjectId()
+    with patch.object(
+        image_collection, "find", return_value=[{"_id": image_id}]
+    ), patch.object(
+        main.color_collection,
+        "find_one",
+        return_value={"_id": color_id, "image_id": image_id},
+    ) as mock_find_one:
+        assert main.find_cached_result("hash-a") == (str(image_id), str(color_id))
+        assert main.find_cached_result("hash-a") == (str(image_id), str(color_id))
+    # A cache hit only checks that the Color document still exists
+    assert [call.args for call in mock_find_one.call_args_list] == [
+        ({"image_id": {"$in": [image_id]}}, {"_id": 1, "image_id": 1}),
+        ({"_id": color_id}, {"_id": 1}),
+    ]
+
+    # Results that MongoDB has expired are dropped from the cache
+    with patch.object(image_collection, "find", return_value=[]), patch.object(
+        main.color_collection, "find_one", return_value=None
+    ):
+        assert main.find_cached_result("hash-a") is None
+    assert main.RESULT_CACHE.get("hash-a") is None
+
+    # Uploads that are unknown or still being analysed are not matched
+    with patch.object(image_collection, "find", return_value=[]):
+        assert main.find_cached_result("hash-b") is None
+    with patch.object(
+        image_collection, "find", return_value=[{"_id": image_id}]
+    ), patch.object(main.color_collection, "find_one", return_value=None):
+        assert main.find_cached_result("hash-c") is None
+
+
+def test_capture_duplicate_upload_skips_analysis(test_client):
+    """This function tests that a known upload is answered without storing or publishing."""
+    data = b"Same bytes as before"
+    color_id = str(ObjectId())
+    main.RESULT_CACHE.put(
+        hashlib.blake2b(data, digest_size=20).hexdigest(), ("image_id", color_id)
+    )
+    with patch("main.save_image_to_db") as mock_save_image_to_db, patch(
+        "main.broker.publish_job"
+    ) as mock_publish_job, patch("main.get_color_data_from_db"), patch.object(
+        main.color_collection, "find_one", return_value={"_id": color_id}
+    ):
+        response = test_client.post(
+            "/capture",
+            data={"image": (io.BytesIO(data), "blob")},
+            content_type="multipart/form-data",
+        )
+
+    assert response.status_code == 200
+    assert response.get_json()["color_id"] == color_id
+    mock_save_image_to_db.assert_not_called()
+    mock_publish_job.assert_not_called()
+    assert test_client.get("/jobs/image_id").get_json()["status"] == "done"
+
+
+def test_results_returns_job_color_data(test_client):
+    """This function tests that /results serves the Color document of one job."""
+    image_id = ObjectId()
+    color = {"_id": ObjectId(), "image_id": image_id, "hex": "#800080"}
+    with patch.object(main.color_collection, "find_one", return_value=color) as find:
+        response = test_client.get(f"/results/{image_id}")
+        test_client.get(f"/results/{image_id}")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "status": "done",
+        "job_id": str(image_id),
+        "color": {
+            "_id": str(color["_id"]),
+            "image_id": str(image_id),
+            "hex": "#800080",
+        },
+    }
+    # The second request is answered from the result cache
+    find.assert_called_once_with({"image_id": image_id}, {"histogram": 0})
+
+
+def test_results_pending_and_unknown(test_client):
+    """This function tests /results for unfinished and unknown jobs."""
+    image_id = str(ObjectId())
+    with patch.object(
+        main.color_collection, "find_one", return_value=None
+    ), patch.object(main.image_collection, "find_one", return_value=None), patch(
+        "main.job_exists", return_value=True
+    ):
+        response = test_client.get(f"/results/{image_id}")
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "pending"
+
+    response = test_client.get("/results/not-an-object-id")
+    assert response.status_code == 404
+
+
+def test_callback_caches_job_color_data():
+    """This function tests that a reply stores the job's Color document in the cache."""
+    color = {"_id": ObjectId(), "hex": "#000000"}
+    mock_properties = MagicMock(correlation_id="cached_job_id")
+    with patch("main.get_color_data_from_db", return_value=color):
+        callback(MagicMock(), MagicMock(), mock_properties, b"fake_color_id")
+    assert main.get_job_result("cached_job_id") is color
+
+
+def test_job_events_pushes_reply(test_client):
+    """This function tests that /events streams the reply as soon as it arrives."""
+    mock_properties = MagicMock(correlation_id="streamed_job_id")
+
+    def reply():
+        with patch("main.get_color_data_from_db", return_value=None):
+            callback(MagicMock(), MagicMock(), mock_properties, b"fake_color_id")
+
+    with patch("main.get_job_result", return_value=None):
+        threading.Timer(0.2, reply).start()
+        response = test_client.get("/events/streamed_job_id")
+        body = response.get_data(as_text=True)
+    assert response.mimetype == "text/event-stream"
+    assert body.startswith("event: result\n")
+    assert '"color_id": "fake_color_id"' in body
+
+
+def test_job_events_for_finished_job(test_client):
+    """This function tests that /events answers a finished job immediately."""
+    main.record_job_result("finished_job_id", "fake_color_id")
+    response = test_client.get("/events/finished_job_id")
+    assert response.get_data(as_text=True) == (
+        "event: result\n"
+        'data: {"status": "done", "job_id": "finished_job_id", '
+        '"color_id": "fake_color_id"}\n\n'
+    )
+
+
+def test_failure_reply_marks_job_failed(test_client):
+    """This function tests that /jobs, /results and /events report a dead-lettered job."""
+    job_id = str(ObjectId())
+    properties = MagicMock(correlation_id=job_id, headers={"error": "bad image"})
+    with patch("main.get_color_data_from_db") as mock_get_color_data, patch.object(
+        main, "image_collection"
+    ) as mock_image_collection:
+        callback(MagicMock(), MagicMock(), properties, b"")
+    mock_get_color_data.assert_not_called()
+    mock_image_collection.update_one.assert_called_once_with(
+        {"_id": ObjectId(job_id)}, {"$set": {"error": "bad image"}}
+    )
+
+    failed = {"status": "failed", "job_id": job_id, "error": "bad image"}
+    with patch("main.get_job_result", return_value=None):
+        assert test_client.get(f"/jobs/{job_id}").get_json() == failed
+        assert test_client.get(f"/results/{job_id}").get_json() == failed
+        body = test_client.get(f"/events/{job_id}").get_data(as_text=True)
+    assert body.startswith("event: result\n")
+    assert '"status": "failed"' in body
+
+
+def test_failure_stored_by_another_process(test_client):
+    """This function tests that a failure recorded on the Image document is reported."""
+    job_id = str(ObjectId())
+    with patch("main.get_job_result", return_value=None), patch.object(
+        main, "image_collection"
+    ) as mock_image_collection:
+        mock_image_collection.find_one.return_value = {"error": "bad image"}
+        response = test_client.get(f"/jobs/{job_id}")
+
+    assert response.get_json() == {
+        "status": "failed",
+        "job_id": job_id,
+        "error": "bad image",
+    }
+    mock_image_collection.find_one.assert_called_once_with(
+        {"_id": ObjectId(job_id), "error": {"$exists": True}}, {"error": 1}
+    )
+
+
+def test_capture_when_publish_fails(test_client):
+    """This function tests that capture answers 503 when the job cannot be published."""
+    with patch("main.find_cached_result", return_value=None), patch(
+        "main.save_image_to_db", return_value="fake_document_id"
+    ), patch.object(
+        main.REPLY_CONSUMER, "wait_ready", return_value="amq.gen-reply"
+    ), patch(
+        "main.broker.publish_job", side_effect=main.broker.PublishError("down")
+    ):
+        response = test_client.post(
+            "/capture",
+            data={"image": (io.BytesIO(b"Fake image data"), "image.jpg")},
+            content_type="multipart/form-data",
+        )
+    assert response.status_code == 503
+    assert main.JOB_STARTS.get("fake_document_id") is None
+
+
+def test_dispatch_job_starts_timer_before_publishing():
+    """This function tests that a reply arriving during publish_job is still timed."""
+
+    def publish_job(document_id, **_):
+        assert main.JOB_STARTS.get(document_id) is not None
+
+    with main.app.test_request_context(), patch.object(
+        main.REPLY_CONSUMER, "wait_ready", return_value="amq.gen-reply"
+    ), patch("main.broker.publish_job", side_effect=publish_job):
+        _, status = main.dispatch_job("early_job_id")
+    assert status == 202
+    assert main.JOB_STARTS.pop("early_job_id") is not None
+
+
+def test_init_worker_replaces_clients():
+    """This function tests that a forked worker opens fresh clients and reply consumer."""
+    old_consumer = main.REPLY_CONSUMER
+    with patch("main.mongo_pool") as mock_mongo_pool, patch(
+        "main.broker.close_publisher"
+    ) as mock_close_publisher:
+        main.init_worker()
+        assert main.image_collection is mock_mongo_pool.get_db.return_value["Image"]
+    mock_mongo_pool.close_mongo_client.assert_called_once()
+    mock_close_publisher.assert_called_once()
+    assert main.REPLY_CONSUMER is not old_consumer
+    main.init_worker()  # back to real clients for the other tests
+
+
+def test_metrics_endpoint(test_client, monkeypatch):
+    """This function tests that /metrics serves the Prometheus text format."""
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert b"webapp_job_seconds_count" in response.data
+
+
+def test_job_latency_is_observed_once():
+    """This function tests that a job's latency is recorded when its reply arrives."""
+    main.JOB_STARTS.put("timed_job_id", 0.0)
+    with patch("main.metrics.JOB_SECONDS") as mock_job_seconds:
+        main.record_job_result("timed_job_id", "color_id")
+        main.record_job_result("timed_job_id", "color_id")
+    mock_job_seconds.observe.assert_called_once()
+
+
+def test_callback_saves_finished_trace():
+    """This function tests that a traced reply completes the trace on the Color document."""
+    color_id = ObjectId()
+    trace = {"trace_id": "abc", "timestamps": {"analysed": 1.0, "color_stored": 1.5}}
+    properties = MagicMock(correlation_id="traced_job_id", headers={"trace": trace})
+    with patch.object(main, "color_collection") as mock_collection, patch(
+        "main.tracing.time.time", return_value=2.0
+    ):
+        mock_collection.find_one_and_update.return_value = {"_id": color_id}
+        callback(MagicMock(), MagicMock(), properties, str(color_id).encode())
+
+    query, update = mock_collection.find_one_and_update.call_args.args
+    assert query == {"_id": color_id}
+    assert update["$set"]["trace"]["durations"] == {"write_back": 0.5, "reply": 0.5}
+    assert mock_collection.find_one_and_update.call_args.kwargs["projection"] == {
+        "histogram": 0
+    }
+    assert main.get_job_result("traced_job_id") == {"_id": color_id}
+
+
+def test_slow_stages_report(test_client):
+    """This function tests the report of the slowest stages of recent jobs."""
+    image_id = ObjectId()
+    documents = [
+        {"image_id": image_id, "trace": {"trace_id": "a", "durations": {"queue": 2.0}}},
+        {"trace": {"trace_id": "b", "durations": {"queue": 1.0, "decode": 0.5}}},
+    ]
+    with patch.object(main, "color_collection") as mock_collection:
+        mock_collection.find.return_value.sort.return_value.limit.return_value = (
+            documents
+        )
+        response = test_client.get("/traces/slow?limit=2")
+
+    mock_collection.find.return_value.sort.return_value.limit.assert_called_once_with(2)
+    report = response.get_json()
+    assert report["traces"] == 2
+    assert report["stages"][0]["stage"] == "queue"
+    assert report["stages"][0]["max_ms"] == 2000
+    assert report["slowest"][0] == {
+        "trace_id": "a",
+        "job_id": str(image_id),
+        "total_ms": 2000,
+        "slowest_stage": "queue",
+        "slowest_stage_ms": 2000,
+    }
+
+
+def test_slow_stages_limit_is_clamped(test_client):
+    """This function tests that ?limit= stays between 1 and 10000 documents."""
+    with patch.object(main, "color_collection") as mock_collection:
+        mock_collection.find.return_value.sort.return_value.limit.return_value = []
+        for limit in ("0", "-5", "1000000"):
+            test_client.get(f"/traces/slow?limit={limit}")
+
+    limit_calls = (
+        mock_collection.find.return_value.sort.return_value.limit.call_args_list
+    )
+    assert [call.args for call in limit_calls] == [(1,), (1,), (10000,)]
+
+
+def test_callback_logs_stage_durations(caplog):
+    """This function tests that finished jobs are logged with their stage durations."""
+    trace = {"trace_id": "abc", "timestamps": {"color_stored": 1.0}}
+    properties = MagicMock(correlation_id="logged_job_id", headers={"trace": trace})
+    caplog.set_level(logging.DEBUG)
+    with patch.object(main, "color_collection"), patch(
+        "main.tracing.time.time", return_value=1.5
+    ):
+        callback(MagicMock(), MagicMock(), properties, str(ObjectId()).encode())
+
+    (record,) = [record for record in caplog.records if record.msg == "Job finished"]
+    assert record.job_id == "logged_job_id"
+    assert record.reply_ms == 500
+    assert record.sampled
@@ -0,0 +1,40 @@
+"""
+This module initializes the pytest test cases for metrics.py.
+"""
+
+import metrics
+
+
+def test_render_exposes_metrics(monkeypatch):
+    """This function tests that render returns every metric in the text format."""
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    metrics.UPLOAD_BYTES.observe(2048)
+    body, content_type = metrics.render()
+    assert content_type.startswith("text/plain")
+    for name in (
+        "webapp_upload_bytes_bucket",
+        "webapp_db_write_seconds",
+        "webapp_job_seconds",
+        "webapp_captures_in_progress",
+    ):
+        assert name.encode() in body
+
+
+def test_multiprocess_registry(tmp_path, monkeypatch):
+    """This function tests that worker files are aggregated when a directory is set."""
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    assert metrics.get_registry() is not metrics.REGISTRY
+    metrics.mark_process_dead(1234)
+
+
+def test_clear_multiprocess_dir(tmp_path, monkeypatch):
+    """This function tests that metric files of earlier runs are removed."""
+    (tmp_path / "histogram_1.db").write_bytes(b"")
+    (tmp_path / "keep.txt").write_bytes(b"")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    metrics.clear_multiprocess_dir()
+    assert [path.name for path in tmp_path.iterdir()] == ["keep.txt"]
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "new"))
+    metrics.clear_multiprocess_dir()
+    assert (tmp_path / "new").is_dir()